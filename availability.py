@@ -0,0 +1,240 @@
+import datetime
+import itertools
+import re
+
+_WEEKDAY_SUFFIX = re.compile(r"\s*\(.*\)$")
+
+
+def parse_slot_datetime(date_str: str, time_str: str) -> datetime.datetime:
+    """Parse date and time strings into datetime. Strips weekday notes like '(сб)'.
+    Expected date format: 'DD.MM.YYYY' possibly with trailing '(...')
+    Expected time format: 'HH:MM' or similar; if time contains extra text, take first 5 chars.
+    """
+    # remove parenthesis with weekday e.g. '11.10.2025(сб)' -> '11.10.2025'
+    d = _WEEKDAY_SUFFIX.sub("", date_str).strip()
+    t = time_str.strip()[:5]
+    return datetime.datetime.strptime(f"{d} {t}", "%d.%m.%Y %H:%M")
+
+
+# поколения индексов уникальны на весь процесс: версия шарда, перечитанного после выгрузки, не совпадёт со старой
+_generations = itertools.count(1)
+
+
+def _try_parse(date_str, time_str):
+    try:
+        return parse_slot_datetime(date_str, time_str)
+    except (ValueError, AttributeError):
+        return None
+
+
+class AvailabilityIndex:
+    """Индекс свободных слотов по направлениям.
+
+    Для каждого направления хранит свободные даты и свободные времена на дату,
+    а для каждой пары (дата, время) — заранее разобранный datetime. Индекс
+    строится один раз по сетке slots['slots'] и дальше обновляется точечно через
+    mark_free()/mark_taken(), так что клавиатуры с датами и временем строятся
+    без обхода всей сетки и без повторного strptime.
+
+    С заданными отсечками (set_cutoffs) индекс знает ещё и окна записи и
+    отмены: слот, до которого осталось меньше booking_cutoff, закрыт для
+    записи и пропадает из свободных; меньше cancel_cutoff — закрыт для
+    отмены. Слоты переводятся в эти состояния заранее, в advance() (его
+    вызывает фоновый sweeper ровно к моменту next_transition()), поэтому
+    хендлеры проверяют окна по множеству, а не разбором даты на каждый запрос.
+
+    version(direction) меняется при любом изменении свободных слотов
+    направления (version() — любого направления); по ней кэшируются готовые
+    клавиатуры (см. keyboards.py).
+    """
+
+    def __init__(self, booking_cutoff=None, cancel_cutoff=None):
+        self.booking_cutoff = booking_cutoff
+        self.cancel_cutoff = cancel_cutoff
+        # direction -> {date: {time: datetime | None}}
+        self._free = {}
+        # (date, time) -> datetime | None (None — строку не удалось разобрать)
+        self._datetimes = {}
+        # порядок дат и времён в исходной таблице — для стабильной сортировки
+        self._date_pos = {}
+        self._time_pos = {}
+        # date -> день слота (для сортировки дат)
+        self._date_day = {}
+        # direction -> отсортированный список свободных дат (сбрасывается при изменениях)
+        self._sorted_dates = {}
+        # слоты по времени начала: [(datetime, pos даты, pos времени, date, time)] и сколько из них уже закрыто для записи/отмены
+        self._timeline = []
+        self._booking_pos = 0
+        self._cancel_pos = 0
+        self._booking_closed = set()
+        self._cancel_closed = set()
+        # версии: поколение (новое при каждой перестройке) и счётчики изменений — всего и по направлениям
+        self._generation = next(_generations)
+        self._changes = 0
+        self._dir_changes = {}
+
+    def set_cutoffs(self, booking_cutoff=None, cancel_cutoff=None, now=None):
+        self.booking_cutoff = booking_cutoff
+        self.cancel_cutoff = cancel_cutoff
+        self._reset_windows()
+        self.advance(now)
+
+    def rebuild(self, grid, now=None):
+        self._free = {}
+        self._datetimes = {}
+        self._date_pos = {}
+        self._time_pos = {}
+        self._date_day = {}
+        self._sorted_dates = {}
+        for date, times in grid.items():
+            self._date_pos[date] = len(self._date_pos)
+            for time, dirs in times.items():
+                self._time_pos.setdefault(time, len(self._time_pos))
+                self._remember(date, time)
+                for direction, value in dirs.items():
+                    self._free.setdefault(direction, {})
+                    if value is None:
+                        self._add(direction, date, time)
+        self._reset_windows()
+        self.advance(now)
+
+    def _reset_windows(self):
+        self._generation = next(_generations)
+        self._timeline = sorted(
+            (dt, self._date_pos.get(date, 0), self._time_pos.get(time, 0), date, time)
+            for (date, time), dt in self._datetimes.items() if dt is not None
+        )
+        self._booking_pos = 0
+        self._cancel_pos = 0
+        # слот с неразборчивой датой нельзя ни забронировать, ни отменить
+        unparsed = {key for key, dt in self._datetimes.items() if dt is None}
+        self._booking_closed = set(unparsed)
+        self._cancel_closed = set(unparsed)
+        for date, time in unparsed:
+            self._drop_free(date, time)
+
+    def _remember(self, date, time):
+        dt = _try_parse(date, time)
+        self._datetimes[(date, time)] = dt
+        if dt is not None:
+            self._date_day.setdefault(date, dt.date())
+
+    def _touch(self, direction):
+        self._changes += 1
+        self._dir_changes[direction] = self._dir_changes.get(direction, 0) + 1
+        self._sorted_dates.pop(direction, None)
+
+    def _add(self, direction, date, time):
+        self._free.setdefault(direction, {}).setdefault(date, {})[time] = self._datetimes.get((date, time))
+
+    def mark_free(self, date, time, direction):
+        if (date, time) not in self._datetimes:
+            self._remember(date, time)
+        if (date, time) in self._booking_closed:
+            # освободившийся слот внутри окна отсечки записи уже никому не достанется
+            return
+        self._add(direction, date, time)
+        self._touch(direction)
+
+    def mark_taken(self, date, time, direction):
+        dates = self._free.get(direction)
+        if not dates or date not in dates:
+            return
+        dates[date].pop(time, None)
+        if not dates[date]:
+            del dates[date]
+        self._touch(direction)
+
+    def _drop_free(self, date, time):
+        for direction, dates in self._free.items():
+            times = dates.get(date)
+            if times is not None and time in times:
+                del times[time]
+                if not times:
+                    del dates[date]
+                self._touch(direction)
+
+    # --- окна записи и отмены ---
+
+    def advance(self, now=None):
+        """Закрыть слоты, пересёкшие отсечки к моменту now. Возвращает [(date, time)], закрытые для записи."""
+        now = now or datetime.datetime.now()
+        closed = []
+        if self.booking_cutoff is not None:
+            deadline = now + self.booking_cutoff
+            while self._booking_pos < len(self._timeline) and self._timeline[self._booking_pos][0] < deadline:
+                _, _, _, date, time = self._timeline[self._booking_pos]
+                self._booking_closed.add((date, time))
+                self._drop_free(date, time)
+                closed.append((date, time))
+                self._booking_pos += 1
+        if self.cancel_cutoff is not None:
+            deadline = now + self.cancel_cutoff
+            while self._cancel_pos < len(self._timeline) and self._timeline[self._cancel_pos][0] < deadline:
+                _, _, _, date, time = self._timeline[self._cancel_pos]
+                self._cancel_closed.add((date, time))
+                self._cancel_pos += 1
+        return closed
+
+    def next_transition(self):
+        """Ближайший момент, когда какой-то слот пересечёт отсечку (None — таких не осталось)."""
+        moments = []
+        if self.booking_cutoff is not None and self._booking_pos < len(self._timeline):
+            moments.append(self._timeline[self._booking_pos][0] - self.booking_cutoff)
+        if self.cancel_cutoff is not None and self._cancel_pos < len(self._timeline):
+            moments.append(self._timeline[self._cancel_pos][0] - self.cancel_cutoff)
+        return min(moments) if moments else None
+
+    def started_before(self, moment):
+        """Слоты [(date, time)], которые начинаются раньше moment (по возрастанию времени)."""
+        keys = []
+        for dt, _, _, date, time in self._timeline:
+            if dt >= moment:
+                break
+            keys.append((date, time))
+        return keys
+
+    def booking_open(self, date, time) -> bool:
+        return (date, time) in self._datetimes and (date, time) not in self._booking_closed
+
+    def cancel_open(self, date, time) -> bool:
+        return (date, time) in self._datetimes and (date, time) not in self._cancel_closed
+
+    # --- запросы ---
+
+    def directions(self):
+        return list(self._free)
+
+    def version(self, direction=None):
+        """Версия свободных слотов направления (None — всего индекса); сравнивается только на равенство."""
+        if direction is None:
+            return (self._generation, self._changes)
+        return (self._generation, self._dir_changes.get(direction, 0))
+
+    def slot_datetime(self, date, time):
+        """Разобранный datetime слота (из кэша), либо разбор строки, если слота нет в индексе."""
+        if (date, time) in self._datetimes:
+            return self._datetimes[(date, time)]
+        return _try_parse(date, time)
+
+    def has_free(self, direction) -> bool:
+        return bool(self._free.get(direction))
+
+    def free_dates(self, direction):
+        cached = self._sorted_dates.get(direction)
+        if cached is None:
+            dates = self._free.get(direction, {})
+            cached = sorted(dates, key=self._date_key)
+            self._sorted_dates[direction] = cached
+        return cached
+
+    def free_times(self, direction, date):
+        times = self._free.get(direction, {}).get(date, {})
+        return sorted(times, key=lambda t: self._time_pos.get(t, 0))
+
+    def _date_key(self, date):
+        # сортируем по дате слота; неразобранные строки — в конец, в исходном порядке
+        day = self._date_day.get(date)
+        if day is None:
+            return (1, datetime.date.max, self._date_pos.get(date, 0))
+        return (0, day, self._date_pos.get(date, 0))
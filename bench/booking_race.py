@@ -0,0 +1,135 @@
+"""Нагрузочная проверка бронирования: тысячи кандидатов одновременно жмут время.
+
+Все кандидаты уже стоят в состоянии Form.time и одновременно отправляют время
+через настоящий process_time. Скрипт проверяет, что ни один слот не занят
+дважды, ни одна запись не потерялась и что файл на диске после flush совпадает
+с памятью.
+
+В process_time между проверкой ячейки и try_book нет await, поэтому до лока
+слота там доходят немногие. Отдельная стадия гоняет SlotStore.try_book
+напрямую: на каждый слот --contenders задач, между проверкой и бронью —
+await (как ввод-вывод хендлера), а половину слотов в момент гонки держит
+«параллельная синхронизация», так что задачи встают в очередь на лок.
+Проверяется, что конкуренция действительно была (lock_waits и проигранные
+compare-and-set больше нуля) и что у каждого слота ровно один победитель.
+
+    python bench/booking_race.py --users 5000 --dates 6 --times 12
+    python bench/booking_race.py --sqlite   # то же на SQLite-хранилище (SLOTS_DB)
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fakes  # noqa: E402
+
+
+async def contend(store, cells, contenders):
+    """Гонка за try_book напрямую. Возвращает {ячейка: [id победителей]}."""
+    winners = {cell: [] for cell in cells}
+    uids = iter(range(1, len(cells) * contenders + 1))
+
+    async def attempt(uid, cell):
+        date, time_slot, direction = cell
+        if store.get_cell(date, time_slot, direction) is not None:
+            return
+        # между проверкой и бронью хендлер обычно ходит в сеть
+        await asyncio.sleep(0)
+        reg = {'user_id': uid, 'direction': direction, 'date': date, 'time': time_slot}
+        if await store.try_book(date, time_slot, direction, uid, reg):
+            winners[cell].append(uid)
+
+    held = [store.slot_lock(*cell) for cell in cells[::2]]
+    for lock in held:
+        await lock.acquire()
+    tasks = [asyncio.create_task(attempt(next(uids), cell)) for cell in cells for _ in range(contenders)]
+    # даём всем задачам пройти проверку и упереться в лок
+    for _ in range(3):
+        await asyncio.sleep(0)
+    for lock in held:
+        lock.release()
+    await asyncio.gather(*tasks)
+    return winners
+
+
+async def run_direct(args, directions):
+    from slot_store import SlotStore
+    with open('race.json', 'w', encoding='utf-8') as f:
+        json.dump(fakes.make_grid(directions, args.dates, args.times), f, ensure_ascii=False)
+    store = SlotStore('race.json')
+    store.load()
+    cells = [(d, t, dirn) for d, times in store.slots.items() for t in times for dirn in directions]
+    started = time.perf_counter()
+    winners = await contend(store, cells, args.contenders)
+    elapsed = time.perf_counter() - started
+    await store.close()
+    single = sum(1 for uids in winners.values() if len(uids) == 1)
+    print(f'direct: cells={len(cells)} contenders={args.contenders} elapsed={elapsed:.3f}s')
+    print(f'direct: lock_waits={store.lock_waits} lost_cas={store.book_conflicts} '
+          f'one_winner={single}/{len(cells)} double_booking={fakes.is_double_booked(store.snapshot())}')
+    return (single == len(cells) and store.lock_waits > 0 and store.book_conflicts > 0
+            and fakes.is_double_booked(store.snapshot()) == 0)
+
+
+async def run(args):
+    directions = ['ЦТ', 'Фото', 'СМИ', 'Дизайн', 'F&U prod.']
+    if args.sqlite:
+        os.environ['SLOTS_DB'] = 'slots.sqlite3'
+    main = fakes.import_main(fakes.make_grid(directions, args.dates, args.times))
+    slots = main.active_store().snapshot()
+    cells = [(d, t, dirn) for d, times in slots['slots'].items() for t in times for dirn in directions]
+    rnd = random.Random(args.seed)
+
+    bot = main.bot
+    users = range(1, args.users + 1)
+    picks = {}
+    for uid in users:
+        date, time_slot, direction = rnd.choice(cells[:args.hot] if args.hot else cells)
+        picks[uid] = (date, time_slot, direction)
+        ctx = main.dp.fsm.get_context(bot=bot, chat_id=uid, user_id=uid)
+        await ctx.set_state(main.Form.time)
+        await ctx.set_data({'name': f'Кандидат {uid}', 'vk': f'https://vk.com/id{uid}', 'direction': direction, 'date': date})
+
+    started = time.perf_counter()
+    await asyncio.gather(*(main.dp.feed_update(bot, fakes.message_update(uid, picks[uid][1])) for uid in users))
+    elapsed = time.perf_counter() - started
+    store = main.active_store()
+    await store.close()
+    slots = store.snapshot()
+
+    if args.sqlite:
+        from slot_db import SQLiteBackend
+        on_disk = SQLiteBackend(main.campaigns.active.slots_db).load()
+    else:
+        with open(main.campaigns.active.slots_file, encoding='utf-8') as f:
+            on_disk = json.load(f)
+    booked = len(slots['registrations'])
+    distinct = len({picks[uid] for uid in users})
+    print(f'users={args.users} cells={len(cells)} distinct_picked={distinct}')
+    print(f'booked={booked} elapsed={elapsed:.3f}s ({args.users / elapsed:.0f} updates/s)')
+    print(f'double_booking={fakes.is_double_booked(slots)} disk_mismatch={int(on_disk != slots)} '
+          f'lock_waits={store.lock_waits} lost_cas={store.book_conflicts}')
+    ok = booked == distinct and fakes.is_double_booked(slots) == 0 and on_disk == slots
+    ok = await run_direct(args, directions) and ok
+    print('OK' if ok else 'FAIL')
+    return 0 if ok else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=3000)
+    parser.add_argument('--dates', type=int, default=6)
+    parser.add_argument('--times', type=int, default=12)
+    parser.add_argument('--hot', type=int, default=0, help='все кандидаты целятся в первые N ячеек (0 — во все)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--contenders', type=int, default=20, help='задач на слот в прямой гонке за try_book')
+    parser.add_argument('--sqlite', action='store_true', help='хранить слоты в SQLite вместо slots.json')
+    return asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
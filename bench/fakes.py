@@ -0,0 +1,146 @@
+"""Общие заготовки для нагрузочных скриптов: фейковый Bot и синтетические апдейты.
+
+Скрипты запускаются из корня репозитория (python bench/<script>.py). main.py
+импортируется во временном рабочем каталоге, чтобы slots.json, bot.log и
+published.json бенчмарка не смешивались с боевыми.
+"""
+import asyncio
+import datetime
+import itertools
+import json
+import os
+import sys
+import tempfile
+
+from aiogram import Bot
+from aiogram.methods import SendMessage, SendDocument, ForwardMessage, EditMessageText
+from aiogram.types import Update, Message, CallbackQuery, Chat, User
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_TOKEN = '123456:TEST-bench-token'
+
+WEEKDAYS = ['пн', 'вт', 'ср', 'чт', 'пт', 'сб', 'вс']
+
+
+class FakeBot(Bot):
+    """Bot, который записывает вызовы Bot API вместо обращения к Telegram."""
+
+    def __init__(self, latency=0.0):
+        super().__init__(token=FAKE_TOKEN)
+        # задержка «сети» на вызов; даже при 0 вызов уступает управление циклу, как настоящий запрос,
+        # иначе одновременные апдейты выполняются строго по очереди
+        self.latency = latency
+        self.calls = []
+        # последнее отправленное в чат сообщение — по нему «пользователь» видит клавиатуру
+        self.last_sent = {}
+        self._message_ids = itertools.count(1)
+
+    async def __call__(self, method, request_timeout=None):
+        await asyncio.sleep(self.latency)
+        self.calls.append(method)
+        if isinstance(method, SendMessage):
+            self.last_sent[int(method.chat_id)] = method
+        if isinstance(method, (SendMessage, SendDocument, ForwardMessage, EditMessageText)):
+            return Message(
+                message_id=next(self._message_ids),
+                date=datetime.datetime.now(),
+                chat=Chat(id=int(method.chat_id), type='private'),
+                text=getattr(method, 'text', None),
+            )
+        return True
+
+    def count(self, method_type):
+        return sum(1 for c in self.calls if isinstance(c, method_type))
+
+    def keyboard_for(self, chat_id):
+        """Тексты кнопок reply-клавиатуры из последнего сообщения в чат."""
+        sent = self.last_sent.get(chat_id)
+        markup = getattr(sent, 'reply_markup', None)
+        rows = getattr(markup, 'keyboard', None) or []
+        return [button.text for row in rows for button in row]
+
+
+def make_grid(directions, n_dates=6, n_times=12, start_in_days=3):
+    """Сетка слотов в формате slots.json с датами в будущем (чтобы не мешала отсечка 12 часов)."""
+    today = datetime.date.today()
+    grid = {}
+    for i in range(n_dates):
+        day = today + datetime.timedelta(days=start_in_days + i)
+        date_key = f"{day.strftime('%d.%m.%Y')}({WEEKDAYS[day.weekday()]})"
+        grid[date_key] = {}
+        for j in range(n_times):
+            hour = 8 + j % 14
+            time_key = f'{hour:02d}:{j // 14:02d}-{hour + 1:02d}:{j // 14:02d}'
+            grid[date_key][time_key] = {d: None for d in directions}
+    return {'slots': grid, 'registrations': []}
+
+
+def import_main(slots):
+    """Импортировать main.py в чистом временном каталоге с заданным содержимым slots.json."""
+    workdir = tempfile.mkdtemp(prefix='otbor-bench-')
+    os.chdir(workdir)
+    with open('slots.json', 'w', encoding='utf-8') as f:
+        json.dump(slots, f, ensure_ascii=False)
+    os.environ.setdefault('BOT_TOKEN', FAKE_TOKEN)
+    # бенчи сами шлют апдейты быстрее любого человека и повторяют одни и те же шаги —
+    # антифлуд (throttle.py) отсёк бы их; включить обратно можно, задав переменные явно
+    os.environ.setdefault('THROTTLE_RATE', '0')
+    os.environ.setdefault('DUPLICATE_WINDOW', '0')
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    import main
+    main.bot = FakeBot()
+    main.dp.include_router(main.router)
+    # шард активной кампании читается с диска при первом обращении
+    main.active_store()
+    return main
+
+
+_update_ids = itertools.count(1)
+
+
+def _user(user_id):
+    return User(id=user_id, is_bot=False, first_name=f'user{user_id}', username=f'user{user_id}')
+
+
+def message_update(user_id, text):
+    return Update(
+        update_id=next(_update_ids),
+        message=Message(
+            message_id=next(_update_ids),
+            date=datetime.datetime.now(),
+            chat=Chat(id=user_id, type='private'),
+            from_user=_user(user_id),
+            text=text,
+        ),
+    )
+
+
+def callback_update(user_id, data):
+    return Update(
+        update_id=next(_update_ids),
+        callback_query=CallbackQuery(
+            id=str(next(_update_ids)),
+            from_user=_user(user_id),
+            chat_instance='bench',
+            data=data,
+        ),
+    )
+
+
+def is_double_booked(slots):
+    """Сколько нарушений: ячейка и список регистраций расходятся или у слота больше одной записи."""
+    problems = 0
+    seen = {}
+    for reg in slots['registrations']:
+        key = (reg['date'], reg['time'], reg['direction'])
+        seen[key] = seen.get(key, 0) + 1
+        if slots['slots'][reg['date']][reg['time']][reg['direction']] != reg['user_id']:
+            problems += 1
+    problems += sum(n - 1 for n in seen.values() if n > 1)
+    for date, times in slots['slots'].items():
+        for time, dirs in times.items():
+            for direction, value in dirs.items():
+                if value not in (None, 'blocked') and (date, time, direction) not in seen:
+                    problems += 1
+    return problems
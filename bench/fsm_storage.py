@@ -0,0 +1,66 @@
+"""Сравнение FSM-хранилищ: MemoryStorage против SQLiteStorage.
+
+Каждый пользователь проходит /start → ФИО → VK через настоящие хендлеры
+main.py (фейковый Bot, без сети). Меряется updates/s для каждого хранилища,
+а для SQLite — ещё и что состояния действительно доезжают до базы.
+
+    python bench/fsm_storage.py --users 2000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fakes  # noqa: E402
+
+from aiogram.fsm.storage.memory import MemoryStorage  # noqa: E402
+
+
+async def drive(main, storage, users):
+    main.dp.fsm.storage = storage
+    bot = main.bot
+    steps = ['/start', 'Иван Иванов', 'https://vk.com/id1']
+    started = time.perf_counter()
+    for text in steps:
+        await asyncio.gather(*(main.dp.feed_update(bot, fakes.message_update(uid, text)) for uid in users))
+    elapsed = time.perf_counter() - started
+    return len(steps) * len(users) / elapsed
+
+
+async def run(args):
+    main = fakes.import_main(fakes.make_grid(['ЦТ']))
+    from fsm_storage import SQLiteStorage
+
+    users = range(1, args.users + 1)
+    results = {}
+    for name, factory in [('memory', MemoryStorage), ('sqlite', lambda: SQLiteStorage('bench-fsm.sqlite3'))]:
+        rates = []
+        for _ in range(args.repeat):
+            if os.path.exists('bench-fsm.sqlite3'):
+                os.remove('bench-fsm.sqlite3')
+            storage = factory()
+            rates.append(await drive(main, storage, users))
+            await storage.close()
+        results[name] = max(rates)
+        print(f'{name:>7}: {results[name]:,.0f} updates/s')
+    print(f'sqlite/memory: {results["sqlite"] / results["memory"]:.2f}')
+
+    # состояния пережили «перезапуск»: новое хранилище читает их из базы
+    reopened = SQLiteStorage('bench-fsm.sqlite3')
+    main.dp.fsm.storage = reopened
+    ctx = main.dp.fsm.get_context(bot=main.bot, chat_id=1, user_id=1)
+    print(f'после перезапуска: state={await ctx.get_state()} data={await ctx.get_data()}')
+    await reopened.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=3)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Микробенчмарк: сетка слотов словарями (как в slots.json) против SlotGrid.
+
+Меряется память под сетку после загрузки (tracemalloc), загрузка и обратное
+преобразование, а также запросы анкеты: «есть ли у направления свободные
+слоты», «свободные даты направления» и «свободные времена на дату» — обходом
+словаря и битовыми масками SlotGrid. Для справки — те же запросы через
+AvailabilityIndex, которым пользуется бот. Часть ячеек занята и закрыта,
+чтобы обходы не останавливались на первой свободной.
+
+    python bench/grid_bench.py --dates 6 --times 12
+    python bench/grid_bench.py --dates 30 --times 24 --taken 0.9
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fakes  # noqa: E402
+
+sys.path.insert(0, fakes.REPO_ROOT)
+from availability import AvailabilityIndex  # noqa: E402
+from slot_grid import SlotGrid  # noqa: E402
+
+DIRECTIONS = ['ЦТ', 'Фото', 'СМИ', 'Дизайн', 'F&U prod.']
+
+
+def dict_has_free(slots, direction):
+    return any(dirs.get(direction) is None and direction in dirs for times in slots.values() for dirs in times.values())
+
+
+def dict_free_dates(slots, direction):
+    return [date for date, times in slots.items()
+            if any(direction in dirs and dirs[direction] is None for dirs in times.values())]
+
+
+def dict_free_times(slots, direction, date):
+    return [time for time, dirs in slots.get(date, {}).items() if direction in dirs and dirs[direction] is None]
+
+
+def measure(fn):
+    tracemalloc.start()
+    result = fn()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def timed(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dates', type=int, default=6)
+    parser.add_argument('--times', type=int, default=12)
+    parser.add_argument('--taken', type=float, default=0.7, help='доля занятых и закрытых ячеек')
+    parser.add_argument('--number', type=int, default=2000, help='повторов каждого запроса')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    slots = fakes.make_grid(DIRECTIONS, args.dates, args.times)['slots']
+    for times in slots.values():
+        for dirs in times.values():
+            for direction in dirs:
+                if rnd.random() < args.taken:
+                    dirs[direction] = rnd.choice(['blocked', rnd.randrange(10**6, 10**10)])
+    payload = json.dumps(slots, ensure_ascii=False)
+
+    as_dict, dict_bytes = measure(lambda: json.loads(payload))
+    grid, grid_bytes = measure(lambda: SlotGrid.from_json(json.loads(payload)))
+    index = AvailabilityIndex()
+    index.rebuild(as_dict)
+    assert grid.to_json() == as_dict, 'SlotGrid.to_json() не совпал с исходной сеткой'
+
+    cells = args.dates * args.times * len(DIRECTIONS)
+    print(f'grid={args.dates}x{args.times} ({cells} ячеек), занято/закрыто ~{args.taken:.0%}')
+    print(f'память: dict {dict_bytes / 1024:8.1f} KiB   SlotGrid {grid_bytes / 1024:8.1f} KiB '
+          f'({dict_bytes / max(grid_bytes, 1):.1f}x)')
+    print(f'загрузка: json.loads {timed(lambda: json.loads(payload), 50):9.1f} мкс   '
+          f'+ SlotGrid.from_json {timed(lambda: SlotGrid.from_json(as_dict), 50):9.1f} мкс   '
+          f'to_json {timed(grid.to_json, 50):9.1f} мкс')
+
+    direction = DIRECTIONS[-1]
+    date = next(iter(as_dict))
+    checks = [
+        ('has_free', lambda: dict_has_free(as_dict, direction), lambda: grid.has_free(direction),
+         lambda: index.has_free(direction)),
+        ('free_dates', lambda: dict_free_dates(as_dict, direction), lambda: grid.free_dates(direction),
+         lambda: index.free_dates(direction)),
+        ('free_times', lambda: dict_free_times(as_dict, direction, date), lambda: grid.free_times(direction, date),
+         lambda: index.free_times(direction, date)),
+    ]
+    print(f'{"запрос":>12} {"dict, мкс":>12} {"SlotGrid, мкс":>14} {"index, мкс":>12}')
+    for name, by_dict, by_grid, by_index in checks:
+        assert by_dict() == by_grid(), f'{name}: SlotGrid расходится с обходом словаря'
+        print(f'{name:>12} {timed(by_dict, args.number):12.2f} {timed(by_grid, args.number):14.2f} '
+              f'{timed(by_index, args.number):12.2f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,191 @@
+"""Наплыв кандидатов от начала до конца: /start → ФИО → VK → направление → дата → время.
+
+Каждый виртуальный кандидат проходит анкету через настоящие хендлеры
+main.py, отвечая кнопками из последнего сообщения бота (фейковый Bot, без
+сети); все кандидаты идут одновременно. Направление выбирается то
+текстом, то inline-кнопкой опубликованного меню (callback dir:...). Если
+время успели занять, кандидат берёт другое из новой клавиатуры.
+
+Фейковый Bot уступает управление на каждом вызове, как настоящий запрос,
+так что апдейты кандидатов перемежаются; скрипт проверяет, что анкету до
+выбора направления прошли все --users кандидатов и что без --think все они
+были в обработке одновременно (peak_in_flight), а не по очереди.
+
+Для каждой конфигурации (число кандидатов × размер сетки) печатаются
+p50/p95/p99 задержки хендлеров — всего и по шагам, — updates/s, сколько
+раз слоты читались и писались на диск и число двойных записей.
+
+    python bench/rush.py --users 100,500,2000 --grid 6x12,12x24
+    python bench/rush.py --users 1000 --sqlite --think 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fakes  # noqa: E402
+
+DIRECTIONS = ['ЦТ', 'Фото', 'СМИ', 'Дизайн', 'F&U prod.']
+STEPS = ['start', 'name', 'vk', 'direction', 'date', 'time']
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+class InFlight:
+    """Сколько апдейтов сейчас в обработке и сколько было одновременно максимум."""
+
+    def __init__(self):
+        self.now = 0
+        self.peak = 0
+
+    def __enter__(self):
+        self.now += 1
+        self.peak = max(self.peak, self.now)
+
+    def __exit__(self, *exc):
+        self.now -= 1
+
+
+class Candidate:
+    def __init__(self, main, uid, rnd, args, in_flight):
+        self.main = main
+        self.in_flight = in_flight
+        self.bot = main.bot
+        self.uid = uid
+        self.rnd = rnd
+        self.args = args
+        self.latencies = {step: [] for step in STEPS}
+        self.booked = False
+
+    async def _send(self, step, update):
+        if self.args.think:
+            await asyncio.sleep(self.rnd.uniform(0, self.args.think) / 1000)
+        started = time.perf_counter()
+        with self.in_flight:
+            await self.main.dp.feed_update(self.bot, update)
+        self.latencies[step].append(time.perf_counter() - started)
+
+    async def _say(self, step, text):
+        await self._send(step, fakes.message_update(self.uid, text))
+
+    async def run(self):
+        await self._say('start', '/start')
+        await self._say('name', f'Кандидат {self.uid}')
+        await self._say('vk', f'https://vk.com/id{self.uid}')
+        direction = self.rnd.choice(DIRECTIONS)
+        if self.rnd.random() < self.args.callback_share:
+            await self._send('direction', fakes.callback_update(self.uid, f'dir:{direction}'))
+        else:
+            await self._say('direction', direction)
+        dates = self.bot.keyboard_for(self.uid)
+        if not dates:
+            return
+        await self._say('date', self.rnd.choice(dates))
+        for _ in range(self.args.retries + 1):
+            times = self.bot.keyboard_for(self.uid)
+            if not times or self.main.active_store().registration_for(self.uid):
+                break
+            await self._say('time', self.rnd.choice(times))
+            if self.main.active_store().registration_for(self.uid):
+                self.booked = True
+                break
+
+
+async def run_config(main, n_users, n_dates, n_times, args, uid_offset):
+    grid = fakes.make_grid(DIRECTIONS, n_dates, n_times)
+    store = main.active_store()
+    store.replace(grid)
+    await store.flush_async()
+    reads, writes = store.disk_reads, store.disk_writes
+    main.bot.calls.clear()
+
+    rnd = random.Random(args.seed)
+    in_flight = InFlight()
+    candidates = [Candidate(main, uid_offset + i, random.Random(rnd.random()), args, in_flight)
+                  for i in range(1, n_users + 1)]
+    started = time.perf_counter()
+    await asyncio.gather(*(c.run() for c in candidates))
+    elapsed = time.perf_counter() - started
+    await store.flush_async()
+
+    slots = store.snapshot()
+    if args.sqlite:
+        from slot_db import SQLiteBackend
+        on_disk = SQLiteBackend(main.campaigns.active.slots_db).load()
+    else:
+        with open(main.campaigns.active.slots_file, encoding='utf-8') as f:
+            on_disk = json.load(f)
+
+    all_latencies = [v for c in candidates for values in c.latencies.values() for v in values]
+    cells = n_dates * n_times * len(DIRECTIONS)
+    print(f'\n=== users={n_users} grid={n_dates}x{n_times} ({cells} слотов) ===')
+    print(f'updates={len(all_latencies)} elapsed={elapsed:.2f}s → {len(all_latencies) / elapsed:,.0f} updates/s')
+    print(f'latency ms: p50={percentile(all_latencies, 0.5) * 1000:.2f} '
+          f'p95={percentile(all_latencies, 0.95) * 1000:.2f} p99={percentile(all_latencies, 0.99) * 1000:.2f}')
+    counts = {}
+    for step in STEPS:
+        values = [v for c in candidates for v in c.latencies[step]]
+        counts[step] = len(values)
+        if values:
+            print(f'  {step:>9}: n={len(values):>6} p50={percentile(values, 0.5) * 1000:7.2f} '
+                  f'p95={percentile(values, 0.95) * 1000:7.2f} p99={percentile(values, 0.99) * 1000:7.2f}')
+    booked = sum(c.booked for c in candidates)
+    double = fakes.is_double_booked(slots)
+    print(f'booked={booked} registrations={len(slots["registrations"])} bot_calls={len(main.bot.calls)}')
+    print(f'slots disk reads={store.disk_reads - reads} writes={store.disk_writes - writes}')
+    print(f'double_booking={double} disk_mismatch={int(on_disk != slots)}')
+    # анкету до выбора направления проходит каждый; без пауз все кандидаты в обработке разом
+    concurrent = all(counts[step] == n_users for step in STEPS[:4])
+    if not args.think:
+        concurrent = concurrent and in_flight.peak == n_users
+    print(f'peak_in_flight={in_flight.peak} form_steps_complete={int(concurrent)}')
+    return concurrent and double == 0 and on_disk == slots and booked == len(slots['registrations'])
+
+
+async def run(args):
+    # уведомления админу уходят в FakeBot — лимит Telegram здесь только растянул бы остановку
+    os.environ.setdefault('ADMIN_NOTIFY_RATE', '100000')
+    os.environ.setdefault('ADMIN_NOTIFY_BURST', '100000')
+    if args.sqlite:
+        os.environ['SLOTS_DB'] = 'slots.sqlite3'
+    main = fakes.import_main(fakes.make_grid(DIRECTIONS, 1, 1))
+    await main.on_startup()
+    # опубликованное меню — чтобы работали и дебаунс-редактирование, и inline-кнопки
+    await main.dp.feed_update(main.bot, fakes.message_update(main.ADMIN_ID, '/publish'))
+
+    users = [int(u) for u in args.users.split(',')]
+    grids = [tuple(int(x) for x in g.split('x')) for g in args.grid.split(',')]
+    ok = True
+    uid_offset = 10_000_000
+    for n_users in users:
+        for n_dates, n_times in grids:
+            ok &= await run_config(main, n_users, n_dates, n_times, args, uid_offset)
+            uid_offset += n_users
+    await main.on_shutdown()
+    print('\nOK' if ok else '\nFAIL')
+    return 0 if ok else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', default='200,1000', help='число кандидатов, через запятую — несколько прогонов')
+    parser.add_argument('--grid', default='6x12', help='даты x времена, через запятую — несколько прогонов')
+    parser.add_argument('--callback-share', type=float, default=0.3, help='доля выбирающих направление inline-кнопкой')
+    parser.add_argument('--retries', type=int, default=3, help='сколько раз кандидат пробует другое время, если его заняли')
+    parser.add_argument('--think', type=float, default=0, help='пауза «на подумать» перед каждым шагом, до N мс')
+    parser.add_argument('--sqlite', action='store_true', help='хранить слоты в SQLite вместо slots.json')
+    parser.add_argument('--seed', type=int, default=1)
+    return asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""Нагрузка на webhook-режим: синтетические апдейты POST-запросами в локальный aiohttp-сервер.
+
+Поднимается настоящее приложение из webhook.py с main.dp и фейковым Bot.
+Часть кандидатов уже стоит в Form.time и присылает время (бронирование),
+остальные шлют /start. Меряется, сколько апдейтов в секунду сервер
+принимает и сколько успевает обработать, а после остановки сервера
+проверяется, что слоты сброшены на диск и нет двойных записей.
+
+    python bench/webhook_load.py --users 3000 --browsers 3000 --concurrency 100 --max-concurrency 64
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fakes  # noqa: E402
+
+from aiohttp import ClientSession, TCPConnector, web  # noqa: E402
+
+SECRET = 'bench-secret'
+
+
+async def post_all(url, updates, concurrency):
+    latencies = []
+    queue = list(reversed(updates))
+
+    async def worker(session):
+        while queue:
+            body = queue.pop()
+            started = time.perf_counter()
+            async with session.post(url, data=body, headers={
+                'Content-Type': 'application/json',
+                'X-Telegram-Bot-Api-Secret-Token': SECRET,
+            }) as resp:
+                if resp.status != 200:
+                    raise RuntimeError(f'HTTP {resp.status}: {await resp.text()}')
+                await resp.read()
+            latencies.append(time.perf_counter() - started)
+
+    async with ClientSession(connector=TCPConnector(limit=concurrency)) as session:
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+    return sorted(latencies)
+
+
+async def run(args):
+    directions = ['ЦТ', 'Фото', 'СМИ', 'Дизайн', 'F&U prod.']
+    # уведомления админу уходят в FakeBot — лимит Telegram здесь только растянул бы остановку
+    os.environ.setdefault('ADMIN_NOTIFY_RATE', '100000')
+    os.environ.setdefault('ADMIN_NOTIFY_BURST', '100000')
+    main = fakes.import_main(fakes.make_grid(directions, args.dates, args.times))
+    from webhook import build_app
+
+    main.dp.startup.register(main.on_startup)
+    main.dp.shutdown.register(main.on_shutdown)
+    slots = main.active_store().snapshot()
+    cells = [(d, t, dirn) for d, times in slots['slots'].items() for t in times for dirn in directions]
+    rnd = random.Random(args.seed)
+
+    bot = main.bot
+    updates = []
+    picks = {}
+    for uid in range(1, args.users + 1):
+        date, time_slot, direction = rnd.choice(cells)
+        picks[uid] = (date, time_slot, direction)
+        ctx = main.dp.fsm.get_context(bot=bot, chat_id=uid, user_id=uid)
+        await ctx.set_state(main.Form.time)
+        await ctx.set_data({'name': f'Кандидат {uid}', 'vk': f'https://vk.com/id{uid}', 'direction': direction, 'date': date})
+        updates.append(fakes.message_update(uid, time_slot))
+    for uid in range(args.users + 1, args.users + args.browsers + 1):
+        updates.append(fakes.message_update(uid, '/start'))
+    rnd.shuffle(updates)
+    bodies = [u.model_dump_json(exclude_none=True) for u in updates]
+
+    app = build_app(main.dp, bot, path='/webhook', secret_token=SECRET, max_concurrency=args.max_concurrency)
+    handler = app['webhook_handler']
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', args.port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    started = time.perf_counter()
+    latencies = await post_all(f'http://127.0.0.1:{port}/webhook', bodies, args.concurrency)
+    accepted = time.perf_counter() - started
+    while handler.in_flight():
+        await asyncio.sleep(0.005)
+    processed = time.perf_counter() - started
+
+    # остановка сервера = graceful shutdown: on_shutdown бота сбрасывает слоты, журнал и FSM
+    await runner.cleanup()
+
+    slots = main.active_store().snapshot()
+    with open(main.campaigns.active.slots_file, encoding='utf-8') as f:
+        on_disk = json.load(f)
+    total = len(bodies)
+    booked = len(slots['registrations'])
+    distinct = len(set(picks.values()))
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    print(f'updates={total} (bookings={args.users}, /start={args.browsers}) '
+          f'client_concurrency={args.concurrency} max_concurrency={args.max_concurrency}')
+    print(f'accepted: {total / accepted:,.0f} updates/s, processed: {total / processed:,.0f} updates/s')
+    print(f'POST latency p50={pct(0.5):.1f} ms p95={pct(0.95):.1f} ms p99={pct(0.99):.1f} ms')
+    print(f'handler errors={handler.failed} bot calls={len(bot.calls)}')
+    print(f'booked={booked} distinct_picked={distinct} double_booking={fakes.is_double_booked(slots)} '
+          f'disk_mismatch={int(on_disk != slots)}')
+    ok = handler.failed == 0 and booked == distinct and fakes.is_double_booked(slots) == 0 and on_disk == slots
+    print('OK' if ok else 'FAIL')
+    return 0 if ok else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=3000, help='кандидатов, которые бронируют время')
+    parser.add_argument('--browsers', type=int, default=3000, help='кандидатов, которые только шлют /start')
+    parser.add_argument('--dates', type=int, default=6)
+    parser.add_argument('--times', type=int, default=12)
+    parser.add_argument('--concurrency', type=int, default=100, help='одновременных POST-запросов от клиента')
+    parser.add_argument('--max-concurrency', type=int, default=64, help='лимит апдейтов в обработке на сервере')
+    parser.add_argument('--port', type=int, default=0, help='0 — любой свободный')
+    parser.add_argument('--seed', type=int, default=1)
+    return asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
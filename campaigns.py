@@ -0,0 +1,290 @@
+"""Кампании набора (волны отбора), каждая со своим шардом слотов.
+
+У кампании свои направления, своя таблица Google Sheets (и при необходимости
+свои названия листов для направлений) и свои файлы: slots.json (или
+SQLite-база), published.json и archive.jsonl (прошедшие слоты, см. sweeper.py). Описание кампаний — campaigns.json:
+
+    {
+      "active": "autumn-2025",
+      "campaigns": [
+        {"id": "spring-2025", "title": "Весна 2025", "directions": ["ЦТ", "Фото"], "sheet_id": "..."},
+        {"id": "autumn-2025", "directions": ["ЦТ", "Фото", "СМИ"], "sheet_id": "...",
+         "sheets": {"ЦТ": "Центр творчества"}, "slots_db": "campaigns/autumn-2025/slots.sqlite3"}
+      ]
+    }
+
+Файлы кампании по умолчанию лежат в campaigns/<id>/. Если campaigns.json
+нет, есть одна кампания 'default' со старыми путями (slots.json,
+published.json, SLOTS_DB, архив slots_archive.jsonl) — бот работает как раньше.
+
+Шард кампании загружается при первом обращении. Активная кампания — та,
+в которую записываются новые кандидаты; неактивные шарды, к которым не
+обращались idle_ttl секунд, сбрасываются на диск и выгружаются из памяти.
+Так стоимость запроса не растёт с числом прошлых кампаний.
+
+Какая запись у пользователя и в какой кампании, реестр помнит сам (индекс
+записей обновляется шардами при каждом изменении и переживает выгрузку
+шарда), поэтому проверка «есть ли у кандидата запись» не открывает шарды.
+Индекс заполняется при открытии шарда — при старте бот один раз открывает
+все кампании (index_all).
+"""
+import asyncio
+import datetime
+import json
+import logging
+import os
+import tempfile
+import time
+
+from slot_db import SQLiteBackend
+from slot_store import SlotStore
+
+logger = logging.getLogger(__name__)
+
+CAMPAIGNS_DIR = 'campaigns'
+
+
+class Campaign:
+    def __init__(self, id, title=None, directions=(), sheet_id=None, sheets=None,
+                 slots_file=None, slots_db=None, published_file=None, archive_file=None):
+        self.id = id
+        self.title = title or id
+        self.directions = list(directions)
+        self.sheet_id = sheet_id
+        # направление -> название листа в таблице, если они различаются
+        self.sheets = dict(sheets or {})
+        folder = os.path.join(CAMPAIGNS_DIR, id)
+        self.slots_file = slots_file or os.path.join(folder, 'slots.json')
+        self.slots_db = slots_db
+        self.published_file = published_file or os.path.join(folder, 'published.json')
+        self.archive_file = archive_file or os.path.join(folder, 'archive.jsonl')
+
+    @classmethod
+    def from_dict(cls, data):
+        known = ('id', 'title', 'directions', 'sheet_id', 'sheets', 'slots_file', 'slots_db', 'published_file',
+                 'archive_file')
+        unknown = set(data) - set(known)
+        if unknown:
+            raise ValueError(f"Неизвестные поля кампании {data.get('id')}: {', '.join(sorted(unknown))}")
+        return cls(**data)
+
+
+class CampaignRegistry:
+    """Список кампаний и их шарды слотов (SlotStore), открываемые по требованию.
+
+    on_open(campaign, store) вызывается для каждого только что созданного
+    шарда до чтения с диска — например, чтобы навесить метрики.
+    """
+
+    def __init__(self, path, default, flush_interval=1.0, idle_ttl=600.0, on_open=None):
+        self.path = path
+        self.default = default
+        self.flush_interval = flush_interval
+        self.idle_ttl = idle_ttl
+        self.on_open = on_open
+        self._campaigns = {}
+        self._config = None
+        self.active_id = default.id
+        # campaign_id -> SlotStore и время последнего обращения
+        self._stores = {}
+        self._last_used = {}
+        self._started = False
+        self._task = None
+        # счётчики для диагностики
+        self.opened = 0
+        self.evicted = 0
+        # campaign_id -> [чтения, записи] слотов уже закрытых шардов этой кампании
+        self._closed_disk = {}
+        # user_id -> {campaign_id: (регистрация, datetime слота | None)}, в том числе из выгруженных шардов
+        self._bookings = {}
+        self.load()
+
+    # --- описание кампаний ---
+
+    def load(self):
+        if not os.path.exists(self.path):
+            self._config = None
+            self._campaigns = {self.default.id: self.default}
+            self.active_id = self.default.id
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        campaigns = {}
+        for raw in config.get('campaigns', []):
+            campaign = Campaign.from_dict(raw)
+            campaigns[campaign.id] = campaign
+        if not campaigns:
+            raise ValueError(f'В {self.path} нет ни одной кампании')
+        active_id = config.get('active') or next(iter(campaigns))
+        if active_id not in campaigns:
+            raise ValueError(f'Активная кампания {active_id} не описана в {self.path}')
+        self._config = config
+        self._campaigns = campaigns
+        self.active_id = active_id
+
+    def _save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix='.campaigns-', suffix='.tmp', dir=directory)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(self._config, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def ids(self):
+        return list(self._campaigns)
+
+    def get(self, campaign_id=None):
+        """Кампания по id (None — активная). KeyError, если такой нет."""
+        return self._campaigns[campaign_id or self.active_id]
+
+    @property
+    def active(self):
+        return self._campaigns[self.active_id]
+
+    def set_active(self, campaign_id):
+        if campaign_id not in self._campaigns:
+            raise KeyError(campaign_id)
+        self.active_id = campaign_id
+        if self._config is not None:
+            self._config['active'] = campaign_id
+            self._save()
+
+    # --- шарды ---
+
+    def _open(self, campaign):
+        folder = os.path.dirname(campaign.slots_file)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        backend = SQLiteBackend(campaign.slots_db, json_path=campaign.slots_file) if campaign.slots_db else None
+        store = SlotStore(campaign.slots_file, flush_interval=self.flush_interval, backend=backend)
+        # записи кампании в индексе могли устареть, пока шард был выгружен — их заново заполнит load()
+        self._forget_bookings(campaign.id)
+        store.on_bookings = lambda user_ids: self._update_bookings(campaign.id, store, user_ids)
+        if self.on_open is not None:
+            self.on_open(campaign, store)
+        store.load()
+        if self._started:
+            store.start()
+        self.opened += 1
+        return store
+
+    def store(self, campaign_id=None):
+        """SlotStore кампании (None — активной); при первом обращении шард читается с диска."""
+        campaign = self.get(campaign_id)
+        store = self._stores.get(campaign.id)
+        if store is None:
+            store = self._stores[campaign.id] = self._open(campaign)
+        self._last_used[campaign.id] = time.monotonic()
+        return store
+
+    def loaded(self):
+        """Открытые сейчас шарды: {campaign_id: SlotStore}. Время обращения не обновляется."""
+        return dict(self._stores)
+
+    # --- индекс записей ---
+
+    def _update_bookings(self, campaign_id, store, user_ids):
+        for user_id in user_ids:
+            reg = store.registration_for(user_id)
+            entries = self._bookings.get(user_id)
+            if reg:
+                slot_dt = store.availability.slot_datetime(reg.get('date'), reg.get('time'))
+                self._bookings.setdefault(user_id, {})[campaign_id] = (reg, slot_dt)
+            elif entries is not None:
+                entries.pop(campaign_id, None)
+                if not entries:
+                    del self._bookings[user_id]
+
+    def _forget_bookings(self, campaign_id):
+        for user_id in [uid for uid, entries in self._bookings.items() if campaign_id in entries]:
+            entries = self._bookings[user_id]
+            del entries[campaign_id]
+            if not entries:
+                del self._bookings[user_id]
+
+    def find_registration(self, user_id, now=None):
+        """Предстоящая запись пользователя в любой кампании: (campaign_id, registration) или (None, None).
+
+        Смотрит только индекс записей, шарды не открывает. Записи на уже
+        начавшиеся слоты не считаются; при нескольких записях первой идёт
+        активная кампания.
+        """
+        entries = self._bookings.get(user_id)
+        if not entries:
+            return None, None
+        now = now or datetime.datetime.now()
+        for campaign_id in sorted(entries, key=lambda cid: cid != self.active_id):
+            reg, slot_dt = entries[campaign_id]
+            if slot_dt is None or slot_dt > now:
+                return campaign_id, reg
+        return None, None
+
+    def index_all(self):
+        """Открыть шарды всех кампаний, чтобы заполнить индекс записей (при старте).
+
+        Неактивные шарды потом выгрузятся по idle_ttl как обычно. Возвращает
+        {campaign_id: SlotStore} всех кампаний.
+        """
+        return {campaign_id: self.store(campaign_id) for campaign_id in self._campaigns}
+
+    def disk_counts(self):
+        """{campaign_id: (чтения, записи)} слотов с запуска, включая уже выгруженные шарды."""
+        counts = {cid: tuple(closed) for cid, closed in self._closed_disk.items()}
+        for cid, store in self._stores.items():
+            reads, writes = counts.get(cid, (0, 0))
+            counts[cid] = (reads + store.disk_reads, writes + store.disk_writes)
+        return counts
+
+    def _count_closed(self, cid, store):
+        closed = self._closed_disk.setdefault(cid, [0, 0])
+        closed[0] += store.disk_reads
+        closed[1] += store.disk_writes
+
+    async def evict_idle(self, now=None):
+        """Выгрузить неактивные шарды, к которым не обращались дольше idle_ttl. Возвращает их id."""
+        now = time.monotonic() if now is None else now
+        idle = [
+            cid for cid in self._stores
+            if cid != self.active_id and now - self._last_used.get(cid, 0) >= self.idle_ttl
+        ]
+        for cid in idle:
+            store = self._stores.pop(cid)
+            self._last_used.pop(cid, None)
+            try:
+                await store.close()
+            except Exception:
+                logger.exception('Не удалось сохранить шард кампании %s', cid)
+            self._count_closed(cid, store)
+            self.evicted += 1
+        return idle
+
+    async def _evict_loop(self):
+        while True:
+            await asyncio.sleep(max(self.idle_ttl / 2, 1))
+            await self.evict_idle()
+
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        for store in self._stores.values():
+            store.start()
+        if self.idle_ttl > 0:
+            self._task = asyncio.create_task(self._evict_loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for cid, store in list(self._stores.items()):
+            try:
+                await store.close()
+            except Exception:
+                logger.exception('Не удалось сохранить шард кампании %s', cid)
+            self._count_closed(cid, store)
+        self._stores.clear()
+        self._last_used.clear()
+        self._started = False
@@ -0,0 +1,145 @@
+import csv
+import datetime
+import gzip
+import io
+import shlex
+import tempfile
+
+from aiogram.types import InputFile
+
+from availability import parse_slot_datetime
+
+COLUMNS = ['user_id', 'full_name', 'vk_link', 'direction', 'date', 'time', 'registered_at']
+
+# До этого размера выгрузка держится в памяти, дальше SpooledTemporaryFile уходит на диск
+SPOOL_MAX_SIZE = 1024 * 1024
+
+
+class ExportError(Exception):
+    pass
+
+
+class SpooledInputFile(InputFile):
+    """InputFile для aiogram, который отдаёт уже готовый временный файл кусками и закрывает его."""
+
+    def __init__(self, file, filename, chunk_size=64 * 1024):
+        super().__init__(filename=filename, chunk_size=chunk_size)
+        self.file = file
+
+    async def read(self, bot):
+        self.file.seek(0)
+        try:
+            while chunk := self.file.read(self.chunk_size):
+                yield chunk
+        finally:
+            self.file.close()
+
+
+def parse_export_args(text):
+    """Разбор аргументов /export: csv|xlsx, gz, dir=<направление>, from=ДД.ММ.ГГГГ, to=ДД.ММ.ГГГГ,
+    campaign=<id кампании> (по умолчанию — активная).
+
+    Направление с пробелами пишется в кавычках: dir="F&U prod.".
+    """
+    options = {'fmt': 'csv', 'compress': False, 'direction': None, 'date_from': None, 'date_to': None, 'campaign': None}
+    try:
+        tokens = shlex.split(text or '')[1:]
+    except ValueError as e:
+        raise ExportError(f'Не удалось разобрать аргументы: {e}')
+    for token in tokens:
+        key, _, value = token.partition('=')
+        key = key.lower()
+        if not value and key in ('csv', 'xlsx'):
+            options['fmt'] = key
+        elif not value and key in ('gz', 'gzip'):
+            options['compress'] = True
+        elif key == 'dir':
+            options['direction'] = value
+        elif key == 'campaign':
+            options['campaign'] = value
+        elif key in ('from', 'to'):
+            try:
+                day = datetime.datetime.strptime(value, '%d.%m.%Y').date()
+            except ValueError:
+                raise ExportError(f'Дата должна быть в формате ДД.ММ.ГГГГ: {value}')
+            options['date_from' if key == 'from' else 'date_to'] = day
+        else:
+            raise ExportError(f'Неизвестный аргумент: {token}')
+    if options['fmt'] == 'xlsx' and options['compress']:
+        # xlsx — уже zip-архив, gzip поверх него ничего не даёт
+        raise ExportError('XLSX уже сжат, gz с ним не используется: /export xlsx или /export csv gz.')
+    return options
+
+
+def _matches(reg, direction, date_from, date_to):
+    if direction and reg.get('direction') != direction:
+        return False
+    if date_from or date_to:
+        try:
+            day = parse_slot_datetime(reg.get('date') or '', reg.get('time') or '').date()
+        except ValueError:
+            return False
+        if date_from and day < date_from:
+            return False
+        if date_to and day > date_to:
+            return False
+    return True
+
+
+def _rows(regs, direction, date_from, date_to):
+    for r in regs:
+        if _matches(r, direction, date_from, date_to):
+            yield [r.get(c) for c in COLUMNS]
+
+
+def _write_csv(out, rows, compress):
+    raw = gzip.GzipFile(fileobj=out, mode='wb') if compress else out
+    text = io.TextIOWrapper(raw, encoding='utf-8', newline='', write_through=True)
+    writer = csv.writer(text)
+    writer.writerow(COLUMNS)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    text.flush()
+    text.detach()
+    if compress:
+        raw.close()
+    return count
+
+
+def _write_xlsx(out, rows):
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise ExportError('Для выгрузки в XLSX нужен пакет openpyxl (pip install openpyxl).')
+    # write_only-книга пишет строки потоком, не держа всю таблицу в памяти
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('registrations')
+    ws.append(COLUMNS)
+    count = 0
+    for row in rows:
+        ws.append(row)
+        count += 1
+    wb.save(out)
+    return count
+
+
+def build_export(regs, fmt='csv', compress=False, direction=None, date_from=None, date_to=None):
+    """Собрать выгрузку во временный файл. Блокирующая — вызывать через asyncio.to_thread.
+
+    Возвращает (InputFile, число строк).
+    """
+    out = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    rows = _rows(regs, direction, date_from, date_to)
+    try:
+        if fmt == 'xlsx':
+            count = _write_xlsx(out, rows)
+            filename = 'registrations.xlsx'
+        else:
+            count = _write_csv(out, rows, compress)
+            filename = 'registrations.csv.gz' if compress else 'registrations.csv'
+    except BaseException:
+        out.close()
+        raise
+    return SpooledInputFile(out, filename), count
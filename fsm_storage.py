@@ -0,0 +1,158 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fsm (
+    key TEXT PRIMARY KEY,
+    state TEXT,
+    data TEXT NOT NULL
+)
+"""
+
+
+def _key(key: StorageKey) -> str:
+    return ':'.join(str(part) for part in (
+        key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny,
+    ))
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище aiogram в локальном SQLite (WAL).
+
+    Состояния и данные анкеты (name, vk, direction, date) переживают
+    перезапуск бота. Чтение идёт через кэш в памяти: база читается только
+    при первом обращении к ключу. Запись попадает в кэш сразу, а в базу —
+    пачкой одной транзакцией раз в commit_interval секунд (и при close()),
+    поэтому накладные расходы на апдейт почти как у MemoryStorage.
+    """
+
+    def __init__(self, path: str = 'fsm.sqlite3', commit_interval: float = 0.5):
+        self.path = path
+        self.commit_interval = commit_interval
+        # отдельные соединения на чтение (event loop) и на запись (поток flush) — в WAL они друг другу не мешают
+        self._writer = sqlite3.connect(path, check_same_thread=False)
+        self._writer.execute('PRAGMA journal_mode=WAL')
+        self._writer.execute('PRAGMA synchronous=NORMAL')
+        self._writer.execute(_SCHEMA)
+        self._writer.commit()
+        self._reader = sqlite3.connect(path)
+        self._write_lock = threading.Lock()
+        # key -> (state, data)
+        self._cache: Dict[str, tuple] = {}
+        self._dirty = set()
+        self._task = None
+        self._wakeup = None
+        # счётчики для диагностики
+        self.db_reads = 0
+        self.commits = 0
+
+    # --- кэш ---
+
+    def _load(self, key: str) -> tuple:
+        record = self._cache.get(key)
+        if record is None:
+            row = self._reader.execute('SELECT state, data FROM fsm WHERE key = ?', (key,)).fetchone()
+            self.db_reads += 1
+            record = (row[0], json.loads(row[1])) if row else (None, {})
+            self._cache[key] = record
+        return record
+
+    def _store(self, key: str, state, data):
+        self._cache[key] = (state, data)
+        self._dirty.add(key)
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._commit_loop())
+        self._wakeup.set()
+
+    # --- BaseStorage ---
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        k = _key(key)
+        _, data = self._load(k)
+        self._store(k, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return self._load(_key(key))[0]
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(
+                f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            )
+        k = _key(key)
+        state, _ = self._load(k)
+        self._store(k, state, data.copy())
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return self._load(_key(key))[1].copy()
+
+    # --- запись в базу ---
+
+    def _take_batch(self):
+        rows = []
+        for key in self._dirty:
+            state, data = self._cache[key]
+            rows.append((key, state, json.dumps(data, ensure_ascii=False)))
+        self._dirty = set()
+        return rows
+
+    def _commit(self, rows):
+        with self._write_lock:
+            upserts = [r for r in rows if r[1] is not None or r[2] != '{}']
+            deletes = [(r[0],) for r in rows if r[1] is None and r[2] == '{}']
+            with self._writer:
+                if upserts:
+                    self._writer.executemany(
+                        'INSERT INTO fsm (key, state, data) VALUES (?, ?, ?) '
+                        'ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data',
+                        upserts,
+                    )
+                if deletes:
+                    # пустая запись (state.clear()) — строку не храним
+                    self._writer.executemany('DELETE FROM fsm WHERE key = ?', deletes)
+            self.commits += 1
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        rows = self._take_batch()
+        try:
+            await asyncio.to_thread(self._commit, rows)
+        except Exception:
+            # вернём ключи в очередь, данные всё ещё в кэше
+            self._dirty.update(r[0] for r in rows)
+            raise
+
+    async def _commit_loop(self):
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.commit_interval)
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception('Не удалось сохранить FSM-состояния в %s', self.path)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._dirty:
+            self._commit(self._take_batch())
+        self._reader.close()
+        self._writer.close()
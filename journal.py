@@ -0,0 +1,217 @@
+"""Журнал событий бота в формате JSON Lines.
+
+Каждая строка — одно событие: {"ts": ..., "type": ..., ...}. Типы событий:
+
+    registration  — запись кандидата (поле reg — регистрация целиком)
+    cancellation  — отмена записи (reg)
+    sync          — синхронизация с Google Sheets (grid — новая сетка, dropped — снятые записи)
+    retire        — прошедшие слоты убраны в архив (slots — [[date, time], ...], registrations — сколько записей)
+    export        — выгрузка регистраций (by, fmt, rows)
+    publish       — публикация меню направлений (by, chat_id, message_id)
+
+У событий registration, cancellation, sync и retire есть поле campaign —
+кампания набора (см. campaigns.py), к шарду которой они относятся.
+
+Восстановить слоты и регистрации по журналу (например, после падения —
+поверх последнего сохранённого slots.json):
+
+    python journal.py replay events.jsonl --base slots.json --out slots.json
+    python journal.py replay events.jsonl --campaign autumn-2025 --base campaigns/autumn-2025/slots.json ...
+"""
+import argparse
+import asyncio
+import datetime
+import glob
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = ('registration', 'cancellation', 'sync', 'retire', 'export', 'publish')
+
+
+class Journal:
+    """Асинхронный буферизованный журнал.
+
+    emit() только добавляет строку в буфер. Фоновая задача раз в
+    flush_interval секунд дописывает накопленное одним write и одним fsync
+    (в отдельном потоке). Когда файл вырастает больше max_bytes, он
+    ротируется: events.jsonl -> events.jsonl.1 -> ... -> events.jsonl.<backups>.
+    """
+
+    def __init__(self, path='events.jsonl', flush_interval=0.5, max_bytes=10 * 1024 * 1024, backups=5):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._buffer = []
+        self._task = None
+        self._wakeup = None
+        self._write_lock = asyncio.Lock()
+
+    # --- события ---
+
+    def emit(self, event_type, **fields):
+        if event_type not in EVENT_TYPES:
+            raise ValueError(f'Неизвестный тип события: {event_type}')
+        event = {'ts': datetime.datetime.now().isoformat(), 'type': event_type, **fields}
+        self._buffer.append(json.dumps(event, ensure_ascii=False, default=str) + '\n')
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def registration(self, reg, campaign=None):
+        self.emit('registration', campaign=campaign, reg=reg)
+
+    def cancellation(self, reg, campaign=None):
+        self.emit('cancellation', campaign=campaign, reg=reg)
+
+    def sync(self, grid, dropped, campaign=None):
+        self.emit('sync', campaign=campaign, grid=grid, dropped=dropped)
+
+    def retire(self, retired, campaign=None):
+        slots = [[item['date'], item['time']] for item in retired]
+        registrations = sum(len(item['registrations']) for item in retired)
+        self.emit('retire', campaign=campaign, slots=slots, registrations=registrations)
+
+    def export(self, by, fmt, rows):
+        self.emit('export', by=by, fmt=fmt, rows=rows)
+
+    def publish(self, by, chat_id, message_id):
+        self.emit('publish', by=by, chat_id=chat_id, message_id=message_id)
+
+    # --- запись ---
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            src = f'{self.path}.{i}'
+            if os.path.exists(src):
+                os.replace(src, f'{self.path}.{i + 1}')
+        os.replace(self.path, f'{self.path}.1')
+
+    def _write(self, lines):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        if self.backups and size > self.max_bytes:
+            self._rotate()
+
+    async def flush(self):
+        async with self._write_lock:
+            if not self._buffer:
+                return
+            lines, self._buffer = self._buffer, []
+            try:
+                await asyncio.to_thread(self._write, lines)
+            except Exception:
+                self._buffer[:0] = lines
+                raise
+
+    async def _flush_loop(self):
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception('Не удалось записать журнал %s', self.path)
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            if self._buffer:
+                self._wakeup.set()
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._wakeup = None
+        await self.flush()
+
+
+# --- восстановление состояния ---
+
+def journal_files(path):
+    """Файлы журнала от самого старого к самому новому."""
+    rotated = [p for p in glob.glob(glob.escape(path) + '.*') if p.rsplit('.', 1)[1].isdigit()]
+    rotated.sort(key=lambda p: int(p.rsplit('.', 1)[1]), reverse=True)
+    return rotated + ([path] if os.path.exists(path) else [])
+
+
+def read_events(path, since=None):
+    for file_path in journal_files(path):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                event = json.loads(line)
+                if since and event['ts'] <= since:
+                    continue
+                yield event
+
+
+async def replay(store, events, campaign=None):
+    """Применить события к store. Возвращает число применённых событий по типам.
+
+    campaign — применять только события этой кампании (события без поля campaign
+    записаны до появления кампаний и относятся к 'default').
+    """
+    applied = {}
+    for event in events:
+        kind = event['type']
+        if campaign is not None and (event.get('campaign') or 'default') != campaign:
+            continue
+        if kind == 'registration':
+            reg = event['reg']
+            ok = await store.try_book(reg['date'], reg['time'], reg['direction'], reg['user_id'], reg)
+        elif kind == 'cancellation':
+            reg = event['reg']
+            ok = await store.release(reg['date'], reg['time'], reg['direction'], reg['user_id'])
+        elif kind == 'sync':
+            store.apply_grid(event['grid'])
+            ok = True
+        elif kind == 'retire':
+            ok = bool(store.retire([tuple(key) for key in event['slots']]))
+        else:
+            ok = False
+        if ok:
+            applied[kind] = applied.get(kind, 0) + 1
+    return applied
+
+
+def main():
+    from slot_store import SlotStore
+
+    parser = argparse.ArgumentParser(description='Инструменты журнала событий')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_replay = sub.add_parser('replay', help='восстановить слоты и регистрации по журналу')
+    p_replay.add_argument('journal', help='путь к events.jsonl (ротированные .1, .2, ... подхватываются сами)')
+    p_replay.add_argument('--base', help='slots.json, поверх которого применять события (по умолчанию — пустое состояние)')
+    p_replay.add_argument('--since', help='применять только события новее этого времени (ISO, как в поле ts)')
+    p_replay.add_argument('--campaign', help='только события этой кампании')
+    p_replay.add_argument('--out', default='slots.replayed.json', help='куда записать результат')
+    args = parser.parse_args()
+
+    store = SlotStore(args.out)
+    if args.base:
+        with open(args.base, 'r', encoding='utf-8') as f:
+            store.replace(json.load(f))
+    else:
+        store.replace({'slots': {}, 'registrations': []})
+    applied = asyncio.run(replay(store, read_events(args.journal, since=args.since), campaign=args.campaign))
+    store.flush()
+    print(f'Применено событий: {applied}; регистраций в результате: {len(store.snapshot()["registrations"])}')
+
+
+if __name__ == '__main__':
+    main()
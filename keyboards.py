@@ -0,0 +1,74 @@
+"""Готовые клавиатуры анкеты: направления, даты, времена и опубликованное меню.
+
+Клавиатура собирается один раз и дальше отдаётся из кэша, пока не
+изменится версия, от которой она зависит: для дат и времён — версия
+свободных слотов направления в индексе шарда (AvailabilityIndex.version),
+для опубликованного меню — версия всего индекса, для reply-клавиатуры
+направлений — сам список направлений кампании. Так сборка клавиатуры
+оплачивается один раз на изменение слотов, а не на каждое сообщение, и все
+хендлеры видят одно и то же.
+
+Разметка aiogram в кэше общая для всех сообщений — менять её на месте нельзя.
+"""
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+
+
+def reply_keyboard(labels):
+    """Reply-клавиатура по кнопке в строке; None, если кнопок нет."""
+    if not labels:
+        return None
+    return ReplyKeyboardMarkup(keyboard=[[KeyboardButton(text=label)] for label in labels], resize_keyboard=True)
+
+
+class KeyboardCache:
+    """Кэш клавиатур: на каждый ключ хранится одна клавиатура и версия, по которой она собрана.
+
+    Устаревшая клавиатура не копится рядом с новой, а заменяется, так что
+    размер кэша ограничен числом пар (кампания, направление, дата).
+    """
+
+    def __init__(self):
+        # key -> (version, markup)
+        self._entries = {}
+        # счётчики для диагностики
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version, build):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        markup = build()
+        self._entries[key] = (version, markup)
+        return markup
+
+    def __len__(self):
+        return len(self._entries)
+
+    def directions(self, campaign):
+        """Reply-клавиатура со всеми направлениями кампании (шаг после VK)."""
+        directions = tuple(campaign.directions)
+        return self.get(('directions', campaign.id), directions, lambda: reply_keyboard(directions))
+
+    def published(self, campaign, index):
+        """Inline-меню направлений, у которых есть свободные слоты (опубликованное сообщение, /directions)."""
+        directions = tuple(campaign.directions)
+
+        def build():
+            return InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(text=d, callback_data=f'dir:{d}')] for d in directions if index.has_free(d)
+            ])
+
+        return self.get(('published', campaign.id), (directions, index.version()), build)
+
+    def dates(self, campaign_id, index, direction):
+        """Свободные даты направления; None — дат нет."""
+        return self.get(('dates', campaign_id, direction), index.version(direction),
+                        lambda: reply_keyboard(index.free_dates(direction)))
+
+    def times(self, campaign_id, index, direction, date):
+        """Свободные времена направления на дату; None — времени нет."""
+        return self.get(('times', campaign_id, direction, date), index.version(direction),
+                        lambda: reply_keyboard(index.free_times(direction, date)))
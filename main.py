@@ -1,29 +1,94 @@
+import sys
+if __name__ == '__main__' and '--profile-startup' in sys.argv:
+    # python main.py --profile-startup — время импорта и прогрева по компонентам, бот не запускается (см. startup.py)
+    import startup
+    sys.exit(startup.profile())
 import json
 from aiogram import Bot, Dispatcher, Router, types
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton, InputFile
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, InputFile
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.filters.state import StateFilter
 from aiogram.filters import Command
+from aiogram.exceptions import TelegramRetryAfter
+import asyncio
 import datetime
 import os
-import gspread
-from google.oauth2.service_account import Credentials
+from time import perf_counter
 from dotenv import load_dotenv, find_dotenv
+from campaigns import Campaign, CampaignRegistry
+import sheets
+from sync import SheetsSync, SyncError
+from publisher import DirectionsPublisher
+from notify import Notifier
+from fsm_storage import SQLiteStorage
+from export import build_export, parse_export_args, ExportError
+from journal import Journal
+from sweeper import ExpirySweeper
+from keyboards import KeyboardCache
+from reminders import ReminderScheduler
+from waitlist import Waitlist
+from throttle import ThrottleMiddleware
+import metrics
 load_dotenv()
 API_TOKEN = os.getenv('BOT_TOKEN')
 ADMIN_ID = 922109605
 
 SLOTS_FILE = 'slots.json'
+# Как часто (в секундах) накопленные изменения слотов сбрасываются на диск
+SLOTS_FLUSH_INTERVAL = float(os.getenv('SLOTS_FLUSH_INTERVAL', '1.0'))
+# Как часто (в секундах) бот сам опрашивает Google Sheets; 0 — только вручную через /get_slots
+SHEETS_SYNC_INTERVAL = float(os.getenv('SHEETS_SYNC_INTERVAL', '300'))
+# Окно (в секундах), за которое все изменения слотов склеиваются в одно редактирование опубликованного сообщения
+PUBLISH_DEBOUNCE = float(os.getenv('PUBLISH_DEBOUNCE', '3.0'))
+# Локальный HTTP-эндпоинт /metrics (формат Prometheus); 0 — не поднимать
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
 
 bot = Bot(token=API_TOKEN)
-storage = MemoryStorage()
+# FSM-состояния по умолчанию хранятся в SQLite и переживают перезапуск; FSM_STORAGE=memory — старое поведение
+if os.getenv('FSM_STORAGE', 'sqlite') == 'memory':
+    storage = MemoryStorage()
+else:
+    storage = SQLiteStorage(os.getenv('FSM_DB', 'fsm.sqlite3'))
 dp = Dispatcher(storage=storage)
 router = Router()
 
+# Двойные нажатия и повторно присланные даты отсекаются до хендлеров (см. throttle.py):
+# одинаковые апдейты за DUPLICATE_WINDOW секунд склеиваются, сверх THROTTLE_RATE/с (THROTTLE_BURST подряд) —
+# «подождите». 0 — выключить соответствующую проверку; на админа ограничения не действуют
+throttle = ThrottleMiddleware(
+    rate=float(os.getenv('THROTTLE_RATE', '2.0')),
+    burst=int(os.getenv('THROTTLE_BURST', '10')),
+    window=float(os.getenv('DUPLICATE_WINDOW', '2.0')),
+    exempt=(ADMIN_ID,),
+)
+dp.message.outer_middleware(throttle)
+dp.callback_query.outer_middleware(throttle)
+
+# Уведомления админу уходят через очередь: ответ кандидату не ждёт доставки, а чат админа не упирается в лимиты.
+# Несколько событий за ADMIN_DIGEST_WINDOW секунд склеиваются в одно сообщение (0 — без склейки).
+notifier = Notifier(
+    lambda: bot,
+    rate=float(os.getenv('ADMIN_NOTIFY_RATE', '1.0')),
+    burst=int(os.getenv('ADMIN_NOTIFY_BURST', '3')),
+    digest_window=float(os.getenv('ADMIN_DIGEST_WINDOW', '0')),
+)
+# Напоминания кандидатам — своя очередь: в каждый чат не чаще раза в секунду и не больше REMINDER_RATE сообщений в секунду всего
+reminder_sender = Notifier(lambda: bot, rate=1.0, burst=1, total_rate=float(os.getenv('REMINDER_RATE', '20')))
+
+# Направления кампании по умолчанию; у кампаний из campaigns.json свои списки
 DIRECTIONS = ['ЦТ', 'Фото', 'СМИ', 'Дизайн', 'F&U prod.']
 
+# Записаться можно не позднее чем за 12 часов, отменить — не позднее чем за 24 часа.
+# Слоты переходят за отсечки заранее, в фоне (см. sweeper.py), хендлеры только сверяются с индексом
+BOOKING_CUTOFF = datetime.timedelta(hours=12)
+CANCEL_CUTOFF = datetime.timedelta(hours=24)
+# Через сколько секунд после начала слот уходит в архив кампании; как часто sweeper проходит по слотам, если отсечек впереди нет
+SLOT_RETIRE_AFTER = datetime.timedelta(seconds=float(os.getenv('SLOT_RETIRE_AFTER', '7200')))
+SWEEP_INTERVAL = float(os.getenv('SWEEP_INTERVAL', '300'))
+
 class Form(StatesGroup):
     name = State()
     vk = State()
@@ -33,47 +98,90 @@ class Form(StatesGroup):
 
 # Файл для хранения опубликованного сообщения с направлениями
 PUBLISHED_FILE = 'published.json'
-LOG_FILE = 'bot.log'
+# Журнал событий (JSON Lines, см. journal.py); ротируется по размеру
+EVENTS_FILE = os.getenv('EVENTS_FILE', 'events.jsonl')
+journal = Journal(EVENTS_FILE)
 
 # Загрузка слотов
+# Кампании набора (см. campaigns.py): у каждой свои направления, таблица и шард слотов.
+# Шард читается с диска при первом обращении, дальше живёт в памяти (см. slot_store.py);
+# неактивные кампании через CAMPAIGN_IDLE_TTL секунд простоя выгружаются.
+# Без campaigns.json — одна кампания 'default' со старыми файлами slots.json и published.json.
+# Если задан SLOTS_DB, её слоты хранятся в SQLite (при первом запуске импортируются из slots.json).
+SLOTS_DB = os.getenv('SLOTS_DB')
+CAMPAIGNS_FILE = os.getenv('CAMPAIGNS_FILE', 'campaigns.json')
+CAMPAIGN_IDLE_TTL = float(os.getenv('CAMPAIGN_IDLE_TTL', '600'))
+
+
+def setup_shard(campaign, store):
+    metrics.instrument(store, ['load', '_write', 'apply_grid'], 'slot_store_seconds')
+    store.availability.set_cutoffs(BOOKING_CUTOFF, CANCEL_CUTOFF)
+
+
+campaigns = CampaignRegistry(
+    CAMPAIGNS_FILE,
+    default=Campaign(
+        'default',
+        directions=DIRECTIONS,
+        sheet_id=os.getenv('SHEET_ID'),
+        slots_file=SLOTS_FILE,
+        slots_db=SLOTS_DB,
+        published_file=PUBLISHED_FILE,
+        archive_file=os.getenv('SLOTS_ARCHIVE', 'slots_archive.jsonl'),
+    ),
+    flush_interval=SLOTS_FLUSH_INTERVAL,
+    idle_ttl=CAMPAIGN_IDLE_TTL,
+    on_open=setup_shard,
+)
+
+
+def active_store():
+    return campaigns.store()
+
+
+def has_registration(user_id):
+    # предстоящая запись в любой кампании; только по индексу реестра, шарды не открываются
+    return campaigns.find_registration(user_id)[1] is not None
+
+
+def user_campaign(data):
+    # кандидат заполняет анкету в той кампании, где нажал /start, даже если активную успели переключить
+    campaign_id = data.get('campaign')
+    if campaign_id not in campaigns.ids():
+        campaign_id = None
+    return campaigns.get(campaign_id)
+
+
+def user_store(data):
+    return campaigns.store(user_campaign(data).id)
+
 
 def load_slots():
-    with open(SLOTS_FILE, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    # слепок в формате slots.json; для точечных запросов используйте методы store
+    return active_store().snapshot()
 
 def save_slots(data):
-    with open(SLOTS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    active_store().replace(data)
 
 
 def load_published():
-    if not os.path.exists(PUBLISHED_FILE):
+    path = campaigns.active.published_file
+    if not os.path.exists(path):
         return {}
-    with open(PUBLISHED_FILE, 'r', encoding='utf-8') as f:
+    with open(path, 'r', encoding='utf-8') as f:
         return json.load(f)
 
 def save_published(data):
-    with open(PUBLISHED_FILE, 'w', encoding='utf-8') as f:
+    with open(campaigns.active.published_file, 'w', encoding='utf-8') as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
 
 
-def log_action(text: str):
-    ts = datetime.datetime.now().isoformat()
-    with open(LOG_FILE, 'a', encoding='utf-8') as f:
-        f.write(f"[{ts}] {text}\n")
-
-
-def export_registrations_csv():
-    slots = load_slots()
-    regs = slots.get('registrations', [])
-    import io, csv
-    buf = io.StringIO()
-    writer = csv.writer(buf)
-    writer.writerow(['user_id', 'full_name', 'vk_link', 'direction', 'date', 'time', 'registered_at'])
-    for r in regs:
-        writer.writerow([r.get('user_id'), r.get('full_name'), r.get('vk_link'), r.get('direction'), r.get('date'), r.get('time'), r.get('registered_at')])
-    buf.seek(0)
-    return buf
+async def export_registrations(campaign=None, **options):
+    # список регистраций снимаем в event loop, а CSV/XLSX собираем в отдельном потоке во временный файл
+    if campaign is not None and campaign not in campaigns.ids():
+        raise ExportError(f'Нет кампании {campaign}. Есть: {", ".join(campaigns.ids())}')
+    regs = list(campaigns.store(campaign).iter_registrations())
+    return await asyncio.to_thread(build_export, regs, **options)
 
 
 def build_sheets_service():
@@ -81,165 +189,132 @@ def build_sheets_service():
     return None
 
 
+def format_dropped(regs):
+    lines = [
+        f"{r.get('full_name')} (TG {r.get('user_id')}, VK {r.get('vk_link')}) — {r.get('direction')}, {r.get('date')} {r.get('time')}"
+        for r in regs
+    ]
+    return 'Слоты этих кандидатов закрыты в таблице, их записи сняты — свяжитесь с ними:\n' + '\n'.join(lines)
+
+
+async def on_sheets_change(result):
+    # вызывается и фоновым опросом, и /get_slots — только когда таблица реально изменилась
+    journal.sync(result['grid'], result['dropped'], campaign=campaigns.active_id)
+    if result['dropped']:
+        notifier.send(ADMIN_ID, format_dropped(result['dropped']))
+        for reg in result['dropped']:
+            reminders.remove(campaigns.active_id, reg)
+    if result['flipped']:
+        await update_published_message()
+    # в сетке могли появиться слоты с более близкими отсечками
+    sweeper.wake()
+
+
+async def on_sweep_flip(campaign_id, directions):
+    # у направления не осталось времени, на которое ещё можно записаться, — меню надо перерисовать
+    if campaign_id == campaigns.active_id:
+        await update_published_message()
+
+
+def format_reminder(reg, offset):
+    hours = int(offset.total_seconds() // 3600)
+    when = f'через {hours} ч' if hours else f'через {int(offset.total_seconds() // 60)} мин'
+    return (
+        f"Напоминаем: {when} у вас собеседование.\nНаправление: {reg.get('direction')}\n"
+        f"Дата: {reg.get('date')}\nВремя: {reg.get('time')}\n"
+        'Если не получается прийти, напишите в группу.'
+    )
+
+
+# Напоминания о собеседовании за REMINDER_OFFSETS часов (через запятую); отправленные помнятся в REMINDERS_FILE
+REMINDER_OFFSETS = [
+    datetime.timedelta(hours=float(h)) for h in os.getenv('REMINDER_OFFSETS', '24,1').split(',') if h.strip()
+]
+reminders = ReminderScheduler(
+    reminder_sender.send,
+    format_reminder,
+    REMINDER_OFFSETS,
+    sent_path=os.getenv('REMINDERS_FILE', 'reminders_sent.json'),
+)
+
+
+# Лист ожидания: освободившийся слот держится за первым в очереди WAITLIST_HOLD секунд
+WAITLIST_HOLD = float(os.getenv('WAITLIST_HOLD', '300'))
+waitlist = Waitlist(hold=WAITLIST_HOLD, on_lapse=lambda lease: on_waitlist_lapse(lease),
+                    on_skip=lambda key, user_id, entry: on_waitlist_skip(key, user_id, entry))
+
+
+def on_waitlist_skip(key, user_id, entry):
+    # кандидат успел записаться сам, пока стоял в очереди, — из листа ожидания он выбыл, сообщаем об этом
+    _, direction, date = key
+    what = f'{direction}, {date}' if date else direction
+    reminder_sender.send(entry['chat_id'], f'Вы выбыли из листа ожидания ({what}): у вас уже есть запись. '
+                                           'Встать в очередь снова можно после отмены записи.')
+
+
+def on_sweep_retire(campaign_id, retired):
+    journal.retire(retired, campaign=campaign_id)
+    for slot in retired:
+        for reg in slot['registrations']:
+            reminders.remove(campaign_id, reg)
+
+
+sweeper = ExpirySweeper(
+    campaigns.loaded,
+    archive_path=lambda campaign_id: campaigns.get(campaign_id).archive_file,
+    retire_after=SLOT_RETIRE_AFTER,
+    interval=SWEEP_INTERVAL,
+    on_flip=on_sweep_flip,
+    on_retire=on_sweep_retire,
+)
+
+
+
+def make_sheets_sync(campaign):
+    return SheetsSync(
+        campaigns.store(campaign.id),
+        campaign.directions,
+        campaign.sheet_id,
+        interval=SHEETS_SYNC_INTERVAL,
+        on_change=on_sheets_change,
+        titles=campaign.sheets,
+        keep=sweeper.is_current,
+    )
+
+
+# Синхронизируется только активная кампания; создаётся при старте и пересоздаётся при её смене
+sheets_sync = None
+
+
 @router.message(Command('get_slots'))
 async def cmd_get_slots(message: types.Message):
     if message.from_user.id != ADMIN_ID:
         await message.answer('Только админ может обновлять слоты из Google Sheets')
         return
     await message.answer('Начинаю парсинг Google Sheets...')
-    # Параметры: ожидаем, что админ предварительно подставит ID таблицы в переменную окружения SHEET_ID
-    sheet_id = os.getenv('SHEET_ID')
-    if not sheet_id:
-        await message.answer('Переменная окружения SHEET_ID не задана.')
+    # Параметры: ID таблицы берётся из описания кампании (для кампании по умолчанию — из переменной окружения SHEET_ID)
+    if not sheets_sync.sheet_id:
+        await message.answer('Для активной кампании не задан ID таблицы (SHEET_ID).')
         return
-    # Открываем gspread через service account
+    # Все обращения к Google идут в отдельном потоке (см. sync.py), применяется только diff изменённых ячеек
     try:
-        # Prefer gspread helper which configures scopes automatically from service account file
-        try:
-            gc = gspread.service_account(filename='credentials.json')
-        except Exception:
-            # Fallback: explicitly set scopes for google oauth credentials
-            creds = Credentials.from_service_account_file(
-                'credentials.json',
-                scopes=['https://www.googleapis.com/auth/spreadsheets',
-                        'https://www.googleapis.com/auth/drive']
-            )
-            gc = gspread.authorize(creds)
-        sh = gc.open_by_key(sheet_id)
-        # Выбираем конкретный лист: сначала пробуем имя из SHEET_NAME, затем индекс из SHEET_INDEX (0-based).
-        # Если ни одна переменная не задана или открытие не удалось — используем первый лист (sheet1).
-        sheet_name = os.getenv('SHEET_NAME')
-        sheet_index = os.getenv('SHEET_INDEX')
-        if sheet_name:
-            try:
-                ws = sh.worksheet(sheet_name)
-            except Exception as e:
-                await message.answer(f'Не удалось открыть лист с именем "{sheet_name}": {e}. Будет использован первый лист.')
-                ws = sh.sheet1
-        elif sheet_index:
-            try:
-                idx = int(sheet_index)
-                ws = sh.get_worksheet(idx)
-            except Exception as e:
-                await message.answer(f'Не удалось открыть лист по индексу {sheet_index}: {e}. Будет использован первый лист.')
-                ws = sh.sheet1
-        else:
-            ws = sh.sheet1
-    except Exception as e:
-        await message.answer(f'Ошибка подключения к Google Sheets: {e}')
+        result = await sheets_sync.run_once(force=True)
+    except SyncError as e:
+        await message.answer(str(e))
         return
-
-    try:
-        # Собираем все листы, названия которых совпадают с нашими направлениями.
-        all_ws = sh.worksheets()
-        direction_sheets = [w for w in all_ws if w.title in DIRECTIONS]
-        if not direction_sheets:
-            await message.answer(f'Не найдено листов с названиями направлений. Ожидаемые имена: {DIRECTIONS}')
-            return
-
-        # Берём даты и времена с первого листа-направления (ожидается одинаковая структура на всех листах)
-        first_ws = direction_sheets[0]
-        dates = (first_ws.get('B1:G1') or [['']])[0]
-        times = [r[0] for r in (first_ws.get('A2:A13') or [['']])]
-
     except Exception as e:
-        await message.answer(f'Ошибка чтения диапазонов/листов: {e}')
+        await message.answer(f'Ошибка синхронизации с Google Sheets: {e}')
         return
-
-    # Preserve existing registrations if possible
-    old_slots = {}
-    try:
-        old_slots = load_slots()
-    except Exception:
-        old_slots = {'slots': {}, 'registrations': []}
-
-    # Инициализация структуры слотов для всех дат/времён и всех направлений
-    new_slots = {'slots': {}, 'registrations': []}
-    for date in dates:
-        date_key = date.strip()
-        new_slots['slots'][date_key] = {}
-        for time_slot in times:
-            new_slots['slots'][date_key][time_slot] = {d: None for d in DIRECTIONS}
-
-    # Проходим по каждому листу-направлению и заполняем blocked/available по B2:G13
-    for ws_dir in direction_sheets:
-        direction = ws_dir.title
-        try:
-            values = ws_dir.get('B2:G13') or []
-        except Exception:
-            values = []
-        for i, date in enumerate(dates):
-            date_key = date.strip()
-            for j, time_slot in enumerate(times):
-                cell_val = ''
-                try:
-                    cell_val = values[j][i]
-                except Exception:
-                    cell_val = ''
-                # Если в ячейке явно указано 'могу' (регистр игнорируем) — считаем доступным
-                # Во всех остальных случаях (пусто или 'не могу' и т.д.) — помечаем как blocked
-                if isinstance(cell_val, str) and cell_val.strip().lower() == 'могу':
-                    # оставляем None — доступно
-                    pass
-                else:
-                    # помечаем как blocked
-                    if date_key in new_slots['slots'] and time_slot in new_slots['slots'][date_key]:
-                        new_slots['slots'][date_key][time_slot][direction] = 'blocked'
-
     # Подробный отчёт по каждому листу, который мы парсим
-    report_lines = []
-    rows_count = len(times)  # ожидаем 12
-    cols_count = len(dates)  # ожидаем 6
-    total_cells_expected = rows_count * cols_count
-    for ws_dir in direction_sheets:
-        try:
-            vals = ws_dir.get('B2:G13') or []
-            # Считаем только ячейки, где явно встречается слово 'могу'
-            mogu_cells = []
-            for r_idx, row in enumerate(vals):
-                for c_idx, cell in enumerate(row):
-                    try:
-                        if isinstance(cell, str) and cell.strip().lower() == 'могу':
-                            mogu_cells.append((r_idx + 2, c_idx + 2))  # координаты в таблице (начиная с 1)
-                    except Exception:
-                        pass
-            mogu_count = len(mogu_cells)
-            report = f"{ws_dir.title}: прочитано {len(vals)} строк, всего ячеек {total_cells_expected}, 'могу' = {mogu_count}"
-            if mogu_count:
-                # включаем пару примеров координат для отладки
-                sample = ', '.join([f"({r},{c})" for r, c in mogu_cells[:6]])
-                report += f", примеры 'могу' в ячейках: {sample}"
-            report_lines.append(report)
-        except Exception as e:
-            report_lines.append(f"{ws_dir.title}: ошибка чтения ({e})")
-    try:
-        await message.answer('Отчёт парсинга: ' + '; '.join(report_lines))
-    except Exception:
-        pass
-
-    # Try to reattach previous registrations to the new_slots when date/time still exists
-    for reg in old_slots.get('registrations', []):
-        d = reg.get('date')
-        t = reg.get('time')
-        dirn = reg.get('direction')
-        if d in new_slots['slots'] and t in new_slots['slots'][d] and new_slots['slots'][d][t].get(dirn) is None:
-            # slot exists and free in new layout -> keep registration
-            new_slots['slots'][d][t][dirn] = reg.get('user_id')
-            new_slots['registrations'].append(reg)
-        else:
-            # otherwise drop the registration (admin will need to contact user)
-            pass
-
-    # Backup old slots.json
     try:
-        import shutil
-        shutil.copyfile(SLOTS_FILE, SLOTS_FILE + '.bak')
+        await message.answer('Отчёт парсинга: ' + '; '.join(result['report']))
     except Exception:
         pass
-
-    save_slots(new_slots)
-    await message.answer('Слоты обновлены из Google Sheets и файл slots.json перезаписан.')
-    await update_published_message()
+    timing_text = ', '.join(f'{k} {v * 1000:.0f} мс' for k, v in result['timings'].items())
+    await message.answer(
+        f"Слоты обновлены из Google Sheets: изменено ячеек {result['changed']}, снято записей {len(result['dropped'])}.\n"
+        f"Время: {timing_text}"
+    )
 
 
 @router.message(Command('list_sheets'))
@@ -247,82 +322,142 @@ async def cmd_list_sheets(message: types.Message):
     if message.from_user.id != ADMIN_ID:
         await message.answer('Только админ может посмотреть список листов.')
         return
-    sheet_id = os.getenv('SHEET_ID')
+    sheet_id = campaigns.active.sheet_id
     if not sheet_id:
-        await message.answer('Переменная окружения SHEET_ID не задана.')
+        await message.answer('Для активной кампании не задан ID таблицы (SHEET_ID).')
         return
     try:
-        try:
-            gc = gspread.service_account(filename='credentials.json')
-        except Exception:
-            creds = Credentials.from_service_account_file(
-                'credentials.json',
-                scopes=['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
-            )
-            gc = gspread.authorize(creds)
-        sh = gc.open_by_key(sheet_id)
-        sheets = sh.worksheets()
-        if not sheets:
+        sheet_list = await asyncio.to_thread(sheets.get_client().worksheets, sheet_id)
+        if not sheet_list:
             await message.answer('В таблице нет листов.')
             return
-        lines = [f"{i}: {ws.title}" for i, ws in enumerate(sheets)]
+        lines = [f"{i}: {ws.title}" for i, ws in enumerate(sheet_list)]
         # Если сообщение слишком длинное, можно отправить как документ. Пока отправляем текстом.
         await message.answer('Листы таблицы:\n' + '\n'.join(lines))
     except Exception as e:
         await message.answer(f'Ошибка при получении списка листов: {e}')
 
 
-def direction_has_free_slots(direction, slots):
-    # проверяем, есть ли хотя бы один свободный слот для направления
-    for date, times in slots.get('slots', {}).items():
-        for t, dirs in times.items():
-            if dirs.get(direction) is None:
-                return True
-    return False
-
-
-def parse_slot_datetime(date_str: str, time_str: str) -> datetime.datetime:
-    """Parse date and time strings into datetime. Strips weekday notes like '(сб)'.
-    Expected date format: 'DD.MM.YYYY' possibly with trailing '(...')
-    Expected time format: 'HH:MM' or similar; if time contains extra text, take first 5 chars.
-    """
-    # remove parenthesis with weekday e.g. '11.10.2025(сб)' -> '11.10.2025'
-    import re
-    d = re.sub(r"\s*\(.*\)$", "", date_str).strip()
-    t = time_str.strip()[:5]
-    return datetime.datetime.strptime(f"{d} {t}", "%d.%m.%Y %H:%M")
+def direction_has_free_slots(direction):
+    # проверяем, есть ли хотя бы один свободный слот для направления (по индексу, без обхода сетки)
+    return active_store().availability.has_free(direction)
 
 
 # Пояснение по хранилищам:
-# - Слоты и регистрации хранятся в файле `slots.json`. Там структуру вы можете редактировать вручную.
+# - Слоты берутся из Google Sheets: вручную через /get_slots и фоновым опросом раз в SHEETS_SYNC_INTERVAL секунд
+#   (если таблица не менялась, ничего не пересчитывается; иначе применяются только изменённые ячейки).
+# - Слоты и регистрации хранятся в файле `slots.json` (у кампаний из campaigns.json — в campaigns/<id>/slots.json). Там структуру вы можете редактировать вручную,
+#   но только пока бот остановлен: файл читается один раз при старте, а изменения пишутся из памяти
+#   с задержкой SLOTS_FLUSH_INTERVAL секунд (и принудительно при остановке).
+#   С SLOTS_DB=<файл> вместо slots.json используется SQLite; перенос туда и обратно — `python slot_db.py import|export`.
 # - Информация о опубликованном сообщении (chat_id и message_id) хранится в `published.json`.
-# - MemoryStorage (aiogram.fsm.storage.memory.MemoryStorage) хранит временные состояния пользователей в памяти процесса.
+# - SQLiteStorage (fsm_storage.py) хранит состояния пользователей в `fsm.sqlite3`.
 #   Это включает: текущие значения состояний FSM для каждого пользователя (какий шаг заполнения формы),
 #   и временные данные (data), которые мы сохраняем через `state.update_data()` — например, name, vk, direction, date.
-#   MemoryStorage не предназначен для долгосрочного хранения: при перезапуске бота все состояния будут утеряны.
+#   Чтения идут из кэша в памяти, запись в базу — пачками, так что после перезапуска кандидат продолжает с того же шага.
+#   С FSM_STORAGE=memory используется MemoryStorage: при перезапуске бота все состояния будут утеряны.
 
 
-async def update_published_message():
+# Клавиатуры собираются один раз на изменение слотов и дальше берутся из кэша (см. keyboards.py)
+keyboards = KeyboardCache()
+
+
+def directions_keyboard():
+    return keyboards.published(campaigns.active, active_store().availability)
+
+
+def prewarm(timings=None):
+    """Поднять горячее состояние до первого апдейта: шард активной кампании с индексом, индекс записей
+    всех кампаний и все клавиатуры анкеты.
+
+    Иначе шард читается с диска, а клавиатуры собираются на первых сообщениях
+    кандидатов. timings (dict) заполняется временем шагов — для --profile-startup.
+    """
+    timings = {} if timings is None else timings
+    started = perf_counter()
+    index = active_store().availability
+    timings['шард и индекс слотов'] = perf_counter() - started
+    started = perf_counter()
+    # неактивные шарды открываются один раз ради индекса записей и выгрузятся по CAMPAIGN_IDLE_TTL
+    campaigns.index_all()
+    timings['индекс записей кампаний'] = perf_counter() - started
+    started = perf_counter()
+    campaign = campaigns.active
+    keyboards.directions(campaign)
+    keyboards.published(campaign, index)
+    for direction in campaign.directions:
+        keyboards.dates(campaign.id, index, direction)
+        for date in index.free_dates(direction):
+            keyboards.times(campaign.id, index, direction, date)
+    timings['клавиатуры'] = perf_counter() - started
+    return timings
+
+
+async def edit_published_message(kb):
     pub = load_published()
     if not pub:
-        return
+        return False
     chat_id = pub.get('chat_id')
     message_id = pub.get('message_id')
     if not chat_id or not message_id:
-        return
-    slots = load_slots()
-    kb_buttons = [[InlineKeyboardButton(text=d, callback_data=f'dir:{d}')] for d in DIRECTIONS if direction_has_free_slots(d, slots)]
-    kb = InlineKeyboardMarkup(inline_keyboard=kb_buttons)
+        return False
     try:
         # Редактируем текст и клавиатуру
         await bot.edit_message_text(chat_id=chat_id, message_id=message_id, text='Выберите направление:', reply_markup=kb)
+    except TelegramRetryAfter:
+        raise
     except Exception:
         try:
             await bot.edit_message_reply_markup(chat_id=chat_id, message_id=message_id, reply_markup=kb)
+        except TelegramRetryAfter:
+            raise
         except Exception:
             pass
 
 
+# Опубликованное сообщение обновляется не чаще раза в PUBLISH_DEBOUNCE секунд и только если клавиатура изменилась
+publisher = DirectionsPublisher(render=directions_keyboard, edit=edit_published_message, window=PUBLISH_DEBOUNCE)
+
+# Метрики (см. metrics.py): время хендлеров по FSM-состояниям, Bot API, диск слотов и gspread
+metrics.setup(dp, router, bot)
+metrics.instrument(sheets.get_client(), ['spreadsheet', 'worksheets', 'fetch_direction_grids'], 'gspread_seconds')
+# по кампаниям и с учётом выгруженных шардов — счётчики не скачут при /campaign и выгрузке
+metrics.REGISTRY.register_collector(
+    'slot_store_disk_reads_total', lambda: {cid: c[0] for cid, c in campaigns.disk_counts().items()}, label='campaign')
+metrics.REGISTRY.register_collector(
+    'slot_store_disk_writes_total', lambda: {cid: c[1] for cid, c in campaigns.disk_counts().items()}, label='campaign')
+metrics.REGISTRY.register_collector('campaign_shards_loaded', lambda: len(campaigns.loaded()), kind='gauge')
+metrics.REGISTRY.register_collector('campaign_shards_evicted_total', lambda: campaigns.evicted)
+metrics.REGISTRY.register_collector('slots_closed_total', lambda: sweeper.closed)
+metrics.REGISTRY.register_collector('slots_retired_total', lambda: sweeper.retired)
+metrics.REGISTRY.register_collector('keyboard_cache_hits_total', lambda: keyboards.hits)
+metrics.REGISTRY.register_collector('reminders_sent_total', lambda: reminders.sent)
+metrics.REGISTRY.register_collector('waitlist_waiting', lambda: waitlist.size(), kind='gauge')
+metrics.REGISTRY.register_collector('waitlist_offered_total', lambda: waitlist.offered)
+metrics.REGISTRY.register_collector('waitlist_accepted_total', lambda: waitlist.accepted)
+metrics.REGISTRY.register_collector('waitlist_lapsed_total', lambda: waitlist.lapsed)
+metrics.REGISTRY.register_collector('waitlist_skipped_total', lambda: waitlist.skipped)
+metrics.REGISTRY.register_collector('reminders_scheduled', lambda: reminders.scheduled(), kind='gauge')
+metrics.REGISTRY.register_collector('reminder_send_failed_total', lambda: reminder_sender.failed)
+metrics.REGISTRY.register_collector('keyboard_cache_misses_total', lambda: keyboards.misses)
+metrics.REGISTRY.register_collector('admin_notify_sent_total', lambda: notifier.sent)
+metrics.REGISTRY.register_collector('admin_notify_failed_total', lambda: notifier.failed)
+metrics.REGISTRY.register_collector('admin_notify_pending', lambda: notifier.pending(), kind='gauge')
+metrics.REGISTRY.register_collector('publisher_edits_total', lambda: publisher.edits)
+metrics.REGISTRY.register_collector('publisher_skipped_total', lambda: publisher.skipped)
+metrics.REGISTRY.register_collector('updates_duplicate_total', lambda: throttle.duplicates)
+metrics.REGISTRY.register_collector('updates_coalesced_total', lambda: throttle.coalesced)
+metrics.REGISTRY.register_collector('updates_throttled_total', lambda: throttle.throttled)
+if isinstance(storage, SQLiteStorage):
+    metrics.REGISTRY.register_collector('fsm_db_reads_total', lambda: storage.db_reads)
+    metrics.REGISTRY.register_collector('fsm_commits_total', lambda: storage.commits)
+metrics_runner = None
+
+
+async def update_published_message():
+    publisher.notify()
+
+
 # Старт
 @router.message(Command('start'))
 async def cmd_start(message: types.Message, state: FSMContext):
@@ -335,11 +470,13 @@ async def cmd_start(message: types.Message, state: FSMContext):
         '4) Выберите дату и время из доступных слотов.\n\n'
         'Команды:\n'
         '/my — показать вашу текущую запись.\n'
-        '/cancel — отменить запись (не позднее чем за 24 часа).\n\n'
+        '/cancel — отменить запись (не позднее чем за 24 часа).\n'
+        '/leave — выйти из листа ожидания.\n\n'
         'Начнём: введите ваше Имя и Фамилию:'
     )
     # set initial FSM state for this user (aiogram v3)
     await state.set_state(Form.name)
+    await state.update_data(campaign=campaigns.active_id)
     await message.answer(text)
 
 @router.message(StateFilter(Form.name))
@@ -352,9 +489,10 @@ async def process_name(message: types.Message, state: FSMContext):
 @router.message(StateFilter(Form.vk))
 async def process_vk(message: types.Message, state: FSMContext):
     await state.update_data(vk=message.text)
+    campaign = user_campaign(await state.get_data())
     # Кнопки направлений
     # Предлагаем варианты: либо через reply-клавиатуру, либо через опубликованное сообщение (inline)
-    kb = ReplyKeyboardMarkup(keyboard=[[KeyboardButton(text=d)] for d in DIRECTIONS], resize_keyboard=True)
+    kb = keyboards.directions(campaign)
     # move to next state: direction
     await state.set_state(Form.direction)
     await message.answer('Выберите направление (или нажмите кнопку в опубликованном сообщении):', reply_markup=kb)
@@ -370,10 +508,7 @@ async def cmd_directions(message: types.Message):
             return
         except Exception:
             pass
-    slots = load_slots()
-    kb_buttons = [[InlineKeyboardButton(text=d, callback_data=f'dir:{d}')] for d in DIRECTIONS if direction_has_free_slots(d, slots)]
-    kb = InlineKeyboardMarkup(inline_keyboard=kb_buttons)
-    await message.answer('Выберите направление:', reply_markup=kb)
+    await message.answer('Выберите направление:', reply_markup=directions_keyboard())
 
 
 # Admin: публикуем сообщение с кнопками направлений и фотографией
@@ -382,11 +517,10 @@ async def cmd_publish(message: types.Message):
     if message.from_user.id != ADMIN_ID:
         await message.answer('Только админ может публиковать меню направлений.')
         return
-    slots = load_slots()
-    kb_buttons = [[InlineKeyboardButton(text=d, callback_data=f'dir:{d}')] for d in DIRECTIONS if direction_has_free_slots(d, slots)]
-    kb = InlineKeyboardMarkup(inline_keyboard=kb_buttons)
+    kb = directions_keyboard()
     sent = await message.answer('Выберите направление:', reply_markup=kb)
     save_published({'chat_id': sent.chat.id, 'message_id': sent.message_id})
+    publisher.remember(kb)
     # Добавляем кнопку Export для админа
     try:
         kb2 = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text='Export CSV', callback_data='export:csv')]])
@@ -394,28 +528,24 @@ async def cmd_publish(message: types.Message):
     except Exception:
         pass
     await message.answer('Опубликовано.')
-    log_action(f'published by {message.from_user.id}')
+    journal.publish(message.from_user.id, sent.chat.id, sent.message_id)
 
 
 # Выбор направления
 @router.message(StateFilter(Form.direction))
 async def process_direction(message: types.Message, state: FSMContext):
-    if message.text not in DIRECTIONS:
+    data = await state.get_data()
+    if message.text not in user_campaign(data).directions:
         await message.answer('Пожалуйста, выберите направление с помощью кнопок.')
         return
     await state.update_data(direction=message.text)
     # Кнопки с датами (только с доступными слотами)
-    slots = load_slots()
-    available_dates = []
-    for date, times in slots['slots'].items():
-        for t, dirs in times.items():
-            if dirs[message.text] is None:
-                available_dates.append(date)
-                break
-    if not available_dates:
-        await message.answer('Нет доступных дат для этого направления.')
-        return
-    kb = ReplyKeyboardMarkup(keyboard=[[KeyboardButton(text=d)] for d in available_dates], resize_keyboard=True)
+    campaign = user_campaign(data)
+    kb = keyboards.dates(campaign.id, campaigns.store(campaign.id).availability, message.text)
+    if kb is None:
+        await message.answer('Нет доступных дат для этого направления.',
+                             reply_markup=waitlist_keyboard(campaign, message.text))
+        return
     # Отправляем фото и сообщение с выбором даты
     # Переводим состояние в Form.date (aiogram v3)
     await state.set_state(Form.date)
@@ -423,10 +553,23 @@ async def process_direction(message: types.Message, state: FSMContext):
 
 
 # Обработка нажатия inline-кнопки с направлением
-@router.callback_query(lambda c: c.data and c.data.startswith('dir:'))
+# Фильтры callback-кнопок — async-функции: синхронные фильтры (lambda и даже F.data...) aiogram
+# выполняет через asyncio.to_thread, и при наплыве нажатий они стоят в очереди пула потоков.
+async def is_direction_callback(callback: types.CallbackQuery):
+    return bool(callback.data) and callback.data.startswith('dir:')
+
+
+async def is_export_callback(callback: types.CallbackQuery):
+    return callback.data == 'export:csv'
+
+
+@router.callback_query(is_direction_callback)
 async def callback_dir(callback: types.CallbackQuery, state: FSMContext):
     direction = callback.data.split(':', 1)[1]
-    await bot.answer_callback_query(callback.id)
+    # меню могло быть опубликовано до переключения кампании (или callback_data подделана)
+    if direction not in campaigns.active.directions:
+        await bot.answer_callback_query(callback.id, 'Это направление больше недоступно. Выберите направление заново: /directions')
+        return
     # Сохраняем направление в state и просим ФИО (если ещё не было)
     # Если пользователь уже начал ввод ФИО или VK — не сбрасываем состояние, просто сохраняем направление
     st = state
@@ -435,8 +578,10 @@ async def callback_dir(callback: types.CallbackQuery, state: FSMContext):
     if not data.get('name'):
         await bot.answer_callback_query(callback.id, 'Пожалуйста, сначала нажмите /start в боте и введите ФИО, затем вернитесь и выберите направление.')
         return
-    # Сохраняем направление в state
-    await st.update_data(direction=direction)
+    # на callback отвечают один раз: второй ответ Telegram отвергает
+    await bot.answer_callback_query(callback.id)
+    # Сохраняем направление в state; меню опубликовано для активной кампании — в неё и записываемся
+    await st.update_data(direction=direction, campaign=campaigns.active_id)
     # Если VK ещё нет — просим ссылку
     if not data.get('vk'):
         await st.set_state(Form.vk)
@@ -445,96 +590,162 @@ async def callback_dir(callback: types.CallbackQuery, state: FSMContext):
     # Иначе продолжаем процесс выбора даты (имитируем переход)
     await st.set_state(Form.date)
     # Показываем доступные даты
-    slots = load_slots()
-    available_dates = []
-    for date, times in slots['slots'].items():
-        for t, dirs in times.items():
-            if dirs.get(direction) is None:
-                available_dates.append(date)
-                break
-    if not available_dates:
-        await bot.send_message(callback.from_user.id, 'Нет доступных дат для этого направления.')
-        return
-    kb = ReplyKeyboardMarkup(keyboard=[[KeyboardButton(text=d)] for d in available_dates], resize_keyboard=True)
+    kb = keyboards.dates(campaigns.active_id, active_store().availability, direction)
+    if kb is None:
+        await bot.send_message(callback.from_user.id, 'Нет доступных дат для этого направления.',
+                               reply_markup=waitlist_keyboard(campaigns.active, direction))
+        return
     await bot.send_message(callback.from_user.id, 'Выберите дату:', reply_markup=kb)
 
 
-@router.callback_query(lambda c: c.data == 'export:csv')
+@router.callback_query(is_export_callback)
 async def callback_export(callback: types.CallbackQuery):
     if callback.from_user.id != ADMIN_ID:
         await bot.answer_callback_query(callback.id, 'Только админ может экспортировать')
         return
     await bot.answer_callback_query(callback.id, 'Генерирую CSV...')
-    buf = export_registrations_csv()
-    await bot.send_document(ADMIN_ID, ("registrations.csv", buf.getvalue().encode('utf-8')))
-    log_action(f'export_csv by {callback.from_user.id}')
+    document, count = await export_registrations()
+    await bot.send_document(ADMIN_ID, document)
+    journal.export(callback.from_user.id, 'csv', count)
 
 
+# /export [csv|xlsx] [gz] [dir="F&U prod."] [from=06.10.2025] [to=11.10.2025]
 @router.message(Command('export'))
 async def cmd_export(message: types.Message):
     if message.from_user.id != ADMIN_ID:
         await message.answer('Только админ может экспортировать')
         return
-    buf = export_registrations_csv()
-    await message.answer_document(("registrations.csv", buf.getvalue().encode('utf-8')))
-    log_action(f'export_csv by {message.from_user.id}')
+    try:
+        options = parse_export_args(message.text)
+        document, count = await export_registrations(**options)
+    except ExportError as e:
+        await message.answer(str(e))
+        return
+    await message.answer_document(document, caption=f"Записей: {count} (кампания {options['campaign'] or campaigns.active_id})")
+    journal.export(message.from_user.id, options['fmt'], count)
+
+
+# Admin: сводка метрик — какие хендлеры и внешние вызовы самые медленные
+@router.message(Command('stats'))
+async def cmd_stats(message: types.Message):
+    if message.from_user.id != ADMIN_ID:
+        await message.answer('Только админ может смотреть статистику.')
+        return
+    await message.answer(metrics.format_stats())
+
+
+# Admin: список кампаний и переключение активной (/campaign <id>)
+@router.message(Command('campaigns'))
+async def cmd_campaigns(message: types.Message):
+    if message.from_user.id != ADMIN_ID:
+        await message.answer('Только админ может смотреть кампании.')
+        return
+    loaded = campaigns.loaded()
+    lines = []
+    for campaign_id in campaigns.ids():
+        campaign = campaigns.get(campaign_id)
+        line = f"{'▶' if campaign_id == campaigns.active_id else '•'} {campaign_id} — {campaign.title}: {', '.join(campaign.directions)}"
+        if campaign_id in loaded:
+            line += f' (в памяти, записей: {sum(1 for _ in loaded[campaign_id].iter_registrations())})'
+        lines.append(line)
+    await message.answer('Кампании:\n' + '\n'.join(lines))
+
+
+@router.message(Command('campaign'))
+async def cmd_campaign(message: types.Message):
+    global sheets_sync
+    if message.from_user.id != ADMIN_ID:
+        await message.answer('Только админ может переключать кампанию.')
+        return
+    parts = (message.text or '').split(maxsplit=1)
+    if len(parts) < 2:
+        await message.answer(f'Активная кампания: {campaigns.active_id}. Переключить: /campaign <id>')
+        return
+    campaign_id = parts[1].strip()
+    try:
+        campaigns.set_active(campaign_id)
+    except KeyError:
+        await message.answer(f'Нет кампании {campaign_id}. Есть: {", ".join(campaigns.ids())}')
+        return
+    # опрос таблицы и опубликованное меню переезжают на новую кампанию
+    if sheets_sync is not None:
+        await sheets_sync.close()
+    sheets_sync = make_sheets_sync(campaigns.active)
+    sheets_sync.start()
+    sweeper.wake()
+    publisher.remember(None)
+    await update_published_message()
+    await message.answer(f'Активная кампания: {campaign_id}. Новые кандидаты записываются в неё.')
 
 
 @router.message(Command('my'))
 async def cmd_my(message: types.Message):
-    slots = load_slots()
-    user_id = message.from_user.id
-    for reg in slots.get('registrations', []):
-        if reg['user_id'] == user_id:
-            text = (
-                f"Ваша запись:\nФИО: {reg['full_name']}\nVK: {reg['vk_link']}\nНаправление: {reg['direction']}\nДата: {reg['date']}\nВремя: {reg['time']}"
-            )
-            await message.answer(text)
-            return
+    _, reg = campaigns.find_registration(message.from_user.id)
+    if reg:
+        text = (
+            f"Ваша запись:\nФИО: {reg['full_name']}\nVK: {reg['vk_link']}\nНаправление: {reg['direction']}\nДата: {reg['date']}\nВремя: {reg['time']}"
+        )
+        await message.answer(text)
+        return
     await message.answer('У вас нет активной записи.')
 
 
 # Выбор даты
 @router.message(StateFilter(Form.date))
 async def process_date(message: types.Message, state: FSMContext):
-    slots = load_slots()
     data = await state.get_data()
+    campaign = user_campaign(data)
+    store = campaigns.store(campaign.id)
     direction = data['direction']
     date = message.text
-    if date not in slots['slots']:
+    if date not in store.slots:
         await message.answer('Пожалуйста, выберите дату из списка.')
         return
-    # Кнопки с доступным временем
-    available_times = []
-    for t, dirs in slots['slots'][date].items():
-        if dirs[direction] is None:
-            # Проверка на 12 часов до слота
-            slot_dt = parse_slot_datetime(date, t)
-            if slot_dt - datetime.datetime.now() > datetime.timedelta(hours=12):
-                available_times.append(t)
-    if not available_times:
-        await message.answer('Нет доступного времени на эту дату.')
-        return
-    kb = ReplyKeyboardMarkup(keyboard=[[KeyboardButton(text=t)] for t in available_times], resize_keyboard=True)
+    # Кнопки с доступным временем (слоты ближе 12 часов индекс уже убрал из свободных)
+    kb = keyboards.times(campaign.id, store.availability, direction, date)
+    if kb is None:
+        await message.answer('Нет доступного времени на эту дату.',
+                             reply_markup=waitlist_keyboard(campaign, direction, date))
+        return
     await state.update_data(date=date)
     # Переводим состояние в Form.time (aiogram v3)
     await state.set_state(Form.time)
     await message.answer('Выберите время:', reply_markup=kb)
 
+async def announce_registration(campaign_id, store, reg, username):
+    # Уведомление админу
+    text = (
+        f"Новая запись!\nФИО: {reg['full_name']}\nVK: {reg['vk_link']}\nНаправление: {reg['direction']}\n"
+        f"Дата: {reg['date']}\nВремя: {reg['time']}\nTG: @{username} ({reg['user_id']})"
+    )
+    notifier.send(ADMIN_ID, text)
+    journal.registration(reg, campaign=campaign_id)
+    reminders.add(campaign_id, reg, store.availability.slot_datetime(reg['date'], reg['time']))
+    if campaign_id == campaigns.active_id:
+        await update_published_message()
+
 # Выбор времени и запись
 @router.message(StateFilter(Form.time))
 async def process_time(message: types.Message, state: FSMContext):
-    slots = load_slots()
     data = await state.get_data()
+    campaign = user_campaign(data)
+    store = campaigns.store(campaign.id)
     direction = data['direction']
     date = data['date']
     time = message.text
-    if time not in slots['slots'][date] or slots['slots'][date][time][direction] is not None:
+    if store.get_cell(date, time, direction) is not None:
         await message.answer('Это время уже занято или неверно выбрано.')
         return
+    # слот, предложенный кандидату из листа ожидания, держится за ним до конца аренды
+    if waitlist.holder(campaign.id, date, time, direction) not in (None, message.from_user.id):
+        await message.answer('Это время уже занято или неверно выбрано.')
+        return
+    if has_registration(message.from_user.id):
+        await message.answer('У вас уже есть запись. Чтобы выбрать другое время, сначала отмените её: /cancel')
+        await state.clear()
+        return
     # Проверка на 12 часов до слота
-    slot_dt = parse_slot_datetime(date, time)
-    if slot_dt - datetime.datetime.now() < datetime.timedelta(hours=12):
+    if not store.availability.booking_open(date, time):
         await message.answer('Записаться можно не позднее чем за 12 часов до собеседования.')
         return
     # Запись
@@ -550,13 +761,16 @@ async def process_time(message: types.Message, state: FSMContext):
         "time": time,
         "registered_at": datetime.datetime.now().isoformat()
     }
-    slots['slots'][date][time][direction] = user_id
-    slots['registrations'].append(reg)
-    save_slots(slots)
-    # Уведомление админу
-    text = f"Новая запись!\nФИО: {full_name}\nVK: {vk_link}\nНаправление: {direction}\nДата: {date}\nВремя: {time}\nTG: @{message.from_user.username} ({user_id})"
-    await bot.send_message(ADMIN_ID, text)
-    log_action(f'registration: {reg}')
+    # Проверки выше — только подсказка; занимаем слот атомарно, т.к. его мог успеть забрать другой кандидат,
+    # а аренду листа ожидания могли выдать, пока мы ждали лок слота
+    def still_bookable():
+        return (waitlist.holder(campaign.id, date, time, direction) in (None, user_id)
+                and store.availability.booking_open(date, time))
+
+    if not await store.try_book(date, time, direction, user_id, reg, check=still_bookable):
+        await message.answer('Это время уже занято или неверно выбрано.')
+        return
+    await announce_registration(campaign.id, store, reg, message.from_user.username)
     await message.answer('Вы успешно записаны! Если хотите отменить запись, напишите /cancel')
     await state.clear()
 
@@ -564,42 +778,225 @@ async def process_time(message: types.Message, state: FSMContext):
 # Отмена записи
 @router.message(Command('cancel'))
 async def cancel_registration(message: types.Message):
-    slots = load_slots()
     user_id = message.from_user.id
-    found = None
-    for reg in slots['registrations']:
-        if reg['user_id'] == user_id:
-            found = reg
-            break
+    # запись может быть и в прежней кампании, если кандидат дописал анкету там после /campaign
+    campaign_id, found = campaigns.find_registration(user_id)
     if not found:
         await message.answer('У вас нет активной записи.')
         return
+    store = campaigns.store(campaign_id)
     # Проверка ограничения 24 часа
-    slot_dt = parse_slot_datetime(found['date'], found['time'])
-    if slot_dt - datetime.datetime.now() < datetime.timedelta(hours=24):
+    if not store.availability.cancel_open(found['date'], found['time']):
         await message.answer('Отменить запись можно не позднее чем за 24 часа до собеседования. Если нужно отменить позже — напишите в группу.')
         return
     # Удаляем запись
     direction = found['direction']
     date = found['date']
     time = found['time']
-    if slots['slots'][date][time][direction] == user_id:
-        slots['slots'][date][time][direction] = None
-    slots['registrations'] = [r for r in slots['registrations'] if r['user_id'] != user_id]
-    save_slots(slots)
+    if not await store.release(date, time, direction, user_id):
+        # запись уже удалена параллельным /cancel
+        await message.answer('У вас нет активной записи.')
+        return
     # Уведомление админу об отмене
     admin_text = (
         f"Отмена записи:\nФИО: {found.get('full_name')}\nVK: {found.get('vk_link')}\n"
         f"Направление: {direction}\nДата: {date}\nВремя: {time}\nTG: @{message.from_user.username} ({user_id})"
     )
-    await bot.send_message(ADMIN_ID, admin_text)
-    log_action(f'cancellation: {found}')
+    notifier.send(ADMIN_ID, admin_text)
+    journal.cancellation(found, campaign=campaign_id)
+    reminders.remove(campaign_id, found)
+    # освободившееся время сразу уходит первому из листа ожидания
+    await offer_freed_slot(campaign_id, date, time, direction)
+    await update_published_message()
     await message.answer('Ваша запись успешно отменена.')
 
 
+# Лист ожидания (см. waitlist.py): кнопка «Встать в лист ожидания», предложение освободившегося слота и /leave
+def waitlist_keyboard(campaign, direction, date=None):
+    # направления нет в кампании — вставать некуда, кнопку не показываем
+    if direction not in campaign.directions:
+        return None
+    callback_data = f'wl:join:{campaign.directions.index(direction)}'
+    if date is not None and len(f'{callback_data}:{date}'.encode('utf-8')) <= 64:
+        callback_data = f'{callback_data}:{date}'
+    return InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text='Встать в лист ожидания', callback_data=callback_data)
+    ]])
+
+
+async def offer_freed_slot(campaign_id, date, time, direction):
+    store = campaigns.store(campaign_id)
+    if store.get_cell(date, time, direction) is not None or not store.availability.booking_open(date, time):
+        return
+    lease = waitlist.release(campaign_id, date, time, direction,
+                             eligible=lambda user_id: not has_registration(user_id))
+    if lease is None:
+        return
+    # пока идёт аренда, слот не показывается в клавиатурах остальным
+    store.availability.mark_taken(date, time, direction)
+    kb = InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text='Записаться', callback_data=f'wl:take:{lease.token}'),
+        InlineKeyboardButton(text='Отказаться', callback_data=f'wl:skip:{lease.token}'),
+    ]])
+    try:
+        await bot.send_message(
+            lease.entry['chat_id'],
+            f'Освободилось время: {direction}, {date} {time}.\n'
+            f'Оно закреплено за вами на {max(1, round(WAITLIST_HOLD / 60))} мин — нажмите «Записаться».',
+            reply_markup=kb,
+        )
+    except Exception:
+        # кандидат заблокировал бота и т.п. — слот идёт следующему
+        await waitlist.decline(lease.token, lease.user_id)
+
+
+async def on_waitlist_lapse(lease):
+    # аренда истекла или кандидат отказался: слот снова свободен — предлагаем следующему
+    store = campaigns.store(lease.campaign_id)
+    if store.get_cell(lease.date, lease.time, lease.direction) is None:
+        store.availability.mark_free(lease.date, lease.time, lease.direction)
+    await offer_freed_slot(lease.campaign_id, lease.date, lease.time, lease.direction)
+    if lease.campaign_id == campaigns.active_id:
+        await update_published_message()
+
+
+async def is_waitlist_callback(callback: types.CallbackQuery):
+    return bool(callback.data) and callback.data.startswith('wl:')
+
+
+@router.callback_query(is_waitlist_callback)
+async def callback_waitlist(callback: types.CallbackQuery, state: FSMContext):
+    # wl:join:<idx>[:date], wl:take:<token>, wl:skip:<token>; прочее — устаревшие или подделанные кнопки
+    action, _, arg = callback.data.removeprefix('wl:').partition(':')
+    if action not in ('join', 'take', 'skip'):
+        await bot.answer_callback_query(callback.id)
+        return
+    user_id = callback.from_user.id
+    if action == 'join':
+        data = await state.get_data()
+        campaign = user_campaign(data)
+        index, _, date = arg.partition(':')
+        if not data.get('name') or not data.get('vk') or not index.isdigit() or int(index) >= len(campaign.directions):
+            await bot.answer_callback_query(callback.id, 'Пожалуйста, начните с /start.')
+            return
+        if has_registration(user_id):
+            await bot.answer_callback_query(callback.id, 'У вас уже есть запись.')
+            return
+        direction = campaign.directions[int(index)]
+        entry = {'chat_id': user_id, 'name': data['name'], 'vk': data['vk'], 'username': callback.from_user.username}
+        position = waitlist.join(campaign.id, direction, date or None, user_id, entry)
+        await bot.answer_callback_query(callback.id)
+        what = f'{direction}, {date}' if date else direction
+        await bot.send_message(
+            user_id,
+            f'Вы в листе ожидания ({what}), место в очереди: {position}. '
+            'Как только время освободится, бот сразу предложит его вам. Выйти из очереди: /leave',
+        )
+        return
+    if not arg.isdigit():
+        await bot.answer_callback_query(callback.id)
+        return
+    token = int(arg)
+    if action == 'skip':
+        await waitlist.decline(token, user_id)
+        await bot.answer_callback_query(callback.id, 'Хорошо, предложим время другому кандидату.')
+        return
+    lease = waitlist.accept(token, user_id)
+    if lease is None:
+        await bot.answer_callback_query(callback.id, 'Предложение уже истекло.')
+        return
+    store = campaigns.store(lease.campaign_id)
+    # аренду могли предложить незадолго до отсечки записи, а принять уже после неё
+    if not store.availability.booking_open(lease.date, lease.time):
+        await waitlist.return_slot(lease)
+        await bot.answer_callback_query(callback.id, 'Записаться можно не позднее чем за 12 часов до собеседования.')
+        return
+    reg = {
+        "user_id": user_id,
+        "full_name": lease.entry['name'],
+        "vk_link": lease.entry['vk'],
+        "direction": lease.direction,
+        "date": lease.date,
+        "time": lease.time,
+        "registered_at": datetime.datetime.now().isoformat()
+    }
+    if has_registration(user_id) or not await store.try_book(
+            lease.date, lease.time, lease.direction, user_id, reg,
+            check=lambda: store.availability.booking_open(lease.date, lease.time)):
+        await waitlist.return_slot(lease)
+        await bot.answer_callback_query(callback.id, 'Не удалось записать на это время.')
+        return
+    await bot.answer_callback_query(callback.id)
+    await announce_registration(lease.campaign_id, store, reg, callback.from_user.username)
+    await state.clear()
+    await bot.send_message(user_id, f'Вы записаны: {lease.direction}, {lease.date} {lease.time}. '
+                                    'Если хотите отменить запись, напишите /cancel')
+
+
+@router.message(Command('leave'))
+async def cmd_leave(message: types.Message):
+    if waitlist.leave(message.from_user.id):
+        await message.answer('Вы вышли из листа ожидания.')
+    else:
+        await message.answer('Вы не стоите в листе ожидания.')
+
+
+async def on_startup():
+    global sheets_sync
+    prewarm()
+    campaigns.start()
+    sheets_sync = make_sheets_sync(campaigns.active)
+    journal.start()
+    notifier.start()
+    sheets_sync.start()
+    sweeper.start()
+    reminders.load_sent()
+    # напоминания нужны по всем кампаниям, а не только по активной: кандидаты,
+    # записанные в прошлую кампанию, ещё придут на свои слоты
+    for campaign_id, store in campaigns.index_all().items():
+        reminders.track(campaign_id, store)
+    reminder_sender.start()
+    reminders.start()
+    global metrics_runner
+    if METRICS_PORT:
+        metrics_runner = await metrics.start_server(METRICS_HOST, METRICS_PORT)
+
+
+async def on_shutdown():
+    if sheets_sync is not None:
+        await sheets_sync.close()
+    await sweeper.close()
+    await reminders.close()
+    waitlist.close()
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+    await publisher.close()
+    await notifier.close()
+    await reminder_sender.close()
+    await storage.close()
+    await journal.close()
+    # Принудительно сбрасываем несохранённые изменения слотов всех открытых кампаний
+    await campaigns.close()
+
+
 if __name__ == '__main__':
-    import asyncio, logging
+    import logging
     logging.basicConfig(level=logging.INFO)
-    # Регистрируем роутер и запускаем polling
+    # Регистрируем роутер и запускаем polling или webhook
     dp.include_router(router)
-    asyncio.run(dp.start_polling(bot))
\ No newline at end of file
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+    # BOT_MODE=webhook — приём апдейтов через aiohttp-сервер (см. webhook.py), иначе long polling
+    if os.getenv('BOT_MODE', 'polling') == 'webhook':
+        from webhook import run_webhook
+        run_webhook(
+            dp, bot,
+            host=os.getenv('WEBHOOK_HOST', '0.0.0.0'),
+            port=int(os.getenv('WEBHOOK_PORT', '8080')),
+            path=os.getenv('WEBHOOK_PATH', '/webhook'),
+            secret_token=os.getenv('WEBHOOK_SECRET') or None,
+            webhook_url=os.getenv('WEBHOOK_URL') or None,
+            max_concurrency=int(os.getenv('WEBHOOK_MAX_CONCURRENCY', '64')),
+        )
+    else:
+        asyncio.run(dp.start_polling(bot))
\ No newline at end of file
@@ -0,0 +1,307 @@
+"""Метрики бота в формате Prometheus.
+
+Что меряется:
+
+    bot_updates_total{type}                 — входящие апдейты
+    bot_update_seconds{type}                — полное время обработки апдейта
+    bot_handler_seconds{handler,state}      — время хендлера (state — FSM-состояние на входе)
+    bot_handler_errors_total{handler,state} — исключения в хендлерах
+    bot_api_seconds{method}                 — запросы к Telegram Bot API
+    bot_api_errors_total{method}
+    <prefix>_seconds{op}, <prefix>_errors_total{op} — обёрнутые instrument() вызовы
+                                              (хранилище слотов, gspread)
+
+плюс счётчики, которые объекты бота и так ведут (disk_writes, commits, sent, ...),
+через register_collector().
+
+Отдаются по HTTP на METRICS_PORT (/metrics) и кратко — админу командой /stats.
+"""
+import asyncio
+import bisect
+import functools
+import inspect
+import threading
+import time
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+# Границы корзин гистограмм, секунды
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs, extra=()):
+    items = list(pairs) + list(extra)
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in items) + '}'
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Оценка квантиля по корзинам (линейная интерполяция, как histogram_quantile)."""
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for upper, n in zip(self.buckets, self.counts):
+            if n and seen + n >= rank:
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+            lower = upper
+        # всё, что не влезло в последнюю корзину, считаем равным её границе
+        return self.buckets[-1] if self.count else 0.0
+
+
+class Metrics:
+    """Реестр счётчиков и гистограмм. Метки — кортеж пар (имя, значение)."""
+
+    def __init__(self):
+        # счётчики и гистограммы могут обновляться из потоков (to_thread), поэтому под блокировкой
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+        self.started = time.time()
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def inc(self, name, amount=1, **labels):
+        key = tuple(labels.items())
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = tuple(labels.items())
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = Histogram()
+            hist.observe(value)
+
+    def timer(self, name, **labels):
+        """Контекстный менеджер: время блока в гистограмму name, исключение — в <name без _seconds>_errors_total."""
+        return _Timer(self, name, labels)
+
+    def register_collector(self, name, fn, kind='counter', text=None, label=None):
+        """Значение, которое читается в момент выдачи метрик (например, store.disk_writes).
+
+        С label fn возвращает {значение метки: значение} — по серии на каждую метку.
+        """
+        self._collectors.append((name, fn, kind, label))
+        if text:
+            self._help[name] = text
+
+    # --- чтение ---
+
+    def histograms(self, name):
+        with self._lock:
+            return {key: hist for key, hist in self._histograms.get(name, {}).items()}
+
+    def counters(self, name):
+        with self._lock:
+            return dict(self._counters.get(name, {}))
+
+    def render(self):
+        """Текстовый формат Prometheus (exposition format 0.0.4)."""
+        lines = []
+
+        def header(name, kind):
+            if name in self._help:
+                lines.append(f'# HELP {name} {self._help[name]}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                header(name, 'counter')
+                for key, value in series.items():
+                    lines.append(f'{name}{_labels(key)} {value}')
+            for name, series in sorted(self._histograms.items()):
+                header(name, 'histogram')
+                for key, hist in series.items():
+                    cumulative = 0
+                    for bound, n in zip(hist.buckets, hist.counts):
+                        cumulative += n
+                        lines.append(f'{name}_bucket{_labels(key, [("le", bound)])} {cumulative}')
+                    lines.append(f'{name}_bucket{_labels(key, [("le", "+Inf")])} {hist.count}')
+                    lines.append(f'{name}_sum{_labels(key)} {hist.sum}')
+                    lines.append(f'{name}_count{_labels(key)} {hist.count}')
+        for name, fn, kind, label in self._collectors:
+            try:
+                value = fn()
+            except Exception:
+                continue
+            header(name, kind)
+            if label is None:
+                lines.append(f'{name} {value}')
+                continue
+            for label_value, series_value in value.items():
+                lines.append(f'{name}{_labels(((label, label_value),))} {series_value}')
+        header('bot_uptime_seconds', 'gauge')
+        lines.append(f'bot_uptime_seconds {round(time.time() - self.started, 3)}')
+        return '\n'.join(lines) + '\n'
+
+
+class _Timer:
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.observe(self.name, time.perf_counter() - self.started, **self.labels)
+        if exc_type is not None and not issubclass(exc_type, asyncio.CancelledError):
+            self.registry.inc(self.name.removesuffix('_seconds') + '_errors_total', **self.labels)
+        return False
+
+
+REGISTRY = Metrics()
+REGISTRY.describe('bot_updates_total', 'Входящие апдейты по типу')
+REGISTRY.describe('bot_update_seconds', 'Время обработки апдейта целиком')
+REGISTRY.describe('bot_handler_seconds', 'Время хендлера по имени и FSM-состоянию')
+REGISTRY.describe('bot_handler_errors_total', 'Исключения в хендлерах')
+REGISTRY.describe('bot_api_seconds', 'Запросы к Telegram Bot API')
+REGISTRY.describe('bot_api_errors_total', 'Ошибки запросов к Telegram Bot API')
+
+
+def instrument(obj, methods, name, registry=None):
+    """Обернуть методы объекта таймером: время — в гистограмму name с меткой op=<метод>.
+
+    Работает и для обычных, и для async-методов; обёртка ставится на экземпляр.
+    """
+    registry = registry or REGISTRY
+    for method_name in methods:
+        method = getattr(obj, method_name)
+        if inspect.iscoroutinefunction(method):
+            async def wrapper(*args, _method=method, _op=method_name, **kwargs):
+                with registry.timer(name, op=_op):
+                    return await _method(*args, **kwargs)
+        else:
+            def wrapper(*args, _method=method, _op=method_name, **kwargs):
+                with registry.timer(name, op=_op):
+                    return _method(*args, **kwargs)
+        setattr(obj, method_name, functools.wraps(method)(wrapper))
+    return obj
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Внешний middleware на dp.update: число и полное время апдейтов по типу."""
+
+    def __init__(self, registry=None):
+        self.registry = registry or REGISTRY
+
+    async def __call__(self, handler, event, data):
+        update_type = getattr(event, 'event_type', 'unknown')
+        self.registry.inc('bot_updates_total', type=update_type)
+        with self.registry.timer('bot_update_seconds', type=update_type):
+            return await handler(event, data)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Внутренний middleware на наблюдателях роутера: время и ошибки конкретного хендлера."""
+
+    def __init__(self, registry=None):
+        self.registry = registry or REGISTRY
+
+    async def __call__(self, handler, event, data):
+        handler_object = data.get('handler')
+        callback = getattr(handler_object, 'callback', None)
+        name = getattr(callback, '__name__', 'unknown')
+        state = data.get('raw_state') or 'none'
+        with self.registry.timer('bot_handler_seconds', handler=name, state=state):
+            return await handler(event, data)
+
+
+class BotApiMetricsMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: время и ошибки каждого метода Bot API."""
+
+    def __init__(self, registry=None):
+        self.registry = registry or REGISTRY
+
+    async def __call__(self, make_request, bot, method):
+        with self.registry.timer('bot_api_seconds', method=type(method).__name__):
+            return await make_request(bot, method)
+
+
+def setup(dispatcher, router, bot, registry=None):
+    """Подключить все middleware к диспетчеру, роутеру и сессии бота."""
+    registry = registry or REGISTRY
+    dispatcher.update.outer_middleware(UpdateMetricsMiddleware(registry))
+    handler_middleware = HandlerMetricsMiddleware(registry)
+    for observer in (router.message, router.callback_query):
+        observer.middleware(handler_middleware)
+    bot.session.middleware(BotApiMetricsMiddleware(registry))
+
+
+def format_stats(registry=None, top=10):
+    """Короткая сводка для /stats: самые «дорогие» хендлеры и внешние вызовы."""
+    registry = registry or REGISTRY
+    lines = []
+    uptime = time.time() - registry.started
+    updates = sum(registry.counters('bot_updates_total').values())
+    lines.append(f'Аптайм: {uptime / 3600:.1f} ч, апдейтов: {updates} ({updates / max(uptime, 1):.2f}/с)')
+
+    def section(title, name, label):
+        hists = registry.histograms(name)
+        if not hists:
+            return
+        errors = registry.counters(name.removesuffix('_seconds') + '_errors_total')
+        lines.append('')
+        lines.append(title)
+        rows = sorted(hists.items(), key=lambda item: item[1].sum, reverse=True)[:top]
+        for key, hist in rows:
+            labels = dict(key)
+            title_label = labels.get(label, '?')
+            if label == 'handler' and labels.get('state', 'none') != 'none':
+                title_label += f" [{labels['state']}]"
+            err = errors.get(key, 0)
+            lines.append(
+                f'{title_label}: {hist.count} шт, ср {hist.sum / hist.count * 1000:.1f} мс, '
+                f'p95 {hist.quantile(0.95) * 1000:.1f} мс' + (f', ошибок {err}' if err else '')
+            )
+
+    section('Хендлеры:', 'bot_handler_seconds', 'handler')
+    section('Bot API:', 'bot_api_seconds', 'method')
+    section('Хранилище слотов:', 'slot_store_seconds', 'op')
+    section('Google Sheets:', 'gspread_seconds', 'op')
+    return '\n'.join(lines)
+
+
+async def start_server(host, port, registry=None):
+    """Поднять HTTP-сервер с /metrics. Возвращает aiohttp AppRunner (для cleanup())."""
+    from aiohttp import web
+
+    registry = registry or REGISTRY
+
+    async def handle(_request):
+        return web.Response(text=registry.render(), content_type='text/plain', charset='utf-8',
+                            headers={'X-Content-Type-Options': 'nosniff'})
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
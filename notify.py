@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import time
+
+from aiogram.exceptions import TelegramRetryAfter, TelegramNetworkError, TelegramServerError
+
+logger = logging.getLogger(__name__)
+
+# Ограничение Telegram на длину одного сообщения
+MAX_MESSAGE_LENGTH = 4096
+
+
+class TokenBucket:
+    """Простой token bucket: rate токенов в секунду, не больше burst накопленных."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        """Взять токен без ожидания: False — токенов нет."""
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    async def acquire(self):
+        while not self.try_acquire():
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class Notifier:
+    """Очередь исходящих сообщений (уведомления админу и т.п.).
+
+    send() только кладёт сообщение в очередь и сразу возвращается, так что
+    ответ кандидату не ждёт доставки админу. Фоновая задача отправляет
+    сообщения с ограничением скорости (token bucket на чат), повторяет их при
+    сетевых ошибках с экспоненциальной задержкой и на 429 ждёт retry_after.
+    Сообщения в один чат, пришедшие в пределах digest_window секунд,
+    склеиваются в одно (digest_window=0 — без склейки). total_rate — общий
+    лимит на все чаты сразу (для рассылок многим кандидатам; None — без него).
+    """
+
+    def __init__(self, get_bot, rate=1.0, burst=3, digest_window=0.0, max_retries=5, total_rate=None):
+        self.get_bot = get_bot
+        self.rate = rate
+        self.burst = burst
+        self.digest_window = digest_window
+        self.max_retries = max_retries
+        self._queue = asyncio.Queue()
+        self._buckets = {}
+        self._total = TokenBucket(total_rate, max(1, int(total_rate))) if total_rate else None
+        self._task = None
+        self._busy = False
+        # счётчики для диагностики
+        self.sent = 0
+        self.failed = 0
+
+    def send(self, chat_id, text):
+        self._queue.put_nowait((chat_id, text))
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _bucket(self, chat_id):
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._buckets[chat_id] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    async def _collect(self, first):
+        # забираем всё, что успело прийти за digest_window, и группируем по чатам
+        batch = [first]
+        if self.digest_window > 0:
+            deadline = time.monotonic() + self.digest_window
+            while True:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+        while not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        by_chat = {}
+        for chat_id, text in batch:
+            by_chat.setdefault(chat_id, []).append(text)
+        return by_chat
+
+    def _digest(self, texts):
+        # склеиваем сообщения, не вылезая за лимит длины одного сообщения
+        chunks = []
+        current = ''
+        for text in texts:
+            candidate = f'{current}\n\n{text}' if current else text
+            if current and len(candidate) > MAX_MESSAGE_LENGTH:
+                chunks.append(current)
+                current = text
+            else:
+                current = candidate
+        if current:
+            chunks.append(current)
+        return chunks
+
+    async def _deliver(self, chat_id, text):
+        delay = 1.0
+        for attempt in range(self.max_retries):
+            await self._bucket(chat_id).acquire()
+            if self._total is not None:
+                await self._total.acquire()
+            try:
+                await self.get_bot().send_message(chat_id, text)
+                self.sent += 1
+                return
+            except TelegramRetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+            except (TelegramNetworkError, TelegramServerError):
+                await asyncio.sleep(delay)
+                delay *= 2
+        self.failed += 1
+        logger.error('Не удалось доставить сообщение в чат %s после %s попыток', chat_id, self.max_retries)
+
+    async def _worker(self):
+        while True:
+            first = await self._queue.get()
+            self._busy = True
+            try:
+                by_chat = await self._collect(first)
+                for chat_id, texts in by_chat.items():
+                    chunks = self._digest(texts) if self.digest_window > 0 else texts
+                    for text in chunks:
+                        try:
+                            await self._deliver(chat_id, text)
+                        except Exception:
+                            self.failed += 1
+                            logger.exception('Ошибка отправки сообщения в чат %s', chat_id)
+            finally:
+                self._busy = False
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._worker())
+
+    async def close(self, timeout=10.0):
+        """Остановить отправку, дав очереди до timeout секунд на то, чтобы разойтись."""
+        if self._task is None:
+            return
+        try:
+            async with asyncio.timeout(timeout):
+                while self._busy or not self._queue.empty():
+                    await asyncio.sleep(0.05)
+        except TimeoutError:
+            logger.warning('Не все сообщения из очереди отправлены до остановки: осталось %s', self.pending())
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
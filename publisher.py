@@ -0,0 +1,98 @@
+import asyncio
+import hashlib
+import json
+import logging
+
+from aiogram.exceptions import TelegramRetryAfter
+
+logger = logging.getLogger(__name__)
+
+
+def markup_fingerprint(markup):
+    return hashlib.sha1(
+        json.dumps(markup.model_dump(exclude_none=True), ensure_ascii=False, sort_keys=True).encode('utf-8')
+    ).hexdigest()
+
+
+class DirectionsPublisher:
+    """Обновление опубликованного сообщения с кнопками направлений.
+
+    notify() можно дёргать на каждую запись и отмену: все уведомления за
+    window секунд склеиваются в одно редактирование. Перед вызовом Bot API
+    клавиатура сравнивается с последней отправленной (по отпечатку) — если
+    она не изменилась, запрос не делается. На 429 ждём retry_after и
+    повторяем.
+
+    render() возвращает текущую клавиатуру, edit(markup) редактирует
+    сообщение (и возвращает False, если публиковать некуда).
+    """
+
+    def __init__(self, render, edit, window=3.0, max_retries=5):
+        self.render = render
+        self.edit = edit
+        self.window = window
+        self.max_retries = max_retries
+        self._fingerprint = None
+        self._pending = False
+        self._task = None
+        # счётчики для диагностики
+        self.notified = 0
+        self.edits = 0
+        self.skipped = 0
+
+    def notify(self):
+        self.notified += 1
+        self._pending = True
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._debounced())
+
+    def remember(self, markup):
+        """Запомнить клавиатуру, которая только что отправлена в сообщение (например, в /publish).
+
+        None — забыть: следующая публикация отредактирует сообщение в любом случае.
+        """
+        self._fingerprint = markup_fingerprint(markup) if markup is not None else None
+
+    async def _debounced(self):
+        # уведомления, пришедшие во время редактирования, дадут ещё один проход цикла
+        while self._pending:
+            await asyncio.sleep(self.window)
+            self._pending = False
+            try:
+                await self.publish()
+            except Exception:
+                logger.exception('Не удалось обновить опубликованное сообщение')
+
+    async def publish(self):
+        markup = self.render()
+        fingerprint = markup_fingerprint(markup)
+        if fingerprint == self._fingerprint:
+            self.skipped += 1
+            return
+        for _ in range(self.max_retries):
+            try:
+                if await self.edit(markup) is False:
+                    return
+                break
+            except TelegramRetryAfter as e:
+                logger.warning('Flood control при обновлении сообщения, ждём %s с', e.retry_after)
+                await asyncio.sleep(e.retry_after)
+        else:
+            return
+        self.edits += 1
+        self._fingerprint = fingerprint
+
+    async def close(self):
+        # при остановке не теряем отложенное обновление — публикуем сразу
+        if self._task is not None and not self._task.done():
+            self._pending = False
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            try:
+                await self.publish()
+            except Exception:
+                logger.exception('Не удалось обновить опубликованное сообщение')
+        self._task = None
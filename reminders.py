@@ -0,0 +1,214 @@
+"""Напоминания кандидатам о предстоящих собеседованиях.
+
+Расписание — куча (heapq) моментов отправки: для каждой регистрации и
+каждого смещения из offsets (например, за 24 часа и за 1 час) в куче лежит
+(момент, ...). Время слота берётся из индекса шарда уже разобранным
+(AvailabilityIndex.slot_datetime), так что регистрации не перебираются и
+даты не разбираются заново: фоновая задача спит до вершины кучи и снимает
+только наступившие напоминания. Запись и отмена добавляют и снимают
+регистрацию точечно (add/remove); снятые записи из кучи не вычищаются, а
+пропускаются при извлечении. В момент начала слота в куче срабатывает
+метка забывания — регистрация уходит из расписания, даже если её никто не
+снял (кампанию выгрузили, запись осталась в архиве).
+
+Что уже отправлено, хранится в sent_path (JSON), поэтому после перезапуска
+бот не напоминает повторно. Напоминание, момент которого наступил ещё до
+записи (записались за 20 часов — «за 24 часа» не нужно), не ставится; если
+бот лежал и наступило сразу несколько напоминаний, уходит только самое
+позднее из них.
+"""
+import asyncio
+import datetime
+import heapq
+import itertools
+import json
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+
+def _registration_key(campaign_id, reg):
+    return (campaign_id, reg.get('user_id'), reg.get('date'), reg.get('time'), reg.get('direction'),
+            reg.get('registered_at'))
+
+
+def _parse_registered_at(reg):
+    try:
+        return datetime.datetime.fromisoformat(reg['registered_at'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class ReminderScheduler:
+    """Очередь напоминаний на куче.
+
+    send(chat_id, text) — отправка (обычно Notifier.send, он и ограничивает скорость);
+    render(reg, offset) — текст напоминания за offset до слота.
+    """
+
+    def __init__(self, send, render, offsets, sent_path='reminders_sent.json', keep_sent=datetime.timedelta(days=2)):
+        self.send = send
+        self.render = render
+        # от самого раннего напоминания к самому позднему
+        self.offsets = sorted(offsets, reverse=True)
+        self.sent_path = sent_path
+        self.keep_sent = keep_sent
+        # (момент отправки, порядковый номер, ключ регистрации, смещение); смещение None — метка забывания
+        self._heap = []
+        self._seq = itertools.count()
+        # ключ регистрации -> (регистрация, datetime слота); чего здесь нет, то снято
+        self._live = {}
+        # json-ключ отправленного напоминания -> datetime слота в ISO (для чистки старых)
+        self._sent = {}
+        # в _sent есть изменения, ещё не записанные в sent_path
+        self._sent_dirty = False
+        self._tracked = set()
+        self._task = None
+        self._wakeup = None
+        # счётчики для диагностики
+        self.sent = 0
+        self.skipped = 0
+
+    # --- состояние отправленных ---
+
+    def load_sent(self):
+        if not os.path.exists(self.sent_path):
+            self._sent = {}
+            return
+        with open(self.sent_path, 'r', encoding='utf-8') as f:
+            self._sent = json.load(f)
+
+    def _save_sent(self, data):
+        directory = os.path.dirname(os.path.abspath(self.sent_path))
+        fd, tmp_path = tempfile.mkstemp(prefix='.reminders-', suffix='.tmp', dir=directory)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.sent_path)
+
+    async def _persist(self, now):
+        threshold = (now - self.keep_sent).isoformat()
+        self._sent = {key: slot for key, slot in self._sent.items() if slot >= threshold}
+        self._sent_dirty = False
+        await asyncio.to_thread(self._save_sent, dict(self._sent))
+
+    @staticmethod
+    def _sent_key(reg_key, offset):
+        return json.dumps([*reg_key, offset.total_seconds()], ensure_ascii=False)
+
+    # --- расписание ---
+
+    def track(self, campaign_id, store):
+        """Поставить в расписание все регистрации шарда (один раз на кампанию)."""
+        if campaign_id in self._tracked:
+            return
+        self._tracked.add(campaign_id)
+        for reg in store.iter_registrations():
+            self.add(campaign_id, reg, store.availability.slot_datetime(reg.get('date'), reg.get('time')))
+
+    def add(self, campaign_id, reg, slot_dt):
+        if slot_dt is None:
+            return
+        key = _registration_key(campaign_id, reg)
+        if key in self._live:
+            return
+        self._live[key] = (reg, slot_dt)
+        registered_at = _parse_registered_at(reg)
+        earliest = None
+        for offset in self.offsets:
+            fire_at = slot_dt - offset
+            if registered_at is not None and fire_at <= registered_at:
+                continue
+            if self._sent_key(key, offset) in self._sent:
+                continue
+            heapq.heappush(self._heap, (fire_at, next(self._seq), key, offset))
+            earliest = fire_at if earliest is None else min(earliest, fire_at)
+        heapq.heappush(self._heap, (slot_dt, next(self._seq), key, None))
+        if earliest is not None and self._wakeup is not None and self._heap[0][0] == earliest:
+            # новое напоминание раньше того, до которого спит фоновая задача
+            self._wakeup.set()
+
+    def remove(self, campaign_id, reg):
+        """Снять регистрацию (отмена, слот закрыт в таблице или ушёл в архив) вместе с отметками об отправке."""
+        key = _registration_key(campaign_id, reg)
+        self._live.pop(key, None)
+        for offset in self.offsets:
+            if self._sent.pop(self._sent_key(key, offset), None) is not None:
+                self._sent_dirty = True
+
+    def scheduled(self):
+        return len(self._live)
+
+    async def fire_due(self, now=None):
+        """Отправить наступившие напоминания. Возвращает, сколько отправлено."""
+        now = now or datetime.datetime.now()
+        sent = 0
+        changed = False
+        while self._heap and self._heap[0][0] <= now:
+            _, _, key, offset = heapq.heappop(self._heap)
+            if offset is None:
+                # слот начался — напоминать больше нечего
+                self._live.pop(key, None)
+                continue
+            entry = self._live.get(key)
+            if entry is None:
+                continue
+            sent_key = self._sent_key(key, offset)
+            if sent_key in self._sent:
+                continue
+            reg, slot_dt = entry
+            self._sent[sent_key] = slot_dt.isoformat()
+            changed = True
+            # слот уже начался или подошло время более позднего напоминания — это не шлём
+            if now >= slot_dt or any(now >= slot_dt - later for later in self.offsets if later < offset):
+                self.skipped += 1
+                continue
+            self.send(reg.get('user_id'), self.render(reg, offset))
+            self.sent += 1
+            sent += 1
+        if changed or self._sent_dirty:
+            try:
+                await self._persist(now)
+            except Exception:
+                logger.exception('Не удалось сохранить %s', self.sent_path)
+        return sent
+
+    def next_delay(self, now=None, limit=3600.0):
+        if not self._heap:
+            return limit
+        now = now or datetime.datetime.now()
+        return min(max((self._heap[0][0] - now).total_seconds(), 0.0), limit)
+
+    # --- фоновая задача ---
+
+    async def _loop(self):
+        while True:
+            # как в sweeper.py: asyncio.wait, а не wait_for, чтобы отмена не терялась
+            waiter = asyncio.ensure_future(self._wakeup.wait())
+            try:
+                await asyncio.wait([waiter], timeout=self.next_delay())
+            finally:
+                waiter.cancel()
+            self._wakeup.clear()
+            try:
+                await self.fire_due()
+            except Exception:
+                logger.exception('Не удалось разослать напоминания')
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._loop())
+
+    async def close(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._wakeup = None
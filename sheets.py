@@ -0,0 +1,182 @@
+import os
+import threading
+import time
+
+CREDENTIALS_FILE = 'credentials.json'
+# Сколько секунд держать открытую таблицу и список её листов, прежде чем перечитать метаданные
+CACHE_TTL = float(os.getenv('SHEETS_CACHE_TTL', '300'))
+SCOPES = ['https://www.googleapis.com/auth/spreadsheets',
+          'https://www.googleapis.com/auth/drive']
+
+# Диапазоны на листе направления: даты в шапке, времена в первом столбце, ячейки 'могу'/'не могу'
+DATES_RANGE = 'B1:G1'
+TIMES_RANGE = 'A2:A13'
+CELLS_RANGE = 'B2:G13'
+
+# Функции этого модуля блокирующие (gspread ходит в сеть синхронно) —
+# из хендлеров их нужно вызывать через asyncio.to_thread.
+# gspread и google-auth импортируются только при первой авторизации: это сотни
+# миллисекунд, которые не нужны боту, пока админ не обратился к таблице.
+
+
+def authorize():
+    import gspread
+    from google.oauth2.service_account import Credentials
+
+    # Prefer gspread helper which configures scopes automatically from service account file
+    try:
+        return gspread.service_account(filename=CREDENTIALS_FILE)
+    except Exception:
+        # Fallback: explicitly set scopes for google oauth credentials
+        creds = Credentials.from_service_account_file(CREDENTIALS_FILE, scopes=SCOPES)
+        return gspread.authorize(creds)
+
+
+class SheetsClient:
+    """Общий клиент Google Sheets.
+
+    Авторизуется один раз (при первом обращении) и дальше переиспользует
+    клиент gspread: у него одна AuthorizedSession с пулом соединений, которая
+    сама обновляет токен сервисного аккаунта по истечении. Открытая таблица и
+    список её листов кэшируются на ttl секунд, поэтому повторные /get_slots и
+    /list_sheets не повторяют авторизацию и open_by_key.
+    """
+
+    def __init__(self, ttl=CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._gc = None
+        # sheet_id -> (Spreadsheet, время открытия)
+        self._spreadsheets = {}
+        # sheet_id -> (список Worksheet, время чтения)
+        self._worksheets = {}
+
+    def client(self):
+        with self._lock:
+            if self._gc is None:
+                self._gc = authorize()
+            return self._gc
+
+    def _fresh(self, cached):
+        return cached is not None and time.monotonic() - cached[1] < self.ttl
+
+    def spreadsheet(self, sheet_id):
+        cached = self._spreadsheets.get(sheet_id)
+        if self._fresh(cached):
+            return cached[0]
+        sh = self.client().open_by_key(sheet_id)
+        self._spreadsheets[sheet_id] = (sh, time.monotonic())
+        return sh
+
+    def worksheets(self, sheet_id):
+        cached = self._worksheets.get(sheet_id)
+        if self._fresh(cached):
+            return cached[0]
+        sheet_list = self.spreadsheet(sheet_id).worksheets()
+        self._worksheets[sheet_id] = (sheet_list, time.monotonic())
+        return sheet_list
+
+    def fetch_direction_grids(self, sheet_id, directions):
+        try:
+            sh = self.spreadsheet(sheet_id)
+            titles = [w.title for w in self.worksheets(sheet_id) if w.title in directions]
+            return fetch_direction_grids(sh, titles)
+        except Exception:
+            # листы могли переименовать или доступ отозвали — в следующий раз перечитаем всё заново
+            self.invalidate(sheet_id)
+            raise
+
+    def invalidate(self, sheet_id=None):
+        if sheet_id is None:
+            self._spreadsheets.clear()
+            self._worksheets.clear()
+        else:
+            self._spreadsheets.pop(sheet_id, None)
+            self._worksheets.pop(sheet_id, None)
+
+
+_client = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = SheetsClient()
+    return _client
+
+
+def _a1(title, cells):
+    # имя листа в A1-нотации берётся в кавычки, кавычки внутри удваиваются
+    return "'{}'!{}".format(title.replace("'", "''"), cells)
+
+
+def fetch_direction_grids(sh, titles):
+    """Прочитать листы направлений titles одним batch-запросом.
+
+    Возвращает {'dates': [...], 'times': [...], 'values': {direction: rows}},
+    где rows — значения диапазона CELLS_RANGE. Даты и времена берутся с первого
+    листа-направления (ожидается одинаковая структура на всех листах).
+    Если листов направлений нет, 'values' пустой.
+    """
+    if not titles:
+        return {'dates': [], 'times': [], 'values': {}}
+    ranges = [_a1(titles[0], DATES_RANGE), _a1(titles[0], TIMES_RANGE)]
+    ranges += [_a1(t, CELLS_RANGE) for t in titles]
+    value_ranges = sh.values_batch_get(ranges).get('valueRanges', [])
+    values = [vr.get('values', []) for vr in value_ranges]
+    values += [[]] * (len(ranges) - len(values))
+    dates = (values[0] or [['']])[0]
+    times = [r[0] if r else '' for r in (values[1] or [['']])]
+    return {
+        'dates': dates,
+        'times': times,
+        'values': dict(zip(titles, values[2:])),
+    }
+
+
+def is_available(cell_val):
+    # Если в ячейке явно указано 'могу' (регистр игнорируем) — считаем доступным
+    # Во всех остальных случаях (пусто или 'не могу' и т.д.) — слот закрыт
+    return isinstance(cell_val, str) and cell_val.strip().lower() == 'могу'
+
+
+def build_grid(grids, directions):
+    """Сетка slots['slots'] по прочитанным листам: None — доступно, 'blocked' — закрыто."""
+    dates = [d.strip() for d in grids['dates']]
+    times = grids['times']
+    grid = {}
+    for date_key in dates:
+        grid[date_key] = {}
+        for time_slot in times:
+            grid[date_key][time_slot] = {d: None for d in directions}
+    for direction, values in grids['values'].items():
+        for i, date_key in enumerate(dates):
+            for j, time_slot in enumerate(times):
+                try:
+                    cell_val = values[j][i]
+                except IndexError:
+                    cell_val = ''
+                if not is_available(cell_val):
+                    grid[date_key][time_slot][direction] = 'blocked'
+    return grid
+
+
+def grid_report(grids):
+    """Строки отчёта парсинга по каждому листу направления."""
+    report_lines = []
+    total_cells_expected = len(grids['times']) * len(grids['dates'])
+    for title, vals in grids['values'].items():
+        # Считаем только ячейки, где явно встречается слово 'могу'
+        mogu_cells = [
+            (r_idx + 2, c_idx + 2)  # координаты в таблице (начиная с 1)
+            for r_idx, row in enumerate(vals)
+            for c_idx, cell in enumerate(row)
+            if is_available(cell)
+        ]
+        report = f"{title}: прочитано {len(vals)} строк, всего ячеек {total_cells_expected}, 'могу' = {len(mogu_cells)}"
+        if mogu_cells:
+            # включаем пару примеров координат для отладки
+            sample = ', '.join([f"({r},{c})" for r, c in mogu_cells[:6]])
+            report += f", примеры 'могу' в ячейках: {sample}"
+        report_lines.append(report)
+    return report_lines
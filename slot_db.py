@@ -0,0 +1,228 @@
+"""Хранение слотов и регистраций в SQLite.
+
+SQLiteBackend подключается к SlotStore вместо slots.json (переменная
+окружения SLOTS_DB): при записи в базу попадают только изменённые ячейки и
+регистрации — запись или отмена превращаются в обновление пары строк в
+одной транзакции, а не в перезапись всего файла.
+
+Перенос данных из slots.json и обратно:
+
+    python slot_db.py import slots.json slots.sqlite3
+    python slot_db.py export slots.sqlite3 slots.json
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS slots (
+    date TEXT NOT NULL,
+    time TEXT NOT NULL,
+    direction TEXT NOT NULL,
+    status TEXT NOT NULL,
+    user_id INTEGER,
+    date_pos INTEGER NOT NULL,
+    time_pos INTEGER NOT NULL,
+    direction_pos INTEGER NOT NULL,
+    PRIMARY KEY (date, time, direction)
+);
+CREATE INDEX IF NOT EXISTS slots_by_direction ON slots (direction, status);
+CREATE TABLE IF NOT EXISTS registrations (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    full_name TEXT,
+    vk_link TEXT,
+    direction TEXT NOT NULL,
+    date TEXT NOT NULL,
+    time TEXT NOT NULL,
+    registered_at TEXT,
+    extra TEXT,
+    UNIQUE (date, time, direction)
+);
+CREATE INDEX IF NOT EXISTS registrations_by_user ON registrations (user_id);
+"""
+
+_REG_FIELDS = ('user_id', 'full_name', 'vk_link', 'direction', 'date', 'time', 'registered_at')
+
+# значение ячейки в slots.json <-> (status, user_id) в базе
+FREE = 'free'
+BOOKED = 'booked'
+
+
+def _encode_cell(value):
+    if value is None:
+        return FREE, None
+    if isinstance(value, int):
+        return BOOKED, value
+    return str(value), None
+
+
+def _decode_cell(status, user_id):
+    if status == FREE:
+        return None
+    if status == BOOKED:
+        return user_id
+    return status
+
+
+def _encode_reg(reg):
+    extra = {k: v for k, v in reg.items() if k not in _REG_FIELDS}
+    return tuple(reg.get(k) for k in _REG_FIELDS) + (json.dumps(extra, ensure_ascii=False) if extra else None,)
+
+
+def _decode_reg(row):
+    reg = dict(zip(_REG_FIELDS, row[:-1]))
+    if row[-1]:
+        reg.update(json.loads(row[-1]))
+    return reg
+
+
+class SQLiteBackend:
+    """Backend для SlotStore на SQLite (WAL).
+
+    Если базы ещё нет, а рядом лежит json_path (slots.json), данные при
+    первом запуске импортируются из него.
+    """
+
+    def __init__(self, path, json_path=None):
+        self.path = path
+        self.json_path = json_path
+        # импорт из slots.json — только для только что созданной базы
+        self._fresh = not os.path.exists(path)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    # --- чтение ---
+
+    def load(self):
+        with self._lock:
+            if self._fresh and self.json_path and os.path.exists(self.json_path):
+                with open(self.json_path, 'r', encoding='utf-8') as f:
+                    self._replace(json.load(f))
+                self._fresh = False
+            grid = {}
+            rows = self._conn.execute(
+                'SELECT date, time, direction, status, user_id FROM slots ORDER BY date_pos, time_pos, direction_pos'
+            )
+            for date, time, direction, status, user_id in rows:
+                grid.setdefault(date, {}).setdefault(time, {})[direction] = _decode_cell(status, user_id)
+            regs = [
+                _decode_reg(row) for row in self._conn.execute(
+                    'SELECT ' + ', '.join(_REG_FIELDS) + ', extra FROM registrations ORDER BY seq'
+                )
+            ]
+        return {'slots': grid, 'registrations': regs}
+
+    # --- запись ---
+
+    def prepare(self, store, changes):
+        """Снимок изменений (делается в event loop); write() потом пишет его в потоке."""
+        if changes.full:
+            # глубокая копия: поток записи не должен читать живые словари store
+            return ('full', json.loads(json.dumps(store.snapshot())))
+        grid = store.slots
+        cells = []
+        for date, time, direction in changes.cells:
+            dirs = grid.get(date, {}).get(time)
+            if dirs is not None and direction in dirs:
+                cells.append((date, time, direction) + _encode_cell(dirs[direction]))
+        regs = []
+        for key in changes.registrations:
+            reg = store.registration_at(*key)
+            regs.append((key, _encode_reg(reg) if reg is not None else None))
+        return ('rows', (cells, regs))
+
+    def write(self, payload):
+        kind, body = payload
+        with self._lock, self._conn:
+            if kind == 'full':
+                self._replace(body)
+            else:
+                cells, regs = body
+                self._conn.executemany(
+                    'UPDATE slots SET status = ?, user_id = ? WHERE date = ? AND time = ? AND direction = ?',
+                    [(status, user_id, date, time, direction) for date, time, direction, status, user_id in cells],
+                )
+                for (date, time, direction), row in regs:
+                    if row is None:
+                        self._conn.execute(
+                            'DELETE FROM registrations WHERE date = ? AND time = ? AND direction = ?',
+                            (date, time, direction),
+                        )
+                    else:
+                        self._conn.execute(
+                            'INSERT OR REPLACE INTO registrations (' + ', '.join(_REG_FIELDS) + ', extra) '
+                            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                            row,
+                        )
+
+    def _replace(self, data):
+        with self._conn:
+            self._conn.execute('DELETE FROM slots')
+            self._conn.execute('DELETE FROM registrations')
+            cells = []
+            times_seen = {}
+            dirs_seen = {}
+            for date_pos, (date, times) in enumerate(data.get('slots', {}).items()):
+                for time, dirs in times.items():
+                    time_pos = times_seen.setdefault(time, len(times_seen))
+                    for direction, value in dirs.items():
+                        direction_pos = dirs_seen.setdefault(direction, len(dirs_seen))
+                        status, user_id = _encode_cell(value)
+                        cells.append((date, time, direction, status, user_id, date_pos, time_pos, direction_pos))
+            self._conn.executemany('INSERT INTO slots VALUES (?, ?, ?, ?, ?, ?, ?, ?)', cells)
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO registrations (' + ', '.join(_REG_FIELDS) + ', extra) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [_encode_reg(reg) for reg in data.get('registrations', [])],
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def import_json(json_path, db_path):
+    with open(json_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    backend = SQLiteBackend(db_path)
+    with backend._lock:
+        backend._replace(data)
+    backend.close()
+    return data
+
+
+def export_json(db_path, json_path):
+    backend = SQLiteBackend(db_path)
+    data = backend.load()
+    backend.close()
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Перенос слотов между slots.json и SQLite')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_import = sub.add_parser('import', help='slots.json -> SQLite')
+    p_import.add_argument('json_path')
+    p_import.add_argument('db_path')
+    p_export = sub.add_parser('export', help='SQLite -> slots.json')
+    p_export.add_argument('db_path')
+    p_export.add_argument('json_path')
+    args = parser.parse_args()
+    if args.command == 'import':
+        data = import_json(args.json_path, args.db_path)
+    else:
+        data = export_json(args.db_path, args.json_path)
+    print(f"Слотов: {sum(len(dirs) for times in data['slots'].values() for dirs in times.values())}, "
+          f"регистраций: {len(data['registrations'])}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+"""Компактная сетка слотов: оси и массивы вместо вложенных словарей.
+
+В slots.json сетка — slots[date][time][direction] = None | 'blocked' | user_id:
+на каждую пару (дата, время) свой словарь, ключи — длинные строки. SlotGrid
+хранит то же самое иначе:
+
+* оси — списки дат, времён и направлений (строки интернируются, каждая
+  хранится один раз); ячейка (дата, время) — номер d * len(times) + t;
+* на направление — array('q') владельцев ячеек: id пользователя или
+  служебное отрицательное значение (свободно, закрыто, ячейки нет);
+* на направление — битовая маска свободных ячеек (обычный int), так что
+  «есть ли у направления свободные слоты» — сравнение маски с нулём, а
+  «свободные времена на дату» — сдвиг и маска по строке даты.
+
+from_json()/to_json() переводят сетку из формата slots.json и обратно без
+потерь (значения, которых нет среди служебных, хранятся отдельно как есть).
+Сравнение со словарём — bench/grid_bench.py.
+"""
+import sys
+from array import array
+
+# служебные значения ячеек (id пользователей Telegram положительные)
+ABSENT = -1
+FREE = -2
+BLOCKED = -3
+OTHER = -4
+
+
+class SlotGrid:
+    def __init__(self):
+        self.dates = []
+        self.times = []
+        self.directions = []
+        self._date_pos = {}
+        self._time_pos = {}
+        self._dir_pos = {}
+        # direction -> array('q') владельцев, по ячейке на (дата, время)
+        self._cells = []
+        # direction -> битовая маска свободных ячеек
+        self._free = []
+        # маска ячеек (дата, время), которые есть в сетке
+        self._present = 0
+        # (direction, ячейка) -> значение, которое не укладывается в array('q')
+        self._other = {}
+
+    # --- оси ---
+
+    def _cell(self, d, t):
+        return d * len(self.times) + t
+
+    def _add_date(self, date):
+        date = sys.intern(date)
+        self._date_pos[date] = len(self.dates)
+        self.dates.append(date)
+        extra = len(self.times)
+        for cells in self._cells:
+            cells.extend(array('q', [ABSENT]) * extra)
+        return self._date_pos[date]
+
+    def _add_time(self, time):
+        # новое время меняет ширину строки — раскладываем ячейки заново
+        old_width = len(self.times)
+        time = sys.intern(time)
+        self._time_pos[time] = old_width
+        self.times.append(time)
+        width = old_width + 1
+        for i, cells in enumerate(self._cells):
+            wide = array('q', [ABSENT]) * (len(self.dates) * width)
+            for d in range(len(self.dates)):
+                wide[d * width:d * width + old_width] = cells[d * old_width:(d + 1) * old_width]
+            self._cells[i] = wide
+            self._free[i] = self._spread(self._free[i], old_width, width)
+        self._present = self._spread(self._present, old_width, width)
+        self._other = {
+            (i, (cell // old_width) * width + cell % old_width): value for (i, cell), value in self._other.items()
+        }
+        return old_width
+
+    def _spread(self, mask, old_width, width):
+        row = (1 << old_width) - 1
+        result = 0
+        for d in range(len(self.dates)):
+            result |= ((mask >> (d * old_width)) & row) << (d * width)
+        return result
+
+    def _add_direction(self, direction):
+        direction = sys.intern(direction)
+        self._dir_pos[direction] = len(self.directions)
+        self.directions.append(direction)
+        self._cells.append(array('q', [ABSENT]) * (len(self.dates) * len(self.times)))
+        self._free.append(0)
+        return self._dir_pos[direction]
+
+    # --- ячейки ---
+
+    def _encode(self, i, cell, value):
+        self._other.pop((i, cell), None)
+        if value is None:
+            return FREE
+        if value == 'blocked':
+            return BLOCKED
+        if type(value) is int and value >= 0:
+            return value
+        self._other[(i, cell)] = value
+        return OTHER
+
+    def _decode(self, i, cell, code):
+        if code >= 0:
+            return code
+        if code == FREE:
+            return None
+        if code == BLOCKED:
+            return 'blocked'
+        return self._other[(i, cell)]
+
+    def set(self, date, time, direction, value):
+        d = self._date_pos.get(date)
+        if d is None:
+            d = self._add_date(date)
+        t = self._time_pos.get(time)
+        if t is None:
+            t = self._add_time(time)
+        i = self._dir_pos.get(direction)
+        if i is None:
+            i = self._add_direction(direction)
+        cell = self._cell(d, t)
+        self._present |= 1 << cell
+        code = self._encode(i, cell, value)
+        self._cells[i][cell] = code
+        if code == FREE:
+            self._free[i] |= 1 << cell
+        else:
+            self._free[i] &= ~(1 << cell)
+
+    def get(self, date, time, direction, default=None):
+        d = self._date_pos.get(date)
+        t = self._time_pos.get(time)
+        i = self._dir_pos.get(direction)
+        if d is None or t is None or i is None:
+            return default
+        cell = self._cell(d, t)
+        code = self._cells[i][cell]
+        if code == ABSENT:
+            return default
+        return self._decode(i, cell, code)
+
+    # --- запросы ---
+
+    def has_free(self, direction):
+        i = self._dir_pos.get(direction)
+        return i is not None and self._free[i] != 0
+
+    def count_free(self, direction):
+        i = self._dir_pos.get(direction)
+        return 0 if i is None else self._free[i].bit_count()
+
+    def free_dates(self, direction):
+        """Даты со свободными слотами направления — в порядке оси дат."""
+        i = self._dir_pos.get(direction)
+        if i is None:
+            return []
+        mask = self._free[i]
+        width = len(self.times)
+        row = (1 << width) - 1
+        return [date for d, date in enumerate(self.dates) if (mask >> (d * width)) & row]
+
+    def free_times(self, direction, date):
+        """Свободные времена направления на дату — в порядке оси времён."""
+        i = self._dir_pos.get(direction)
+        d = self._date_pos.get(date)
+        if i is None or d is None:
+            return []
+        width = len(self.times)
+        bits = (self._free[i] >> (d * width)) & ((1 << width) - 1)
+        result = []
+        while bits:
+            low = bits & -bits
+            result.append(self.times[low.bit_length() - 1])
+            bits ^= low
+        return result
+
+    # --- формат slots.json ---
+
+    @classmethod
+    def from_json(cls, slots):
+        grid = cls()
+        # сначала оси целиком — чтобы не раскладывать ячейки заново на каждом новом времени
+        for date, times in slots.items():
+            if date not in grid._date_pos:
+                grid._add_date(date)
+            for time, dirs in times.items():
+                if time not in grid._time_pos:
+                    grid._time_pos[sys.intern(time)] = len(grid.times)
+                    grid.times.append(sys.intern(time))
+                for direction in dirs:
+                    if direction not in grid._dir_pos:
+                        grid._add_direction(direction)
+        size = len(grid.dates) * len(grid.times)
+        grid._cells = [array('q', [ABSENT]) * size for _ in grid.directions]
+        grid._free = [0] * len(grid.directions)
+        width = len(grid.times)
+        present = 0
+        free = grid._free
+        for date, times in slots.items():
+            row = grid._date_pos[date] * width
+            for time, dirs in times.items():
+                cell = row + grid._time_pos[time]
+                present |= 1 << cell
+                for direction, value in dirs.items():
+                    i = grid._dir_pos[direction]
+                    code = grid._encode(i, cell, value)
+                    grid._cells[i][cell] = code
+                    if code == FREE:
+                        free[i] |= 1 << cell
+        grid._present = present
+        return grid
+
+    def to_json(self):
+        slots = {}
+        width = len(self.times)
+        for d, date in enumerate(self.dates):
+            row = {}
+            for t, time in enumerate(self.times):
+                cell = d * width + t
+                if not (self._present >> cell) & 1:
+                    continue
+                dirs = {}
+                for i, direction in enumerate(self.directions):
+                    code = self._cells[i][cell]
+                    if code != ABSENT:
+                        dirs[direction] = self._decode(i, cell, code)
+                row[time] = dirs
+            slots[date] = row
+        return slots
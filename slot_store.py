@@ -0,0 +1,445 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+
+from availability import AvailabilityIndex
+
+logger = logging.getLogger(__name__)
+
+
+class JsonFileBackend:
+    """Хранение в slots.json: файл целиком, атомарно (временный файл + rename)."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def prepare(self, store, changes):
+        # JSON-файл переписывается целиком, какие именно ячейки менялись — не важно
+        return json.dumps(store.snapshot(), ensure_ascii=False, indent=2)
+
+    def write(self, payload: str):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix='.slots-', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def close(self):
+        pass
+
+
+class Changes:
+    """Что изменилось с прошлой записи: отдельные ячейки/регистрации или всё сразу."""
+
+    def __init__(self):
+        self.full = False
+        # dict как упорядоченное множество: регистрации в базу пишутся в порядке изменений
+        self.cells = {}
+        self.registrations = {}
+
+    def __bool__(self):
+        return self.full or bool(self.cells) or bool(self.registrations)
+
+    def merge(self, other):
+        self.full = self.full or other.full
+        # other — более старая пачка: её ключи должны идти раньше
+        self.cells = {**other.cells, **self.cells}
+        self.registrations = {**other.registrations, **self.registrations}
+
+
+class SlotStore:
+    """Слоты и регистрации в памяти процесса.
+
+    Данные читаются один раз при старте, дальше все чтения идут из памяти.
+    Изменения накапливаются и сбрасываются в хранилище фоновой задачей не
+    чаще одного раза в flush_interval секунд; при остановке бота делается
+    принудительный flush. Хранилище — backend: по умолчанию slots.json
+    (JsonFileBackend), либо SQLite (slot_db.SQLiteBackend), которому
+    передаются только изменённые ячейки и регистрации.
+
+    Регистрации в памяти хранятся не списком, а двумя словарями: по слоту
+    (date, time, direction) и по user_id, так что /my и /cancel — это поиск
+    по ключу. Формат slots.json при этом прежний (список 'registrations').
+    """
+
+    def __init__(self, path: str, flush_interval: float = 1.0, backend=None):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.backend = backend or JsonFileBackend(path)
+        self._slots = None
+        # (date, time, direction) -> регистрация; порядок вставки = порядок записи
+        self._by_slot = {}
+        # user_id -> регистрация
+        self._by_user = {}
+        # пользователи, у которых в старом файле больше одной записи
+        self._multi = set()
+        # on_bookings(user_ids) — у этих пользователей могла смениться запись (индекс записей CampaignRegistry)
+        self.on_bookings = None
+        self._changes = Changes()
+        self._task = None
+        self._wakeup = None
+        # записи идут строго по очереди: иначе более старый снимок может лечь на диск поверх нового
+        self._flush_lock = asyncio.Lock()
+        # блокировки на отдельные ячейки (date, time, direction) — несвязанные слоты не ждут друг друга
+        self._locks = {}
+        # индекс свободных слотов, поддерживается при каждом изменении ячеек
+        self.availability = AvailabilityIndex()
+        # счётчики обращений к диску — пригодятся для диагностики
+        self.disk_reads = 0
+        self.disk_writes = 0
+        # конкуренция за слоты: try_book ждал чужой лок / проиграл compare-and-set
+        self.lock_waits = 0
+        self.book_conflicts = 0
+
+    # --- чтение ---
+
+    def load(self):
+        data = self.backend.load()
+        if data is not None:
+            self.disk_reads += 1
+        self._set(data or {})
+
+    def _set(self, data):
+        previous = list(self._by_user)
+        self._slots = data.get('slots', {})
+        self._by_slot = {}
+        self._by_user = {}
+        self._multi = set()
+        for reg in data.get('registrations', []):
+            self._index(reg)
+        self.availability.rebuild(self._slots)
+        self._notify(previous)
+
+    def _notify(self, user_ids):
+        if self.on_bookings is not None and user_ids:
+            self.on_bookings(user_ids)
+
+    def _index(self, reg):
+        key = (reg.get('date'), reg.get('time'), reg.get('direction'))
+        self._by_slot[key] = reg
+        # если в старом файле у пользователя несколько записей — /my и /cancel работают с первой
+        if self._by_user.setdefault(reg.get('user_id'), reg) is not reg:
+            self._multi.add(reg.get('user_id'))
+        self._notify((reg.get('user_id'),))
+
+    def _unindex(self, reg):
+        key = (reg.get('date'), reg.get('time'), reg.get('direction'))
+        self._by_slot.pop(key, None)
+        user_id = reg.get('user_id')
+        if self._by_user.get(user_id) is not reg:
+            return
+        del self._by_user[user_id]
+        if user_id in self._multi:
+            # подставляем следующую запись того же пользователя, если она есть
+            for other in self._by_slot.values():
+                if other.get('user_id') == user_id:
+                    self._by_user[user_id] = other
+                    break
+        self._notify((user_id,))
+
+    @property
+    def slots(self):
+        """Сетка слотов: slots[date][time][direction]."""
+        if self._slots is None:
+            self.load()
+        return self._slots
+
+    def registration_for(self, user_id):
+        if self._slots is None:
+            self.load()
+        return self._by_user.get(user_id)
+
+    def registration_at(self, date, time, direction):
+        if self._slots is None:
+            self.load()
+        return self._by_slot.get((date, time, direction))
+
+    def iter_registrations(self):
+        if self._slots is None:
+            self.load()
+        return iter(list(self._by_slot.values()))
+
+    def snapshot(self):
+        """Данные в формате slots.json: {'slots': ..., 'registrations': [...]}."""
+        return {'slots': self.slots, 'registrations': list(self._by_slot.values())}
+
+    # --- запись ---
+
+    def replace(self, data):
+        self._set(data)
+        self.mark_dirty()
+
+    def mark_dirty(self, cells=(), registrations=(), full=None):
+        """Отметить изменения. Без аргументов — переписать всё."""
+        if full is None:
+            full = not cells and not registrations
+        self._changes.full = self._changes.full or full
+        self._changes.cells.update(dict.fromkeys(cells))
+        for key in registrations:
+            # повторно изменённая регистрация переезжает в конец — как и в self._by_slot
+            self._changes.registrations.pop(key, None)
+            self._changes.registrations[key] = None
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _take_changes(self):
+        changes, self._changes = self._changes, Changes()
+        return changes
+
+    def _write(self, payload):
+        self.backend.write(payload)
+        self.disk_writes += 1
+
+    def flush(self):
+        """Синхронно записать накопленные изменения."""
+        if not self._changes:
+            return
+        changes = self._take_changes()
+        try:
+            self._write(self.backend.prepare(self, changes))
+        except Exception:
+            self._changes.merge(changes)
+            raise
+
+    async def flush_async(self):
+        async with self._flush_lock:
+            if not self._changes:
+                return
+            # снимок делаем в event loop, чтобы он был согласованным, а диск трогаем в отдельном потоке
+            changes = self._take_changes()
+            try:
+                payload = self.backend.prepare(self, changes)
+                await asyncio.to_thread(self._write, payload)
+            except Exception:
+                self._changes.merge(changes)
+                raise
+
+    # --- бронирование ---
+
+    def slot_lock(self, date, time, direction) -> asyncio.Lock:
+        key = (date, time, direction)
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        return lock
+
+    def get_cell(self, date, time, direction, default='blocked'):
+        """Значение ячейки: None — свободно, 'blocked' — закрыто, иначе user_id."""
+        dirs = self.slots.get(date, {}).get(time)
+        if dirs is None or direction not in dirs:
+            return default
+        return dirs[direction]
+
+    def compare_and_set(self, date, time, direction, expected, new) -> bool:
+        """Оптимистичная запись: меняет ячейку, только если в ней сейчас expected."""
+        dirs = self.slots.get(date, {}).get(time)
+        if dirs is None or direction not in dirs or dirs[direction] != expected:
+            return False
+        dirs[direction] = new
+        if new is None:
+            self.availability.mark_free(date, time, direction)
+        elif expected is None:
+            self.availability.mark_taken(date, time, direction)
+        self.mark_dirty(cells=[(date, time, direction)])
+        return True
+
+    async def try_book(self, date, time, direction, user_id, registration=None, check=None) -> bool:
+        """Занять свободный слот. False — слот занят, закрыт, не существует или у пользователя уже есть запись.
+
+        check() — дополнительное условие вызывающего (аренда листа ожидания,
+        отсечка записи); проверяется под локом слота, False — не бронировать.
+        """
+        lock = self.slot_lock(date, time, direction)
+        if lock.locked():
+            self.lock_waits += 1
+        async with lock:
+            if registration is not None and self.registration_for(user_id) is not None:
+                return False
+            if check is not None and not check():
+                return False
+            if not self.compare_and_set(date, time, direction, None, user_id):
+                self.book_conflicts += 1
+                return False
+            if registration is not None:
+                self._index(registration)
+                self.mark_dirty(registrations=[(date, time, direction)])
+            return True
+
+    async def release(self, date, time, direction, user_id) -> bool:
+        """Освободить слот пользователя и удалить его регистрацию на этот слот."""
+        async with self.slot_lock(date, time, direction):
+            freed = self.compare_and_set(date, time, direction, user_id, None)
+            reg = self._by_slot.get((date, time, direction))
+            if reg is not None and reg.get('user_id') == user_id:
+                self._unindex(reg)
+                self.mark_dirty(registrations=[(date, time, direction)])
+                return True
+            return freed
+
+    # --- синхронизация с таблицей ---
+
+    def apply_grid(self, grid, keep=None):
+        """Привести сетку к grid (None/'blocked' из таблицы), меняя только отличающиеся ячейки.
+
+        Брони сохраняются, если слот в таблице по-прежнему доступен. Если слот
+        закрыли или убрали из таблицы, бронь снимается. keep(date, time) —
+        какие слоты таблица вообще описывает: слоты, для которых он ложен
+        (прошедшие, их заберёт в архив sweeper), grid не содержит, и они
+        остаются как есть вместе с бронями. Возвращает
+        {'changed': число изменённых ячеек, 'dropped': [снятые регистрации]}.
+        """
+        current = self.slots
+        changed = 0
+        dropped = []
+        touched = []
+        visible = {}
+        preserved = {}
+        for date, times in current.items():
+            for time in times:
+                if keep is None or keep(date, time):
+                    visible.setdefault(date, []).append(time)
+                else:
+                    preserved.setdefault(date, {})[time] = times[time]
+        structure_changed = list(visible) != list(grid) or any(
+            visible[d] != list(times) for d, times in grid.items() if d in visible
+        )
+        # удалённые из таблицы даты и времена
+        for date, times in current.items():
+            for time, dirs in times.items():
+                if (date in grid and time in grid[date]) or time in preserved.get(date, ()):
+                    continue
+                for direction, value in dirs.items():
+                    reg = self._by_slot.get((date, time, direction))
+                    if reg is not None:
+                        self._unindex(reg)
+                        dropped.append(reg)
+                changed += len(dirs)
+        # изменённые и новые ячейки
+        for date, times in grid.items():
+            for time, dirs in times.items():
+                old_dirs = current.get(date, {}).get(time)
+                if old_dirs is None:
+                    changed += len(dirs)
+                    continue
+                for direction, wanted in dirs.items():
+                    value = old_dirs.get(direction)
+                    if value == wanted or (wanted is None and value not in (None, 'blocked')):
+                        # ячейка не изменилась или слот всё ещё доступен и занят кандидатом
+                        continue
+                    reg = self._by_slot.get((date, time, direction))
+                    if reg is not None:
+                        self._unindex(reg)
+                        dropped.append(reg)
+                    old_dirs[direction] = wanted
+                    touched.append((date, time, direction))
+                    changed += 1
+                    if not structure_changed:
+                        if wanted is None:
+                            self.availability.mark_free(date, time, direction)
+                        else:
+                            self.availability.mark_taken(date, time, direction)
+        if structure_changed:
+            # новые/удалённые даты или времена: собираем сетку в порядке таблицы, сохраняя брони
+            # слоты вне keep (прошедшие) раньше актуальных — ставим их первыми
+            merged = {date: dict(times) for date, times in preserved.items() if date not in grid}
+            for date, times in grid.items():
+                merged[date] = dict(preserved.get(date, {}))
+                for time, dirs in times.items():
+                    old_dirs = current.get(date, {}).get(time)
+                    merged[date][time] = dict(old_dirs) if old_dirs is not None else dict(dirs)
+                    for direction in dirs:
+                        merged[date][time].setdefault(direction, dirs[direction])
+            self._slots = merged
+            self.availability.rebuild(merged)
+        if structure_changed:
+            self.mark_dirty()
+        elif changed:
+            self.mark_dirty(cells=touched, registrations=[
+                (r.get('date'), r.get('time'), r.get('direction')) for r in dropped
+            ])
+        return {'changed': changed, 'dropped': dropped}
+
+    def expired(self, before):
+        """Слоты [(date, time)], которые начались раньше before (по возрастанию времени)."""
+        if self._slots is None:
+            self.load()
+        return self.availability.started_before(before)
+
+    def retire(self, keys):
+        """Убрать слоты keys из сетки вместе с их регистрациями.
+
+        Возвращает убранное: [{'date', 'time', 'dirs', 'registrations'}] — для архива.
+        """
+        grid = self.slots
+        retired = []
+        for date, time in keys:
+            times = grid.get(date)
+            if times is None or time not in times:
+                continue
+            dirs = times.pop(time)
+            if not times:
+                del grid[date]
+            regs = []
+            for direction in dirs:
+                reg = self._by_slot.get((date, time, direction))
+                if reg is not None:
+                    self._unindex(reg)
+                    regs.append(reg)
+            retired.append({'date': date, 'time': time, 'dirs': dirs, 'registrations': regs})
+        if retired:
+            self.availability.rebuild(grid)
+            self.mark_dirty()
+        return retired
+
+
+    # --- фоновая задача ---
+
+    async def _flush_loop(self):
+        while True:
+            await self._wakeup.wait()
+            # копим изменения за интервал и пишем их одним файлом
+            await asyncio.sleep(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                await self.flush_async()
+            except Exception:
+                logger.exception('Не удалось сохранить %s', self.path)
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        if self._changes:
+            self._wakeup.set()
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        # дожидаемся записи, которая уже идёт в потоке, и только потом останавливаем цикл
+        async with self._flush_lock:
+            if self._task is not None:
+                self._task.cancel()
+                try:
+                    await self._task
+                except asyncio.CancelledError:
+                    pass
+                self._task = None
+                self._wakeup = None
+            self.flush()
+        self.backend.close()
@@ -0,0 +1,113 @@
+"""Профиль холодного старта бота: python main.py --profile-startup
+
+Импортирует main.py так же, как при обычном запуске, но с таймером на
+каждом импортируемом модуле, потом выполняет прогрев (main.prewarm) и
+печатает, сколько заняли импорт каждого компонента, собственный код
+main.py (Bot, Dispatcher, роутер, хранилища) и каждый шаг прогрева. Бот при
+этом не запускается и в Telegram не ходит.
+
+Время импорта компонента — включительно со всем, что он подтянул; модули,
+которые уже были загружены раньше (стандартная библиотека самого профайлера),
+не считаются.
+"""
+import asyncio
+import importlib
+import importlib.abc
+import sys
+import time
+
+# модули, которые на старте грузиться не должны (нужны только для админских команд)
+LAZY = ('gspread', 'google', 'openpyxl')
+
+
+class _ImportTimer(importlib.abc.MetaPathFinder):
+    """Оборачивает exec_module найденных модулей: время выполнения и кто кого импортировал."""
+
+    def __init__(self):
+        self.stack = []
+        # модуль -> (родитель, включительное время)
+        self.records = {}
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        loader = spec.loader
+        if loader is None or not hasattr(loader, 'exec_module') or getattr(loader, '_timed', False):
+            return spec
+        spec.loader = _TimedLoader(self, loader)
+        return spec
+
+
+class _TimedLoader(importlib.abc.Loader):
+    _timed = True
+
+    def __init__(self, timer, loader):
+        self.timer = timer
+        self.loader = loader
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        name = module.__name__
+        parent = self.timer.stack[-1] if self.timer.stack else None
+        self.timer.stack.append(name)
+        started = time.perf_counter()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            self.timer.stack.pop()
+            self.timer.records[name] = (parent, time.perf_counter() - started)
+
+    def __getattr__(self, item):
+        return getattr(self.loader, item)
+
+
+def _ms(seconds):
+    return f'{seconds * 1000:9.1f} мс'
+
+
+def profile(module='main'):
+    timer = _ImportTimer()
+    sys.meta_path.insert(0, timer)
+    started = time.perf_counter()
+    try:
+        bot_module = importlib.import_module(module)
+    finally:
+        sys.meta_path.remove(timer)
+    imported = time.perf_counter() - started
+
+    children = sorted(
+        ((name, seconds) for name, (parent, seconds) in timer.records.items() if parent == module),
+        key=lambda item: item[1], reverse=True,
+    )
+    own = imported - sum(seconds for _, seconds in children)
+    print(f'Импорт {module}: {_ms(imported)}')
+    for name, seconds in children:
+        print(f'  {name:<28}{_ms(seconds)}')
+    print(f'  {module + " (свой код)":<28}{_ms(own)}')
+    lazy = sorted({name.split('.')[0] for name in sys.modules if name.split('.')[0] in LAZY})
+    print(f'  отложенные модули загружены: {", ".join(lazy) if lazy else "нет"}')
+
+    timings = {}
+    started = time.perf_counter()
+    bot_module.prewarm(timings)
+    warmed = time.perf_counter() - started
+    print(f'Прогрев: {_ms(warmed)}')
+    for step, seconds in timings.items():
+        print(f'  {step:<28}{_ms(seconds)}')
+    print(f'Итого до первого апдейта: {_ms(imported + warmed)}')
+
+    async def close():
+        await bot_module.storage.close()
+        await bot_module.campaigns.close()
+        await bot_module.bot.session.close()
+
+    asyncio.run(close())
+    return 0
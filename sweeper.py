@@ -0,0 +1,154 @@
+"""Фоновый sweeper слотов: окна записи/отмены и архив прошедших слотов.
+
+Два дела, оба — в фоне, а не в хендлерах:
+
+* к моменту, когда слот пересекает отсечку записи (BOOKING_CUTOFF) или
+  отмены (CANCEL_CUTOFF), он переводится в «закрыт для записи» / «закрыт
+  для отмены» (AvailabilityIndex.advance). Проход планируется ровно на
+  ближайшую такую отсечку (next_transition), так что хендлеры проверяют
+  окно поиском по множеству, без разбора даты на каждый запрос;
+* слоты, начавшиеся больше retire_after назад, вместе с их регистрациями
+  дописываются в архив кампании (JSON Lines, строка на слот) и убираются из
+  сетки в памяти — клавиатуры, выгрузки и diff с таблицей не тащат за собой
+  прошлые даты.
+
+Если у направления из-за этого не осталось времени, доступного для записи,
+вызывается on_flip — например, чтобы перерисовать опубликованное меню.
+"""
+import asyncio
+import datetime
+import json
+import logging
+import os
+
+from availability import parse_slot_datetime
+
+logger = logging.getLogger(__name__)
+
+
+class ExpirySweeper:
+    """Обходит открытые шарды слотов: закрывает окна по отсечкам и архивирует прошедшие слоты.
+
+    shards() -> {campaign_id: SlotStore} — какие шарды обходить;
+    archive_path(campaign_id) — куда дописывать архив кампании;
+    on_flip(campaign_id, directions) — у направлений закончилось доступное для записи время;
+    on_retire(campaign_id, retired) — слоты ушли в архив (retired — как у SlotStore.retire).
+    """
+
+    def __init__(self, shards, archive_path, retire_after=datetime.timedelta(hours=2), interval=300.0,
+                 on_flip=None, on_retire=None):
+        self.shards = shards
+        self.archive_path = archive_path
+        self.retire_after = retire_after
+        self.interval = interval
+        self.on_flip = on_flip
+        self.on_retire = on_retire
+        self._task = None
+        self._wakeup = None
+        # campaign_id -> слоты, убранные из памяти, но ещё не записанные в архив (запись упала)
+        self._unarchived = {}
+        # счётчики для диагностики
+        self.sweeps = 0
+        self.closed = 0
+        self.retired = 0
+        self.archived_registrations = 0
+
+    def is_current(self, date, time, now=None):
+        """Слот ещё не ушёл в архив: начинается не раньше, чем retire_after назад (или дата не разобрана)."""
+        try:
+            dt = parse_slot_datetime(date, time)
+        except (ValueError, AttributeError):
+            return True
+        return dt >= (now or datetime.datetime.now()) - self.retire_after
+
+    def _archive(self, path, retired, now):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        archived_at = now.isoformat(timespec='seconds')
+        with open(path, 'a', encoding='utf-8') as f:
+            for item in retired:
+                f.write(json.dumps({'archived_at': archived_at, **item}, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def sweep(self, now=None):
+        """Один проход по всем открытым шардам. Возвращает {campaign_id: {'closed': n, 'retired': n}}."""
+        now = now or datetime.datetime.now()
+        self.sweeps += 1
+        report = {}
+        for cid, store in self.shards().items():
+            index = store.availability
+            had = {d for d in index.directions() if index.has_free(d)}
+            closed = index.advance(now)
+            retired = store.retire(store.expired(now - self.retire_after))
+            self.closed += len(closed)
+            if retired:
+                self.retired += len(retired)
+                self.archived_registrations += sum(len(item['registrations']) for item in retired)
+                if self.on_retire is not None:
+                    self.on_retire(cid, retired)
+            pending = self._unarchived.pop(cid, []) + retired
+            if pending:
+                try:
+                    await asyncio.to_thread(self._archive, self.archive_path(cid), pending, now)
+                except Exception:
+                    # из памяти слоты уже убраны — держим их до следующего прохода, чтобы не потерять
+                    self._unarchived[cid] = pending
+                    logger.exception('Не удалось дописать архив слотов кампании %s', cid)
+            flipped = sorted(had - {d for d in index.directions() if index.has_free(d)})
+            if flipped and self.on_flip is not None:
+                await self.on_flip(cid, flipped)
+            report[cid] = {'closed': len(closed), 'retired': len(retired)}
+        return report
+
+    def next_delay(self, now=None):
+        """Сколько секунд спать до следующего прохода: до ближайшей отсечки, но не дольше interval."""
+        now = now or datetime.datetime.now()
+        delay = self.interval
+        for store in self.shards().values():
+            moment = store.availability.next_transition()
+            if moment is not None:
+                delay = min(delay, (moment - now).total_seconds())
+        return max(delay, 0.0)
+
+    def wake(self):
+        """Пересчитать расписание (например, сетка изменилась и появились более близкие отсечки)."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _loop(self):
+        while True:
+            # не wait_for: в 3.11 он теряет отмену, если событие выставлено в тот же момент, и close() повис бы
+            waiter = asyncio.ensure_future(self._wakeup.wait())
+            try:
+                await asyncio.wait([waiter], timeout=self.next_delay())
+            finally:
+                waiter.cancel()
+            self._wakeup.clear()
+            try:
+                await self.sweep()
+            except Exception:
+                logger.exception('Проход sweeper не удался')
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._wakeup = None
+        for cid, pending in list(self._unarchived.items()):
+            try:
+                await asyncio.to_thread(self._archive, self.archive_path(cid), pending, datetime.datetime.now())
+                del self._unarchived[cid]
+            except Exception:
+                logger.exception('Не удалось дописать архив слотов кампании %s', cid)
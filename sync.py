@@ -0,0 +1,122 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+
+import sheets
+
+logger = logging.getLogger(__name__)
+
+
+class SyncError(Exception):
+    pass
+
+
+class SheetsSync:
+    """Синхронизация слотов с Google Sheets.
+
+    Сначала дешёвая проверка: хэш прочитанных листов сравнивается с хэшем
+    прошлой синхронизации, и если таблица не менялась — на этом всё. Иначе
+    новая сетка применяется к store как минимальный diff (store.apply_grid).
+    on_change(result) вызывается после каждой синхронизации, которая что-то
+    изменила; result['flipped'] — направления, у которых поменялось
+    «есть свободные слоты / нет», result['grid'] — применённая сетка.
+
+    keep(date, time) -> bool отбирает слоты таблицы, которые попадут в store:
+    прошедшие слоты, уже убранные в архив (sweeper.py), из таблицы обычно
+    никто не удаляет, и без фильтра они возвращались бы при каждом опросе.
+    """
+
+    def __init__(self, store, directions, sheet_id, interval=0, on_change=None, titles=None, keep=None):
+        self.store = store
+        self.directions = directions
+        self.sheet_id = sheet_id
+        # направление -> название листа, если лист называется иначе, чем направление
+        self.titles = {d: (titles or {}).get(d, d) for d in directions}
+        self.interval = interval
+        self.on_change = on_change
+        self.keep = keep
+        self._last_hash = None
+        self._task = None
+        # /get_slots и фоновый опрос не должны применять diff одновременно
+        self._lock = asyncio.Lock()
+
+    async def run_once(self, force=False):
+        """Одна синхронизация. force — применить сетку, даже если хэш не изменился."""
+        async with self._lock:
+            client = sheets.get_client()
+            timings = {}
+            started = time.perf_counter()
+            await asyncio.to_thread(client.spreadsheet, self.sheet_id)
+            timings['auth'] = time.perf_counter() - started
+
+            started = time.perf_counter()
+            grids = await asyncio.to_thread(client.fetch_direction_grids, self.sheet_id, list(self.titles.values()))
+            timings['fetch'] = time.perf_counter() - started
+            if not grids['values']:
+                raise SyncError(f'Не найдено листов с названиями направлений. Ожидаемые имена: {list(self.titles.values())}')
+            by_title = {title: d for d, title in self.titles.items()}
+            grids['values'] = {by_title[title]: rows for title, rows in grids['values'].items()}
+
+            digest = hashlib.sha256(
+                json.dumps(grids, ensure_ascii=False, sort_keys=True).encode('utf-8')
+            ).hexdigest()
+            result = {
+                'skipped': digest == self._last_hash and not force,
+                'changed': 0,
+                'dropped': [],
+                'flipped': {},
+                'report': [],
+                'timings': timings,
+            }
+            if result['skipped']:
+                return result
+
+            started = time.perf_counter()
+            grid = sheets.build_grid(grids, self.directions)
+            if self.keep is not None:
+                kept = {}
+                for date, times in grid.items():
+                    times = {time: dirs for time, dirs in times.items() if self.keep(date, time)}
+                    if times:
+                        kept[date] = times
+                grid = kept
+            result['report'] = sheets.grid_report(grids)
+            timings['parse'] = time.perf_counter() - started
+
+            started = time.perf_counter()
+            before = {d: self.store.availability.has_free(d) for d in self.directions}
+            # отфильтрованные keep слоты apply_grid не трогает: их брони уходят в архив через sweeper
+            result.update(self.store.apply_grid(grid, keep=self.keep))
+            result['grid'] = grid
+            after = {d: self.store.availability.has_free(d) for d in self.directions}
+            result['flipped'] = {d: after[d] for d in self.directions if before[d] != after[d]}
+            await self.store.flush_async()
+            timings['save'] = time.perf_counter() - started
+            self._last_hash = digest
+
+        if self.on_change is not None and (result['changed'] or result['dropped']):
+            await self.on_change(result)
+        return result
+
+    async def _poll_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception('Фоновая синхронизация с Google Sheets не удалась')
+
+    def start(self):
+        if self._task is None and self.interval > 0 and self.sheet_id:
+            self._task = asyncio.create_task(self._poll_loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,154 @@
+"""Ограничение частоты и склейка повторов во входящих апдейтах кандидатов.
+
+Кандидаты дважды жмут inline-кнопки направлений и повторно шлют дату;
+каждый повтор — полный проход хендлера (слоты, клавиатура, ответы Bot API).
+ThrottleMiddleware стоит внешним middleware на dp.message и
+dp.callback_query, то есть до фильтров и хендлеров, и отсекает такие апдейты
+дёшево:
+
+* повтор — тот же пользователь и та же нагрузка (текст сообщения или
+  callback_data). Если исходный апдейт ещё обрабатывается, повтор
+  склеивается с ним (coalesced); если он пришёл в пределах window секунд
+  после исходного — отбрасывается (duplicates). Недавние пары
+  (пользователь, нагрузка) хранятся в LRU ограниченного размера;
+* частота — token bucket на пользователя (rate апдейтов в секунду, не больше
+  burst подряд). Сверх лимита апдейт отбрасывается (throttled), а
+  пользователь получает заранее заготовленное «подождите» — не чаще раза в
+  warn_interval секунд, чтобы ответ на флуд сам не стал флудом.
+
+На отброшенный callback бот всё равно отвечает (answer_callback_query), иначе
+у кандидата крутится индикатор загрузки. Хендлеры видят только отличающиеся
+апдейты; счётчики отброшенных отдаются в метрики.
+"""
+import logging
+import time
+from collections import OrderedDict
+
+from aiogram import BaseMiddleware
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import CallbackQuery
+
+from notify import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+WAIT_TEXT = 'Подождите немного: бот ещё обрабатывает ваши предыдущие сообщения.'
+
+
+def _payload(event):
+    if isinstance(event, CallbackQuery):
+        return ('callback', event.data)
+    # у сообщений без текста (фото, стикеры) склеивать нечего — только лимит частоты
+    text = getattr(event, 'text', None)
+    return ('message', text) if text is not None else None
+
+
+class ThrottleMiddleware(BaseMiddleware):
+    """Внешний middleware: повторы и флуд отсекаются до фильтров и хендлеров.
+
+    rate=0 — без лимита частоты, window=0 — без склейки повторов; exempt —
+    id пользователей без ограничений (админ).
+    """
+
+    def __init__(self, rate=2.0, burst=10, window=2.0, warn_interval=10.0, max_users=10000, exempt=()):
+        self.rate = rate
+        self.burst = burst
+        self.window = window
+        self.warn_interval = warn_interval
+        self.max_users = max_users
+        self.exempt = frozenset(exempt)
+        # user_id -> TokenBucket; давно молчавшие вытесняются (их ведро всё равно полное)
+        self._buckets = OrderedDict()
+        # (user_id, payload) -> время последнего такого апдейта, от старых к новым
+        self._recent = OrderedDict()
+        # (user_id, payload) апдейтов, которые сейчас в хендлере
+        self._inflight = set()
+        # user_id -> когда последний раз ответили «подождите»
+        self._warned = OrderedDict()
+        # счётчики для диагностики
+        self.duplicates = 0
+        self.coalesced = 0
+        self.throttled = 0
+
+    @property
+    def absorbed(self):
+        return self.duplicates + self.coalesced + self.throttled
+
+    # --- состояние ---
+
+    def _bucket(self, user_id):
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = TokenBucket(self.rate, self.burst)
+            if len(self._buckets) > self.max_users:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(user_id)
+        return bucket
+
+    def _remember(self, key, now):
+        self._recent[key] = now
+        self._recent.move_to_end(key)
+        while self._recent:
+            oldest_key, seen = next(iter(self._recent.items()))
+            if now - seen < self.window and len(self._recent) <= self.max_users:
+                break
+            del self._recent[oldest_key]
+
+    def _should_warn(self, user_id, now):
+        warned = self._warned.get(user_id)
+        if warned is not None and now - warned < self.warn_interval:
+            return False
+        self._warned[user_id] = now
+        self._warned.move_to_end(user_id)
+        while self._warned:
+            oldest_user, warned = next(iter(self._warned.items()))
+            if now - warned < self.warn_interval and len(self._warned) <= self.max_users:
+                break
+            del self._warned[oldest_user]
+        return True
+
+    # --- middleware ---
+
+    async def _absorb(self, event, data, text=None):
+        bot = data['bot']
+        try:
+            if isinstance(event, CallbackQuery):
+                await bot.answer_callback_query(event.id, text)
+            elif text is not None:
+                await bot.send_message(event.chat.id, text)
+        except TelegramAPIError:
+            logger.debug('Не удалось ответить на отброшенный апдейт', exc_info=True)
+
+    async def __call__(self, handler, event, data):
+        user = getattr(event, 'from_user', None)
+        if user is None or user.id in self.exempt:
+            return await handler(event, data)
+        now = time.monotonic()
+        key = None
+        payload = _payload(event) if self.window > 0 else None
+        if payload is not None:
+            key = (user.id, payload)
+            if key in self._inflight:
+                self.coalesced += 1
+                await self._absorb(event, data)
+                return None
+            seen = self._recent.get(key)
+            if seen is not None and now - seen < self.window:
+                self.duplicates += 1
+                await self._absorb(event, data)
+                return None
+        if self.rate > 0 and not self._bucket(user.id).try_acquire():
+            self.throttled += 1
+            await self._absorb(event, data, WAIT_TEXT if self._should_warn(user.id, now) else None)
+            return None
+        if key is None:
+            return await handler(event, data)
+        self._remember(key, now)
+        self._inflight.add(key)
+        try:
+            return await handler(event, data)
+        finally:
+            self._inflight.discard(key)
+            # окно повторов отсчитывается и от конца обработки: медленный хендлер не открывает его раньше времени
+            self._remember(key, time.monotonic())
@@ -0,0 +1,184 @@
+"""Лист ожидания: освободившийся слот сразу предлагается следующему в очереди.
+
+Очереди FIFO ключуются (кампания, направление, дата) — кандидат ждёт
+конкретную дату — и (кампания, направление, None) — подойдёт любая дата.
+Когда слот освобождается (release), смотрятся только очереди этого
+направления: сначала ждущие именно эту дату, потом любую, так что работа
+пропорциональна ждущим этого слота, а не всем пользователям.
+
+Первому подходящему выдаётся аренда (Lease): слот держится за ним hold
+секунд, остальным он не предлагается и не бронируется. Аренда истекает
+сама (loop.call_later) — тогда вызывается on_lapse, и слот можно предложить
+следующему. Кандидат, который не успел или отказался, из очереди выбывает.
+Неподходящий кандидат (eligible вернул False — например, он уже записался
+сам) тоже выбывает, и об этом сообщается через on_skip.
+
+Очереди живут в памяти процесса: после перезапуска кандидату нужно встать
+в лист ожидания заново.
+"""
+import asyncio
+import itertools
+import logging
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class Lease:
+    __slots__ = ('token', 'campaign_id', 'date', 'time', 'direction', 'user_id', 'entry', 'expires_at', '_handle')
+
+    def __init__(self, token, campaign_id, date, time_slot, direction, user_id, entry, expires_at):
+        self.token = token
+        self.campaign_id = campaign_id
+        self.date = date
+        self.time = time_slot
+        self.direction = direction
+        self.user_id = user_id
+        self.entry = entry
+        self.expires_at = expires_at
+        self._handle = None
+
+    @property
+    def slot(self):
+        return (self.campaign_id, self.date, self.time, self.direction)
+
+
+class Waitlist:
+    """Очереди ожидания по направлениям (и датам) и аренды предложенных слотов.
+
+    on_lapse(lease) — async: аренда истекла или кандидат отказался, слот снова свободен.
+    on_skip(key, user_id, entry) — кандидат выбыл из очереди key как неподходящий (release).
+    """
+
+    def __init__(self, hold=300.0, on_lapse=None, on_skip=None):
+        self.hold = hold
+        self.on_lapse = on_lapse
+        self.on_skip = on_skip
+        # (campaign_id, direction, date | None) -> OrderedDict{user_id: entry}
+        self._queues = {}
+        # user_id -> ключ очереди, в которой он стоит
+        self._by_user = {}
+        # token -> Lease; (campaign_id, date, time, direction) -> token
+        self._leases = {}
+        self._held = {}
+        self._tokens = itertools.count(1)
+        # счётчики для диагностики
+        self.joined = 0
+        self.offered = 0
+        self.accepted = 0
+        self.lapsed = 0
+        self.skipped = 0
+
+    # --- очередь ---
+
+    def join(self, campaign_id, direction, date, user_id, entry):
+        """Встать в очередь (повторный join переставляет в новую очередь). Возвращает место в ней, с 1."""
+        self.leave(user_id)
+        key = (campaign_id, direction, date)
+        queue = self._queues.setdefault(key, OrderedDict())
+        queue[user_id] = entry
+        self._by_user[user_id] = key
+        self.joined += 1
+        return len(queue)
+
+    def leave(self, user_id):
+        key = self._by_user.pop(user_id, None)
+        if key is None:
+            return False
+        queue = self._queues[key]
+        del queue[user_id]
+        if not queue:
+            del self._queues[key]
+        return True
+
+    def waiting(self, user_id):
+        """(campaign_id, direction, date | None), если пользователь в очереди, иначе None."""
+        return self._by_user.get(user_id)
+
+    def size(self):
+        return len(self._by_user)
+
+    # --- аренды ---
+
+    def holder(self, campaign_id, date, time_slot, direction):
+        """Кому сейчас предложен слот (None — никому)."""
+        token = self._held.get((campaign_id, date, time_slot, direction))
+        return self._leases[token].user_id if token is not None else None
+
+    def lease(self, token):
+        return self._leases.get(token)
+
+    def release(self, campaign_id, date, time_slot, direction, eligible=lambda user_id: True):
+        """Слот освободился: выдать аренду первому подходящему из очереди. Возвращает Lease или None."""
+        if (campaign_id, date, time_slot, direction) in self._held:
+            return None
+        for key in ((campaign_id, direction, date), (campaign_id, direction, None)):
+            queue = self._queues.get(key)
+            while queue:
+                user_id, entry = queue.popitem(last=False)
+                del self._by_user[user_id]
+                if not queue:
+                    del self._queues[key]
+                if eligible(user_id):
+                    return self._grant(campaign_id, date, time_slot, direction, user_id, entry)
+                self.skipped += 1
+                if self.on_skip is not None:
+                    self.on_skip(key, user_id, entry)
+        return None
+
+    def _grant(self, campaign_id, date, time_slot, direction, user_id, entry):
+        token = next(self._tokens)
+        lease = Lease(token, campaign_id, date, time_slot, direction, user_id, entry, time.monotonic() + self.hold)
+        self._leases[token] = lease
+        self._held[lease.slot] = token
+        lease._handle = asyncio.get_running_loop().call_later(self.hold, self._expire, token)
+        self.offered += 1
+        return lease
+
+    def _drop(self, token):
+        lease = self._leases.pop(token, None)
+        if lease is None:
+            return None
+        self._held.pop(lease.slot, None)
+        if lease._handle is not None:
+            lease._handle.cancel()
+        return lease
+
+    def accept(self, token, user_id):
+        """Кандидат жмёт «Записаться»: снять аренду, если она его и ещё жива. Возвращает Lease или None."""
+        lease = self._leases.get(token)
+        if lease is None or lease.user_id != user_id:
+            return None
+        self.accepted += 1
+        return self._drop(token)
+
+    async def decline(self, token, user_id):
+        lease = self._leases.get(token)
+        if lease is None or lease.user_id != user_id:
+            return False
+        await self._lapse(token)
+        return True
+
+    def _expire(self, token):
+        asyncio.create_task(self._lapse(token))
+
+    async def _lapse(self, token):
+        lease = self._drop(token)
+        if lease is None:
+            return
+        self.lapsed += 1
+        if self.on_lapse is not None:
+            try:
+                await self.on_lapse(lease)
+            except Exception:
+                logger.exception('Не удалось передать слот %s следующему в листе ожидания', lease.slot)
+
+    async def return_slot(self, lease):
+        """Вернуть слот, принятый через accept(), если записать кандидата не вышло."""
+        if self.on_lapse is not None:
+            await self.on_lapse(lease)
+
+    def close(self):
+        for token in list(self._leases):
+            self._drop(token)
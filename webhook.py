@@ -0,0 +1,109 @@
+"""Запуск бота через webhook на aiohttp (альтернатива long polling).
+
+Telegram сам присылает апдейты POST-запросами на WEBHOOK_URL + WEBHOOK_PATH;
+ответ уходит сразу, а апдейт обрабатывается в фоне. Одновременно
+обрабатывается не больше max_concurrency апдейтов: следующие запросы ждут
+свободного места, не отвечая Telegram, — так нагрузка не растёт без предела,
+а Telegram сам придерживает доставку.
+
+При остановке (SIGINT/SIGTERM) сервер перестаёт принимать запросы, дожидается
+уже принятых апдейтов, затем выполняет dp.shutdown (сброс слотов, журнала,
+FSM, очереди уведомлений) и только потом закрывает сессию бота.
+"""
+import asyncio
+import logging
+
+from aiohttp import web
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """SimpleRequestHandler с ограничением числа апдейтов в обработке."""
+
+    def __init__(self, dispatcher, bot, max_concurrency=64, drain_timeout=30.0, **kwargs):
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True, **kwargs)
+        self.max_concurrency = max_concurrency
+        self.drain_timeout = drain_timeout
+        self._slots = asyncio.Semaphore(max_concurrency)
+        # счётчики для диагностики
+        self.accepted = 0
+        self.failed = 0
+
+    async def _feed(self, bot, update):
+        try:
+            await self._background_feed_update(bot=bot, update=update)
+        except Exception:
+            self.failed += 1
+            logger.exception('Ошибка обработки апдейта %s', update.get('update_id'))
+        finally:
+            self._slots.release()
+
+    async def _handle_request_background(self, bot, request):
+        update = await request.json(loads=bot.session.json_loads)
+        await self._slots.acquire()
+        self.accepted += 1
+        task = asyncio.create_task(self._feed(bot, update))
+        self._background_feed_update_tasks.add(task)
+        task.add_done_callback(self._background_feed_update_tasks.discard)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    def in_flight(self):
+        return len(self._background_feed_update_tasks)
+
+    async def drain(self):
+        """Дождаться апдейтов, которые уже приняты; по таймауту — отменить оставшиеся."""
+        tasks = set(self._background_feed_update_tasks)
+        if not tasks:
+            return
+        logger.info('Ожидание %d апдейтов в обработке', len(tasks))
+        _, pending = await asyncio.wait(tasks, timeout=self.drain_timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning('Не дождались %d апдейтов за %.0f с', len(pending), self.drain_timeout)
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def close(self):
+        # сессию бота закрывает on_cleanup: dp.shutdown ещё отправляет уведомления
+        await self.drain()
+
+
+def build_app(dispatcher, bot, path='/webhook', secret_token=None, max_concurrency=64,
+              webhook_url=None, drain_timeout=30.0):
+    """Собрать aiohttp-приложение с обработчиком webhook.
+
+    Если задан webhook_url (публичный адрес, например https://bot.example.org),
+    на старте вызывается setWebhook на webhook_url + path.
+    """
+    app = web.Application()
+    handler = BoundedRequestHandler(
+        dispatcher, bot,
+        max_concurrency=max_concurrency,
+        drain_timeout=drain_timeout,
+        secret_token=secret_token,
+    )
+    # порядок on_shutdown: сначала дождаться апдейтов (handler), потом dp.shutdown
+    handler.register(app, path=path)
+    setup_application(app, dispatcher, bot=bot)
+    app['webhook_handler'] = handler
+
+    if webhook_url:
+        async def set_webhook(_app):
+            await bot.set_webhook(
+                webhook_url.rstrip('/') + path,
+                secret_token=secret_token,
+                allowed_updates=dispatcher.resolve_used_update_types(),
+                max_connections=min(max_concurrency, 100),
+            )
+        app.on_startup.append(set_webhook)
+
+    async def close_session(_app):
+        await bot.session.close()
+    app.on_cleanup.append(close_session)
+    return app
+
+
+def run_webhook(dispatcher, bot, host='0.0.0.0', port=8080, **kwargs):
+    web.run_app(build_app(dispatcher, bot, **kwargs), host=host, port=port)